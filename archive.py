@@ -0,0 +1,330 @@
+import argparse
+from datetime import datetime, timedelta
+from pymongo import MongoClient, ReplaceOne, ReturnDocument, collation, ASCENDING, DESCENDING, TEXT
+from search_engine import NGramSearchEngine, GRAMS_COLLECTION
+from text_fields import BODY_TEXT_FIELD, LISTING_PROJECTION
+from views import VIEWS_COLLECTION
+from vote_buckets import VoteBucketStore, BUCKETS_COLLECTION, FLAT_VOTES_PIPELINE, BUCKETED_LAYOUT, get_vote_layout
+
+DB_NAME = '291db'
+QUESTION_TYPE_ID = '1'
+ANSWER_TYPE_ID = '2'
+ARCHIVED_POSTS_COLLECTION = 'ArchivedPosts'
+ARCHIVED_VOTES_COLLECTION = 'ArchivedVotes'
+# questions (and their answers) with no activity for this many days are archived
+DEFAULT_MAX_AGE_DAYS = 365
+# number of questions whose threads are moved per batch
+ARCHIVE_BATCH_SIZE = 500
+# collation of the archive Id indexes (queries on Id must specify it in order to use them)
+ID_COLLATION = collation.Collation('en_US', numericOrdering=True)
+
+
+def get_cutoff_date(max_age_days):
+    """
+    :param max_age_days: number of days without activity after which a question is archived
+    :return: string corresponding to the date (in the same format as LastActivityDate) before which a question is
+             considered inactive
+    """
+    return (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%dT%H:%M:%S.000')
+
+
+class PostArchive:
+    """
+    Class that maintains the cold storage tier. Questions with no activity for a configurable number of days are moved,
+    together with their answers and the votes on all of them, from the Posts and Votes collections (or the vote buckets)
+    into the ArchivedPosts and ArchivedVotes collections so that the indexes of the hot collections only cover posts
+    that are still being read. Archived votes are always stored flat. A thread is restored to the hot tier as soon as
+    it gets new activity (an answer or a vote).
+    """
+
+    def __init__(self, db):
+        """
+        Initializes an instance of this class.
+        :param db: pymongo database
+        """
+        self.db = db
+        self.posts, self.votes = db['Posts'], db['Votes']
+        self.archived_posts = db[ARCHIVED_POSTS_COLLECTION]
+        self.archived_votes = db[ARCHIVED_VOTES_COLLECTION]
+        self.hot_views = db[VIEWS_COLLECTION]
+        self.search_engine = NGramSearchEngine(self.posts, db[GRAMS_COLLECTION])
+        self.archive_search_index = 'archive_search_index'
+        self.archive_Id_index = 'archive_Id_index'
+        self.archive_answers_index = 'archive_answers_index'
+        self.archive_owner_index = 'archive_owner_index'
+        self.archive_vote_Id_index = 'archive_vote_Id_index'
+        self.archive_vote_postid_userid_index = 'archive_vote_postid_userid_index'
+        self.archive_vote_userid_index = 'archive_vote_userid_index'
+        # index of the questions by (LastActivityDate, _id) that archive() pages through
+        self.activity_index = 'archive_activity_index'
+
+    def create_indexes(self):
+        """
+        Creates the indexes of the archive collections and the activity index of the Posts collection that archive()
+        walks. The archive has its own $text index (which only finds whole word matches) so that the n-gram index only
+        has to cover the hot tier.
+        """
+        self.posts.create_index(
+            [('PostTypeId', ASCENDING), ('LastActivityDate', ASCENDING), ('_id', ASCENDING)],
+            name=self.activity_index
+        )
+        self.archived_posts.create_index(
+            [('Tags', TEXT), ('Title', TEXT), (BODY_TEXT_FIELD, TEXT)],
+            default_language='none',
+            name=self.archive_search_index
+        )
+        self.archived_posts.create_index([('Id', ASCENDING)], collation=ID_COLLATION, name=self.archive_Id_index)
+        self.archived_posts.create_index(
+            [('PostTypeId', ASCENDING), ('ParentId', ASCENDING)],
+            name=self.archive_answers_index
+        )
+        self.archived_posts.create_index(
+            [('PostTypeId', ASCENDING), ('OwnerUserId', ASCENDING)],
+            name=self.archive_owner_index
+        )
+        self.archived_votes.create_index([('Id', ASCENDING)], collation=ID_COLLATION, name=self.archive_vote_Id_index)
+        self.archived_votes.create_index(
+            [('PostId', ASCENDING), ('UserId', ASCENDING)],
+            name=self.archive_vote_postid_userid_index
+        )
+        self.archived_votes.create_index([('UserId', ASCENDING)], name=self.archive_vote_userid_index)
+
+    def exists(self):
+        """
+        :return: True if any posts have been archived, False otherwise
+        """
+        return self.archived_posts.find_one({}, {'_id': 1}) is not None
+
+    def _is_bucketed(self):
+        return get_vote_layout(self.db) == BUCKETED_LAYOUT
+
+    def _find_votes(self, post_ids):
+        """
+        :param post_ids: list of post Id values
+        :return: list of dicts corresponding to the (flat) votes on the posts in the hot tier
+        """
+        if self._is_bucketed():
+            pipeline = [{'$match': {'PostId': {'$in': post_ids}}}] + FLAT_VOTES_PIPELINE
+            return list(self.db[BUCKETS_COLLECTION].aggregate(pipeline))
+        return list(self.votes.find({'PostId': {'$in': post_ids}}))
+
+    def _delete_votes(self, post_ids):
+        if self._is_bucketed():
+            vote_buckets = VoteBucketStore(self.db)
+            vote_buckets.buckets.delete_many({'PostId': {'$in': post_ids}})
+            vote_buckets.post_vote_counts.delete_many({'_id': {'$in': post_ids}})
+        else:
+            self.votes.delete_many({'PostId': {'$in': post_ids}})
+
+    @staticmethod
+    def _copy(collection, docs, key, id_collation=None):
+        """
+        Upserts documents into a collection so that a move that was interrupted can simply be repeated.
+        :param collection: pymongo collection to copy the documents to
+        :param docs: list of dicts corresponding to the documents
+        :param key: field identifying the documents (_id for posts and Id for archived votes since flattened buckets
+                    have no _id)
+        :param id_collation: collation of the index on key (each upsert has to specify it in order to use the index)
+        """
+        if docs:
+            requests = [ReplaceOne({key: doc[key]}, doc, upsert=True, collation=id_collation) for doc in docs]
+            collection.bulk_write(requests, ordered=False)
+
+    def _remove_from_views(self, question_oids):
+        """
+        Removes archived questions from the hot question views (see views.HotQuestionViews) so that the listings never
+        point at a question that is no longer in the hot tier. The next refresh of a view fills it back up.
+        :param question_oids: list of the _id values of the archived questions
+        """
+        self.hot_views.update_many(
+            {'questions._id': {'$in': question_oids}},
+            {'$pull': {'questions': {'_id': {'$in': question_oids}}}}
+        )
+
+    def archive(self, max_age_days=DEFAULT_MAX_AGE_DAYS, batch_size=ARCHIVE_BATCH_SIZE, on_batch=None):
+        """
+        Moves the threads of the questions whose LastActivityDate is more than max_age_days ago (and whose answers have
+        had no activity since then either) into the archive, batch_size questions at a time. Each batch is copied to
+        the archive before it is deleted from the hot tier so an interrupted run loses nothing and can be rerun. The
+        questions are read in (LastActivityDate, _id) order from the activity index, so only the inactive questions are
+        read and each of them only once.
+        :param max_age_days: number of days without activity after which a question is archived
+        :param batch_size: number of questions whose threads are moved per batch
+        :param on_batch: function called with the list of posts (questions and answers) of each batch once they have
+                         been moved (e.g. to evict them from a document cache)
+        :return: dict containing the number of questions, answers, and votes that were archived
+        """
+        self.create_indexes()
+        use_ngram_search = self.search_engine.is_built()
+        cutoff = get_cutoff_date(max_age_days)
+        counts = {'questions': 0, 'answers': 0, 'votes': 0}
+        last = None
+        while True:
+            query = {'PostTypeId': QUESTION_TYPE_ID, 'LastActivityDate': {'$lt': cutoff}}
+            if last is not None:
+                # each batch continues the walk of the activity index after the last (LastActivityDate, _id) pair of
+                # the previous one (so questions that are kept back because one of their answers is still active are
+                # never read again)
+                query['LastActivityDate']['$gte'] = last[0]
+                query['$nor'] = [{'LastActivityDate': last[0], '_id': {'$lte': last[1]}}]
+            cursor = self.posts.find(query).sort([('LastActivityDate', ASCENDING), ('_id', ASCENDING)])
+            questions = list(cursor.hint(self.activity_index).limit(batch_size))
+            if not questions:
+                break
+            last = (questions[-1]['LastActivityDate'], questions[-1]['_id'])
+            question_ids = [question['Id'] for question in questions]
+            answers = list(self.posts.find({'PostTypeId': ANSWER_TYPE_ID, 'ParentId': {'$in': question_ids}}))
+            active_ids = {answer['ParentId'] for answer in answers if answer.get('LastActivityDate', '') >= cutoff}
+            questions = [question for question in questions if question['Id'] not in active_ids]
+            answers = [answer for answer in answers if answer['ParentId'] not in active_ids]
+            if not questions:
+                continue
+            post_ids = [post['Id'] for post in questions + answers]
+            votes = self._find_votes(post_ids)
+            self._copy(self.archived_posts, questions + answers, '_id')
+            self._copy(self.archived_votes, votes, 'Id', ID_COLLATION)
+            self._delete_votes(post_ids)
+            self.posts.delete_many({'_id': {'$in': [post['_id'] for post in questions + answers]}})
+            self._remove_from_views([question['_id'] for question in questions])
+            if use_ngram_search:
+                for question in questions:
+                    self.search_engine.remove_post(question)
+            if on_batch is not None:
+                on_batch(questions + answers)
+            counts['questions'] += len(questions)
+            counts['answers'] += len(answers)
+            counts['votes'] += len(votes)
+        return counts
+
+    def restore(self, question_id):
+        """
+        Moves the thread of an archived question (the question, its answers, and the votes on them) back to the hot
+        tier. The votes are put back in the current vote layout and the question is added back to the n-gram index.
+        :param question_id: Id of the archived question
+        :return: True if the question was archived (and has been restored), False otherwise
+        """
+        thread = list(self.archived_posts.find({'$or': [
+            {'PostTypeId': QUESTION_TYPE_ID, 'Id': question_id},
+            {'PostTypeId': ANSWER_TYPE_ID, 'ParentId': question_id}
+        ]}))
+        if not any(post['PostTypeId'] == QUESTION_TYPE_ID for post in thread):
+            return False
+        post_ids = [post['Id'] for post in thread]
+        votes = list(self.archived_votes.find({'PostId': {'$in': post_ids}}))
+        self._copy(self.posts, thread, '_id')
+        if votes and self._is_bucketed():
+            VoteBucketStore(self.db).insert_votes(votes)
+        else:
+            self._copy(self.votes, votes, '_id')
+        self.archived_votes.delete_many({'PostId': {'$in': post_ids}})
+        self.archived_posts.delete_many({'_id': {'$in': [post['_id'] for post in thread]}})
+        if self.search_engine.is_built():
+            for post in thread:
+                if post['PostTypeId'] == QUESTION_TYPE_ID:
+                    self.search_engine.index_post(post)
+        return True
+
+    def search(self, keywords):
+        """
+        :param keywords: space separated string of keywords
+        :return: list of dicts corresponding to the archived questions matching at least one of the keywords (whole
+                 word matches, best matches first)
+        """
+        query = {'PostTypeId': QUESTION_TYPE_ID, '$text': {'$search': keywords}}
+        cursor = self.archived_posts.find(query, LISTING_PROJECTION)
+        return list(cursor.sort([('score', {'$meta': 'textScore'})]))
+
+    def get_post(self, post_oid):
+        """
+        :param post_oid: _id of the post
+        :return: dict corresponding to the archived post or None if it is not archived
+        """
+        return self.archived_posts.find_one({'_id': post_oid})
+
+    def get_post_by_id(self, post_id):
+        """
+        :param post_id: Id of the post
+        :return: dict corresponding to the archived post or None if it is not archived
+        """
+        return self.archived_posts.find_one({'Id': post_id}, collation=ID_COLLATION)
+
+    def get_answers(self, question_id, exclude_id=None):
+        """
+        :param question_id: Id of the question
+        :param exclude_id: Id of an answer to leave out (the accepted answer)
+        :return: list of dicts corresponding to the archived answers to the question (without their full body fields)
+        """
+        query = {'PostTypeId': ANSWER_TYPE_ID, 'ParentId': question_id}
+        if exclude_id is not None:
+            query['Id'] = {'$ne': exclude_id}
+        return list(self.archived_posts.find(query, LISTING_PROJECTION))
+
+    def increment_view_count(self, post_oid):
+        """
+        Increments the view count of an archived question (views do not count as activity so the question stays
+        archived).
+        :param post_oid: _id of the question
+        :return: dict corresponding to the updated question or None if it is not archived
+        """
+        return self.archived_posts.find_one_and_update(
+            {'_id': post_oid},
+            {'$inc': {'ViewCount': 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def has_voted(self, post_id, user_id):
+        """
+        :param post_id: Id of the post
+        :param user_id: user id
+        :return: True if the user has an archived vote on the post, False otherwise
+        """
+        return self.archived_votes.find_one({'PostId': post_id, 'UserId': str(user_id)}, {'_id': 1}) is not None
+
+    def get_owned_post_stats(self, user_id, post_type):
+        """
+        :param user_id: OwnerUserId to look for
+        :param post_type: int corresponding to the post type (1 for questions and 2 for answers)
+        :return: tuple of int, int corresponding to the number of archived posts of the type owned by the user and the
+                 sum of their scores
+        """
+        pipeline = [
+            {'$match': {'PostTypeId': str(post_type), 'OwnerUserId': str(user_id)}},
+            {'$group': {'_id': None, 'num_posts': {'$sum': 1}, 'total_score': {'$sum': '$Score'}}}
+        ]
+        res = list(self.archived_posts.aggregate(pipeline))
+        return (0, 0) if len(res) != 1 else (res[0]['num_posts'], res[0]['total_score'])
+
+    def get_num_votes(self, user_id):
+        """
+        :param user_id: user id
+        :return: int corresponding to the number of archived votes registered by the user
+        """
+        return self.archived_votes.count_documents({'UserId': str(user_id)})
+
+    def get_max_id(self, id_type):
+        """
+        :param id_type: 'post' or 'vote'
+        :return: int corresponding to the max archived Id of the type (0 if there are none)
+        """
+        collection = self.archived_posts if id_type == 'post' else self.archived_votes
+        res = collection.find_one(sort=[('Id', DESCENDING)], collation=ID_COLLATION)
+        return 0 if res is None else int(res['Id'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Moves inactive question threads to (or back from) the archive')
+    parser.add_argument('port', type=int, help='port of the MongoDB server')
+    parser.add_argument('--max-age-days', type=int, default=DEFAULT_MAX_AGE_DAYS,
+                        help='archive questions with no activity for this many days')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                        help='number of questions whose threads are moved per batch')
+    parser.add_argument('--restore', metavar='QUESTION_ID', help='restore the thread of an archived question instead')
+    args = parser.parse_args()
+    client = MongoClient(port=args.port)
+    archive = PostArchive(client[DB_NAME])
+    if args.restore is not None:
+        print('Restored' if archive.restore(args.restore) else 'Question {} is not archived'.format(args.restore))
+    else:
+        res = archive.archive(max_age_days=args.max_age_days, batch_size=args.batch_size)
+        print('Archived {questions} questions, {answers} answers, and {votes} votes'.format(**res))
+    client.close()
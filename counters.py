@@ -0,0 +1,62 @@
+import sys
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from data_io import iter_batches
+from db_manager import DB_NAME, QUESTION_TYPE_ID, ANSWER_TYPE_ID, ID_COLLATION
+
+REPAIR_BATCH_SIZE = 1000
+POST_ID_INDEX = 'post_Id_index'
+
+
+def repair_question_counters(posts):
+    """
+    Recomputes the denormalized AnswerCount and LastActivityDate fields of every question in bulk (e.g. after the
+    collections have been populated by phase1 or if the fields have drifted). A single aggregation groups the answers
+    by ParentId to get the number of answers and latest answer activity of each question and the results are applied
+    with batched bulk writes. LastActivityDate is only ever advanced (it is the max of the question's own
+    LastActivityDate, or CreationDate if it has none, and the latest activity of its answers).
+    :param posts: pymongo collection containing the posts
+    :return: int corresponding to the number of questions that have at least one answer
+    """
+    # the updates look questions up by Id so the Id index (the same one DBManager creates) must exist
+    posts.create_index([('Id', ASCENDING)], collation=ID_COLLATION, name=POST_ID_INDEX)
+    posts.update_many({'PostTypeId': QUESTION_TYPE_ID}, {'$set': {'AnswerCount': 0}})
+    posts.update_many(
+        {'PostTypeId': QUESTION_TYPE_ID, 'LastActivityDate': {'$exists': False}},
+        [{'$set': {'LastActivityDate': '$CreationDate'}}]
+    )
+    answer_counts_pipeline = [
+        {'$match': {'PostTypeId': ANSWER_TYPE_ID}},
+        {'$group': {
+            '_id': '$ParentId',
+            'answer_count': {'$sum': 1},
+            'last_activity': {'$max': {'$ifNull': ['$LastActivityDate', '$CreationDate']}}
+        }}
+    ]
+    num_questions = 0
+    for batch in iter_batches(posts.aggregate(answer_counts_pipeline, allowDiskUse=True), REPAIR_BATCH_SIZE):
+        requests = [
+            UpdateOne(
+                {'Id': res['_id'], 'PostTypeId': QUESTION_TYPE_ID},
+                [{'$set': {
+                    'AnswerCount': res['answer_count'],
+                    'LastActivityDate': {'$max': ['$LastActivityDate', {'$literal': res['last_activity']}]}
+                }}],
+                collation=ID_COLLATION
+            )
+            for res in batch
+        ]
+        posts.bulk_write(requests, ordered=False)
+        num_questions += len(batch)
+    return num_questions
+
+
+if __name__ == '__main__':
+    assert (len(sys.argv) == 2), 'please enter the correct number of arguments - this program should be run using ' \
+                                 '"python3 counters.py PORT_NUMBER"'
+    try:
+        port_no = int(sys.argv[1])
+    except ValueError:
+        assert False, 'ValueError - please ensure that the port number specified is an integer'
+    client = MongoClient(port=port_no)
+    repair_question_counters(client[DB_NAME]['Posts'])
+    client.close()
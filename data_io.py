@@ -0,0 +1,245 @@
+import bz2
+import gzip
+import io
+import json
+import lzma
+import re
+import xml.etree.ElementTree as ElementTree
+from os import path
+
+READ_CHUNK_SIZE = 1 << 16
+COMPRESSION_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open
+}
+COMPRESSORS = {
+    '.gz': gzip.compress,
+    '.bz2': bz2.compress,
+    '.xz': lzma.compress
+}
+JSON_EXTENSION = '.json'
+JSON_LINES_EXTENSIONS = ['.jsonl', '.ndjson']
+XML_EXTENSION = '.xml'
+# fields that are stored as ints in the json files but are attributes (i.e. strings) in the Stack Exchange xml dumps
+INT_FIELDS = {'Score', 'ViewCount', 'AnswerCount', 'CommentCount', 'FavoriteCount', 'Count'}
+ROW_ARRAY_PATTERN = re.compile(r'"row"\s*:\s*\[')
+
+
+def split_compression(file_path):
+    """
+    Splits the compression extension (one of .gz, .bz2, or .xz) off of a file path.
+    :param file_path: path of the file
+    :return: tuple of str, str where the first str corresponds to the file path without the compression extension and
+             the second str corresponds to the compression extension (or an empty string if the file is not compressed)
+    """
+    root, ext = path.splitext(file_path)
+    if ext.lower() in COMPRESSION_OPENERS:
+        return root, ext.lower()
+    return file_path, ''
+
+
+def open_file(file_path, mode='rt', fileobj=None):
+    """
+    Opens a (possibly compressed) file. The compression is determined by the extension of the file path (.gz, .bz2, or
+    .xz) and if there is no compression extension the file is opened normally.
+    :param file_path: path of the file to open
+    :param mode: mode to open the file in ('rt', 'rb', 'wt', 'wb', etc.)
+    :param fileobj: already opened binary file object to read the file's contents from instead of opening file_path
+                    (read modes only)
+    :return: file object
+    """
+    compression = split_compression(file_path)[1]
+    if fileobj is not None:
+        if compression != '':
+            fileobj = COMPRESSION_OPENERS[compression](fileobj, 'rb')
+        return fileobj if 'b' in mode else io.TextIOWrapper(fileobj, encoding='utf-8')
+    if compression == '':
+        return open(file_path, mode, encoding=None if 'b' in mode else 'utf-8')
+    if 'b' in mode:
+        return COMPRESSION_OPENERS[compression](file_path, mode)
+    return COMPRESSION_OPENERS[compression](file_path, mode, encoding='utf-8')
+
+
+def compress_bytes(data, compression):
+    """
+    Compresses data as a single standalone gzip member, bzip2 stream, or xz stream. Since the readers of all three
+    formats accept concatenated members/streams, independently compressed pieces can simply be appended to one another
+    to form a valid file.
+    :param data: bytes to compress
+    :param compression: one of '.gz', '.bz2', '.xz', or '' (no compression)
+    :return: the compressed bytes
+    """
+    if compression == '':
+        return data
+    return COMPRESSORS[compression](data)
+
+
+class ReadCounter(io.RawIOBase):
+    """
+    Binary file wrapper that counts the number of bytes read from the underlying file (i.e. from disk, before any
+    decompression). Wrap it in an io.BufferedReader before passing it to iter_rows.
+    """
+
+    def __init__(self, raw):
+        """
+        Initializes an instance of this class.
+        :param raw: binary file object to read from
+        """
+        super().__init__()
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        num_bytes = self.raw.readinto(buffer)
+        self.bytes_read += num_bytes or 0
+        return num_bytes
+
+
+def get_format(file_path):
+    """
+    Gets the format of a (possibly compressed) data file from its extension.
+    :param file_path: path of the data file
+    :return: one of 'json' (a file formatted as {"posts": {"row": [documents]}}), 'jsonl' (one document per line), or
+             'xml' (Stack Exchange xml dump where each document is a row element), or None if the format is unknown
+    """
+    ext = path.splitext(split_compression(file_path)[0])[1].lower()
+    if ext == JSON_EXTENSION:
+        return 'json'
+    if ext in JSON_LINES_EXTENSIONS:
+        return 'jsonl'
+    if ext == XML_EXTENSION:
+        return 'xml'
+    return None
+
+
+def find_data_file(directory, collection_name):
+    """
+    Finds the data file for a collection in the specified directory. Looks for (in order) COLLECTION.json,
+    COLLECTION.jsonl, COLLECTION.ndjson, and COLLECTION.xml - each either uncompressed or compressed with gzip, bzip2,
+    or xz.
+    :param directory: path of the directory to look in
+    :param collection_name: name of the collection (Posts, Tags, or Votes)
+    :return: path of the first data file found or None if no data file exists for the collection
+    """
+    for ext in [JSON_EXTENSION] + JSON_LINES_EXTENSIONS + [XML_EXTENSION]:
+        for compression in [''] + list(COMPRESSION_OPENERS):
+            file_path = path.join(directory, collection_name + ext + compression)
+            if path.exists(file_path):
+                return file_path
+    return None
+
+
+def _iter_json_rows(fp):
+    """
+    Incrementally parses a json file formatted as {"posts": {"row": [documents]}} (likewise for tags and votes),
+    yielding the documents in the row array one at a time so that the whole file never has to be held in memory.
+    :param fp: text file object to read from
+    :return: generator of dicts corresponding to the documents in the row array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    match = None
+    while match is None:
+        chunk = fp.read(READ_CHUNK_SIZE)
+        if chunk == '':
+            return
+        buffer += chunk
+        match = ROW_ARRAY_PATTERN.search(buffer)
+    pos = match.end()
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise ValueError('buffer exhausted')
+            doc, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if eof:
+                raise ValueError('unexpected end of json data while reading a row')
+            chunk = fp.read(READ_CHUNK_SIZE)
+            eof = chunk == ''
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield doc
+        pos = end
+
+
+def _iter_json_lines_rows(fp):
+    """
+    Parses a json lines file (one document per line) yielding the documents one at a time. Blank lines are skipped.
+    :param fp: text file object to read from
+    :return: generator of dicts corresponding to the documents in the file
+    """
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _iter_xml_rows(fp):
+    """
+    Incrementally parses a Stack Exchange xml dump (Posts.xml, Tags.xml, or Votes.xml) yielding each row element as a
+    dict of its attributes. Fields that are ints in the json files (see INT_FIELDS) are converted to ints. Parsed
+    elements are cleared as they are consumed to keep memory usage flat.
+    :param fp: binary file object to read from
+    :return: generator of dicts corresponding to the row elements in the file
+    """
+    root = None
+    for event, elem in ElementTree.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+        if elem.tag != 'row':
+            continue
+        doc = dict(elem.attrib)
+        for field in INT_FIELDS.intersection(doc):
+            doc[field] = int(doc[field])
+        yield doc
+        root.clear()
+
+
+def iter_rows(file_path, source=None):
+    """
+    Streams the documents stored in a (possibly compressed) json, json lines, or Stack Exchange xml data file.
+    :param file_path: path of the data file
+    :param source: binary file object to read the data file's contents from (e.g. a ReadCounter) instead of opening
+                   file_path - the format and compression are still determined by file_path
+    :return: generator of dicts corresponding to the documents in the data file
+    """
+    file_format = get_format(file_path)
+    assert file_format is not None, 'unknown data file format for "{}"'.format(file_path)
+    if file_format == 'xml':
+        with open_file(file_path, 'rb', fileobj=source) as fp:
+            yield from _iter_xml_rows(fp)
+    else:
+        with open_file(file_path, 'rt', fileobj=source) as fp:
+            if file_format == 'json':
+                yield from _iter_json_rows(fp)
+            else:
+                yield from _iter_json_lines_rows(fp)
+
+
+def iter_batches(rows, batch_size):
+    """
+    Groups the documents of an iterable into lists of at most batch_size documents.
+    :param rows: iterable of documents
+    :param batch_size: max number of documents per batch
+    :return: generator of lists of documents
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
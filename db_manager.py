@@ -1,29 +1,72 @@
-from pymongo import MongoClient, collation, ASCENDING, DESCENDING, TEXT
+from pymongo import MongoClient, ReturnDocument, InsertOne, UpdateOne, collation, ASCENDING, DESCENDING
+from bson import ObjectId
 from datetime import datetime
 import re
+import threading
+from archive import PostArchive, DEFAULT_MAX_AGE_DAYS, ARCHIVE_BATCH_SIZE
+from search_engine import NGramSearchEngine, GRAMS_COLLECTION
+from doc_cache import DocumentCache, CACHE_SIZE, CACHE_TTL
+from storage import StorageBackend
+from text_fields import add_text_fields, create_text_index, needs_migration, LISTING_PROJECTION, TEXT_INDEX
+from views import HotQuestionViews
+from vote_buckets import VoteBucketStore, get_vote_layout, BUCKETED_LAYOUT
+from utils import completed_future, gather_futures
+from write_queue import WriteQueue, FLUSH_INTERVAL, WRITE_BATCH_SIZE
 
 DB_NAME = '291db'
 SEARCH_INDEX = 'search_index'
 QUESTION_TYPE_ID = '1'
 ANSWER_TYPE_ID = '2'
+# collation of the Id indexes (queries on Id must specify it in order to use them)
+ID_COLLATION = collation.Collation('en_US', numericOrdering=True)
 
 
-class DBManager:
+class DBManager(StorageBackend):
     """
     Class handling the interaction between python and MongoDB.
     """
 
-    def __init__(self, port):
+    def __init__(self, port, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL, use_write_queue=False,
+                 flush_interval=FLUSH_INTERVAL, write_batch_size=WRITE_BATCH_SIZE, ordered_writes=True,
+                 write_concern=None, create_indexes=True):
         """
         Gets a MongoDB client that is connected to the MongoDB server at the specified port. Gets a pymongo database
         with name DB_NAME and collections named Posts, Tags, and Votes. Creates indexes for queries that are commonly
-        used in order to optimize the performance of this program.
+        used in order to optimize the performance of this program (unless create_indexes is False).
         :param port: int corresponding to the port to connect to the MongoDB server at
+        :param cache_size: max number of post documents to keep in the document cache (0 disables the cache)
+        :param cache_ttl: number of seconds a cached post document stays valid
+        :param use_write_queue: True to group-commit the inserts and updates of add_question (including its tags and
+                                n-gram index entries), add_answer, add_vote, and increment_view_count (for cached
+                                questions) through a write_queue.WriteQueue (the methods then return futures that
+                                resolve once their writes are acknowledged), False to send every write on its own
+        :param flush_interval: max number of seconds a queued write waits for its batch to fill up
+        :param write_batch_size: max number of writes per batch
+        :param ordered_writes: True to send the batches as ordered bulk writes, False for unordered bulk writes
+        :param write_concern: pymongo.write_concern.WriteConcern to send the batches with (None for the default)
+        :param create_indexes: False to skip the index setup (for managers created after it has already been done,
+                               e.g. the many short lived managers of load_sim.py)
         """
         self.client = MongoClient(port=port)
+        self.post_cache = DocumentCache(max_size=cache_size, ttl=cache_ttl)
+        self.write_queue = None
+        if use_write_queue:
+            self.write_queue = WriteQueue(
+                flush_interval=flush_interval,
+                batch_size=write_batch_size,
+                ordered=ordered_writes,
+                write_concern=write_concern
+            )
+        self._last_ids = {}
+        self._id_lock = threading.Lock()
+        # (PostId, UserId) pairs of the votes that are still in the write queue (see check_vote_eligibility)
+        self._queued_votes = set()
+        self._queued_votes_lock = threading.Lock()
         self.db = self.client[DB_NAME]
         self.tag_Id_index = 'tag_Id_index'
-        self.question_search_index = 'question_search_index'
+        # text index on the plain text body (replaces the old question_search_index on the html body, see
+        # text_fields.migrate)
+        self.question_search_index = TEXT_INDEX
         self.find_answers_index = 'find_answers_index'
         self.posttypeid_index = 'post_type_id_index'
         self.post_Id_index = 'post_Id_index'
@@ -32,23 +75,38 @@ class DBManager:
         self.vote_userid_index = 'vote_user_id_index'
         self.vote_postid_userid_index = 'vote_postid_userid_index'
         self.posts, self.tags, self.votes = self.db['Posts'], self.db['Tags'], self.db['Votes']
-        self._try_creating_indexes()
+        self.search_engine = NGramSearchEngine(self.posts, self.db[GRAMS_COLLECTION])
+        # the n-gram index is only used (and maintained) if it was built when the collections were populated
+        self.use_ngram_search = self.search_engine.is_built()
+        # votes are stored one document per vote unless they have been migrated to buckets (see vote_buckets.py)
+        self.vote_layout = get_vote_layout(self.db)
+        self.vote_buckets = VoteBucketStore(self.db) if self.vote_layout == BUCKETED_LAYOUT else None
+        self.hot_views = HotQuestionViews(self.db)
+        # the archive is only read if posts have been archived (see archive.py)
+        self.archive = PostArchive(self.db)
+        self.use_archive = self.archive.exists()
+        # Id values of the archived posts that have been read (activity on them restores their thread to the hot tier)
+        self._archived_ids = set()
+        if create_indexes:
+            self._try_creating_indexes()
 
     def _try_creating_indexes(self):
         """
         Tries to create indexes (if they have not already been created) that optimize the performance of this
         application.
         """
-        post_indexes = self.posts.list_indexes()
-        tag_indexes = self.tags.list_indexes()
-        vote_indexes = self.votes.list_indexes()
+        post_indexes = [index['name'] for index in self.posts.list_indexes()]
+        tag_indexes = [index['name'] for index in self.tags.list_indexes()]
+        vote_indexes = [index['name'] for index in self.votes.list_indexes()]
         print('Creating indexes...')
         if self.question_search_index not in post_indexes:
-            self.posts.create_index(
-                [('Tags', TEXT), ('Title', TEXT), ('Body', TEXT)],
-                default_language='none',
-                name=self.question_search_index
-            )
+            # posts loaded before the plain text fields existed are migrated with text_fields.py rather than at startup
+            # (searches keep using the text index on the html body until then)
+            if needs_migration(self.posts):
+                print('The posts do not have the plain text body fields yet - run "python3 text_fields.py PORT_NO" to '
+                      'add them and replace the text index')
+            else:
+                create_text_index(self.posts)
         if self.find_answers_index not in post_indexes:
             self.posts.create_index(
                 [('PostTypeId', ASCENDING), ('ParentId', ASCENDING)],
@@ -76,32 +134,43 @@ class DBManager:
                 collation=collation.Collation('en_US', numericOrdering=True),
                 name=self.tag_Id_index
             )
-        if self.vote_Id_index not in vote_indexes:
-            self.votes.create_index(
-                [('Id', ASCENDING)],
-                collation=collation.Collation('en_US', numericOrdering=True),
-                name=self.vote_Id_index
-            )
-        if self.vote_userid_index not in vote_indexes:
-            self.votes.create_index(
-                [('UserId', ASCENDING)],
-                name=self.vote_userid_index
-            )
-        if self.vote_postid_userid_index not in vote_indexes:
-            self.votes.create_index(
-                [('PostId', ASCENDING), ('UserId', ASCENDING)],
-                name=self.vote_postid_userid_index
-            )
+        # the flat vote indexes are not needed once the votes have been migrated to buckets
+        if self.vote_buckets is None:
+            if self.vote_Id_index not in vote_indexes:
+                self.votes.create_index(
+                    [('Id', ASCENDING)],
+                    collation=collation.Collation('en_US', numericOrdering=True),
+                    name=self.vote_Id_index
+                )
+            if self.vote_userid_index not in vote_indexes:
+                self.votes.create_index(
+                    [('UserId', ASCENDING)],
+                    name=self.vote_userid_index
+                )
+            if self.vote_postid_userid_index not in vote_indexes:
+                self.votes.create_index(
+                    [('PostId', ASCENDING), ('UserId', ASCENDING)],
+                    name=self.vote_postid_userid_index
+                )
+        self.hot_views.create_indexes()
+        if self.use_ngram_search:
+            self.search_engine.create_indexes()
+        if self.vote_buckets is not None:
+            self.vote_buckets.create_indexes()
 
     def _get_new_id(self, id_type):
         """
         Gets a new unique Id value either the Posts, Votes, or Tags collection as specified by id_type. This is done
         by finding the current max Id value in the respective collection and then incrementing that by 1 and returning
-        the new value as a string.
+        the new value as a string. The last Id handed out for each collection is remembered so that writes that are
+        still in the write queue (and therefore not visible in the collection yet) never get the same Id.
         :param id_type: string that corresponds to the collection to get a new unique Id value for (one of 'post',
                         'vote', or 'tag')
         :return: a new unique Id value for the specified table
         """
+        if id_type == 'vote' and self.vote_buckets is not None:
+            # the sequence is atomic, but it must also stay ahead of the votes that have been archived since
+            return self.vote_buckets.get_new_id(self.archive.get_max_id('vote') if self.use_archive else 0)
         res = {}
         max_id_query = [('Id', DESCENDING)]
         if id_type == 'post':
@@ -119,27 +188,62 @@ class DBManager:
                 sort=max_id_query,
                 collation=collation.Collation('en_US', numericOrdering=True)
             )
-        return str(int(res['Id']) + 1)
+        max_id = 0 if res is None else int(res['Id'])
+        if self.use_archive and id_type in ['post', 'vote']:
+            max_id = max(max_id, self.archive.get_max_id(id_type))
+        with self._id_lock:
+            new_id = max(max_id, self._last_ids.get(id_type, 0)) + 1
+            self._last_ids[id_type] = new_id
+        return str(new_id)
+
+    def _write(self, collection, request):
+        """
+        Sends a write to the specified collection - through the write queue if it is enabled, otherwise immediately.
+        :param collection: pymongo collection to write to
+        :param request: pymongo write operation (InsertOne or UpdateOne)
+        :return: concurrent.futures.Future that resolves once the write is acknowledged
+        """
+        if self.write_queue is not None:
+            return self.write_queue.submit(collection, request)
+        return completed_future(collection.bulk_write([request]))
+
+    def _write_many(self, collection, requests):
+        """
+        Sends several writes to the specified collection - through the write queue if it is enabled, otherwise as a
+        single unordered bulk write.
+        :param collection: pymongo collection to write to
+        :param requests: list of pymongo write operations
+        :return: concurrent.futures.Future that resolves once all of the writes are acknowledged
+        """
+        if len(requests) == 0:
+            return completed_future(None)
+        if self.write_queue is not None:
+            return gather_futures([self.write_queue.submit(collection, request) for request in requests])
+        return completed_future(collection.bulk_write(requests, ordered=False))
 
     def _assemble_tag_string(self, tags):
         """
         Assembles a tag string by wrapping each tag with '<' and '>'. If any of the tags do not exist in the Tags
-        collection they are added and for the tags that already exist their Count value is incremented.
+        collection they are added and for the tags that already exist their Count value is incremented. Both are sent
+        as an upsert on the TagName, so a tag whose insert is still in the write queue is incremented rather than
+        inserted twice (a new Id is only allocated for tags that were not found - the Id of an upsert that ends up
+        incrementing a queued tag is simply never used).
         :param tags: list containing the tags
-        :return: tag string containing each tag wrapped with '<' and '>'
+        :return: tuple of str, list where the str corresponds to the tag string containing each tag wrapped with '<'
+                 and '>' (None if there are no tags) and the list corresponds to the futures of the tag writes
         """
         if len(tags) == 0:
-            return None
+            return None, []
         tag_string = ''
+        futures = []
         for tag in tags:
             if tag not in tag_string:
                 tag_string += '<' + tag + '>'
-                res = self.tags.find_one({'TagName': tag})
-                if res is None:
-                    write_res = self.tags.insert_one({'Id': self._get_new_id('tag'), 'TagName': tag, 'Count': 1})
-                else:
-                    self.tags.update_one({'_id': res['_id']}, {'$inc': {'Count': 1}})
-        return tag_string
+                update = {'$inc': {'Count': 1}}
+                if self.tags.find_one({'TagName': tag}, {'_id': 1}) is None:
+                    update['$setOnInsert'] = {'Id': self._get_new_id('tag')}
+                futures.append(self._write(self.tags, UpdateOne({'TagName': tag}, update, upsert=True)))
+        return tag_string, futures
 
     def get_num_owned_posts_and_avg_score(self, user_id, post_type):
         """
@@ -162,38 +266,53 @@ class DBManager:
         ]
         res2 = list(self.posts.aggregate(avg_score_pipeline))
         post_type_avg_score = 0 if len(res2) != 1 else res2[0]['avg_score']
+        if self.use_archive:
+            num_archived, archived_score = self.archive.get_owned_post_stats(user_id, post_type)
+            if num_archived > 0:
+                total_score = post_type_avg_score * num_post_type + archived_score
+                num_post_type += num_archived
+                post_type_avg_score = total_score / num_post_type
         return num_post_type, post_type_avg_score
 
     def get_num_votes(self, user_id):
         """
-        Gets the number of votes registered by a user.
+        Gets the number of votes registered by a user (including archived votes). With the bucketed vote layout this is
+        a single lookup in the per-user rollup.
         :param user_id: int corresponding to the UserId to look for
         :return: an int corresponding to the number of votes registered by the user
         """
+        if self.vote_buckets is not None:
+            return self.vote_buckets.get_num_votes(user_id)
         num_votes_pipeline = [
             {'$match': {'UserId': str(user_id)}},
             {'$count': 'num_votes'}
         ]
         res2 = list(self.votes.aggregate(num_votes_pipeline))
-        return 0 if len(res2) != 1 else res2[0]['num_votes']
+        num_votes = 0 if len(res2) != 1 else res2[0]['num_votes']
+        if self.use_archive:
+            num_votes += self.archive.get_num_votes(user_id)
+        return num_votes
 
     def add_question(self, title, body, tags, user_id, content_license='CC BY-SA 2.5'):
         """
-        Adds a question post to the Posts collection.
+        Adds a question post to the Posts collection. The AnswerCount of the question starts at 0 and its
+        LastActivityDate starts at its CreationDate (both are maintained by add_answer and add_vote).
         :param title: question title
         :param body: question body
         :param tags: list containing the question tags
         :param user_id: id of user who is posting the answer (if None the question post that is added to the Posts
                         collection will not have a OwnerUserId field - likewise in the case that the tags list is empty)
         :param content_license: 'CC BY-SA 2.5' by default
+        :return: concurrent.futures.Future that resolves once the question has been written
         """
-        tag_string = self._assemble_tag_string(tags)
+        tag_string, tag_futures = self._assemble_tag_string(tags)
+        creation_date = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
         if user_id is not None:
             if tag_string is None:
                 insertion = {
                     'Id': self._get_new_id('post'),
                     'PostTypeId': QUESTION_TYPE_ID,
-                    'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3],
+                    'CreationDate': creation_date,
                     'Score': 0,
                     'ViewCount': 0,
                     'Body': body,
@@ -202,13 +321,14 @@ class DBManager:
                     'AnswerCount': 0,
                     'CommentCount': 0,
                     'FavoriteCount': 0,
-                    'ContentLicense': content_license
+                    'ContentLicense': content_license,
+                    'LastActivityDate': creation_date
                 }
             else:
                 insertion = {
                     'Id': self._get_new_id('post'),
                     'PostTypeId': QUESTION_TYPE_ID,
-                    'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3],
+                    'CreationDate': creation_date,
                     'Score': 0,
                     'ViewCount': 0,
                     'Body': body,
@@ -218,14 +338,15 @@ class DBManager:
                     'AnswerCount': 0,
                     'CommentCount': 0,
                     'FavoriteCount': 0,
-                    'ContentLicense': content_license
+                    'ContentLicense': content_license,
+                    'LastActivityDate': creation_date
                 }
         else:
             if tag_string is None:
                 insertion = {
                     'Id': self._get_new_id('post'),
                     'PostTypeId': QUESTION_TYPE_ID,
-                    'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3],
+                    'CreationDate': creation_date,
                     'Score': 0,
                     'ViewCount': 0,
                     'Body': body,
@@ -233,13 +354,14 @@ class DBManager:
                     'AnswerCount': 0,
                     'CommentCount': 0,
                     'FavoriteCount': 0,
-                    'ContentLicense': content_license
+                    'ContentLicense': content_license,
+                    'LastActivityDate': creation_date
                 }
             else:
                 insertion = {
                     'Id': self._get_new_id('post'),
                     'PostTypeId': QUESTION_TYPE_ID,
-                    'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3],
+                    'CreationDate': creation_date,
                     'Score': 0,
                     'ViewCount': 0,
                     'Body': body,
@@ -248,48 +370,189 @@ class DBManager:
                     'AnswerCount': 0,
                     'CommentCount': 0,
                     'FavoriteCount': 0,
-                    'ContentLicense': content_license
+                    'ContentLicense': content_license,
+                    'LastActivityDate': creation_date
                 }
-        write_res = self.posts.insert_one(insertion)
+        add_text_fields(insertion)
+        insertion['_id'] = ObjectId()
+        futures = tag_futures + [self._write(self.posts, InsertOne(insertion))]
+        self.post_cache.put(insertion)
+        if self.use_ngram_search:
+            entries = self.search_engine.get_entries(insertion)
+            futures.append(self._write_many(self.search_engine.grams, [InsertOne(entry) for entry in entries]))
+        return gather_futures(futures)
 
-    def get_search_results(self, keywords):
+    def _from_archive(self, posts):
+        """
+        Records the Id values of posts that were read from the archive.
+        :param posts: list of dicts corresponding to archived posts
+        :return: the same list of posts
+        """
+        self._archived_ids.update(post['Id'] for post in posts)
+        return posts
+
+    @staticmethod
+    def _get_thread_id(post_data):
+        """
+        :param post_data: dict corresponding to document of the post
+        :return: Id of the question of the post's thread
+        """
+        return post_data['Id'] if post_data['PostTypeId'] == QUESTION_TYPE_ID else post_data['ParentId']
+
+    def _restore_if_archived(self, post_data):
+        """
+        Restores the thread of a post to the hot tier if the post was read from the archive (called before the post gets
+        new activity).
+        :param post_data: dict corresponding to document of the post
+        """
+        if post_data['Id'] in self._archived_ids:
+            self.archive.restore(self._get_thread_id(post_data))
+            self._archived_ids.discard(post_data['Id'])
+
+    def archive_inactive(self, max_age_days=DEFAULT_MAX_AGE_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+        """
+        Moves the threads of inactive questions to the archive (see archive.PostArchive.archive) and evicts the moved
+        posts from the document cache as each batch is moved, so that they are read from the archive from then on.
+        Managers in other processes keep their cached copies until they expire (see add_vote).
+        :param max_age_days: number of days without activity after which a question is archived
+        :param batch_size: number of questions whose threads are moved per batch
+        :return: dict containing the number of questions, answers, and votes that were archived
+        """
+        def evict(posts):
+            for post in posts:
+                self.post_cache.invalidate(post['_id'])
+
+        counts = self.archive.archive(max_age_days=max_age_days, batch_size=batch_size, on_batch=evict)
+        self.use_archive = self.use_archive or counts['questions'] > 0
+        return counts
+
+    def get_search_results(self, keywords, include_archive=False):
         """
         Gets the questions from the Posts collection that contain at least one of the searched keywords in either their
-        title, body, or tag fields. Our implementation finds case-insensitive and partial matches. Uses regex to find
-        the matching questions.
+        title, body, or tag fields. Our implementation finds case-insensitive and partial matches by intersecting the
+        posting lists of the n-gram index (see search_engine.NGramSearchEngine) and ranks the questions by the number of
+        keywords they match. If the n-gram index has not been built the $text index is used instead (which only finds
+        whole word matches). Archived questions are only searched (with the $text index of the archive) when asked for
+        or when there are no matching questions in the hot tier, and they are listed after the hot tier's results.
         :param keywords: space separated string of keywords
+        :param include_archive: True to also search the archived questions
         :return: list of dicts corresponding to the documents of the questions that contain at least one of the
                  searched keywords in either their title, body, or tag fields
         """
-        query = {'$and': [{'PostTypeId': QUESTION_TYPE_ID}, {'$text': {'$search': keywords}}]}
-        return list(self.posts.find(query))
+        if self.use_ngram_search:
+            results = self.search_engine.search(keywords)
+        else:
+            query = {'$and': [{'PostTypeId': QUESTION_TYPE_ID}, {'$text': {'$search': keywords}}]}
+            results = list(self.posts.find(query, LISTING_PROJECTION))
+        if self.use_archive and (include_archive or len(results) == 0):
+            results += self._from_archive(self.archive.search(keywords))
+        return results
+
+    def has_archive(self):
+        """
+        :return: True if posts have been archived (see archive.PostArchive), False otherwise
+        """
+        return self.use_archive
+
+    def get_hot_questions(self, kind, tag=None):
+        """
+        Gets the top questions of a materialized hot questions view (see views.HotQuestionViews) with a single query.
+        :param kind: 'score', 'views', or 'activity'
+        :param tag: tag name to get the top questions of (None for the top questions overall)
+        :return: list of dicts corresponding to summaries of the top questions (Id, Title, Score, ViewCount,
+                 AnswerCount, CreationDate, LastActivityDate, and _id) in rank order - empty if the view has not been
+                 built
+        """
+        return self.hot_views.get_view(kind, tag)
+
+    def get_post(self, post_oid):
+        """
+        Gets a post by its _id, reading through the document cache.
+        :param post_oid: _id of the post
+        :return: dict corresponding to the document of the post or None if it does not exist
+        """
+        post = self.post_cache.get(post_oid)
+        if post is None:
+            post = self.posts.find_one({'_id': post_oid})
+            if post is not None:
+                self.post_cache.put(post)
+            elif self.use_archive:
+                post = self.archive.get_post(post_oid)
+                if post is not None:
+                    self._from_archive([post])
+        return post
+
+    def get_post_by_id(self, post_id):
+        """
+        Gets a post by its Id, reading through the document cache.
+        :param post_id: Id of the post
+        :return: dict corresponding to the document of the post or None if it does not exist
+        """
+        post = self.post_cache.get_by_id(post_id)
+        if post is None:
+            post = self.posts.find_one({'Id': post_id}, collation=ID_COLLATION)
+            if post is not None:
+                self.post_cache.put(post)
+            elif self.use_archive:
+                post = self.archive.get_post_by_id(post_id)
+                if post is not None:
+                    self._from_archive([post])
+        return post
+
+    def get_cache_stats(self):
+        """
+        :return: dict containing the hits, misses, hit rate, and size of the post document cache
+        """
+        return self.post_cache.get_stats()
 
     def increment_view_count(self, question_data):
         """
-        Increments the view count of a specified question by 1.
+        Increments the view count of a specified question by 1. If the question is cached the increment is applied to
+        the cached copy (and the update goes through the write queue), otherwise the updated document is returned by
+        the update itself - either way the question is not read back from the database. The uncached update is sent
+        directly rather than through the write queue because its result is the document that is displayed (a queued
+        update followed by a read would take two round trips and could read the old ViewCount). Archived questions
+        are updated in the archive (views do not restore them).
         :param question_data: dict corresponding to document of question post increment the view count of
         :return: dict corresponding to the updated document of the question post (ViewCount value has been incremented)
         """
         query = {'_id': question_data['_id']}
         update = {'$inc': {'ViewCount': 1}}
-        self.posts.update_one(query, update)
-        return self.posts.find_one(query)
+        cached = self.post_cache.get(question_data['_id'])
+        if cached is not None:
+            self._write(self.posts, UpdateOne(query, update))
+            updated = self.post_cache.apply_update(question_data['_id'], update)
+            return updated if updated is not None else self.get_post(question_data['_id'])
+        updated = self.posts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        if updated is None and self.use_archive:
+            updated = self.archive.increment_view_count(question_data['_id'])
+            return question_data if updated is None else self._from_archive([updated])[0]
+        if updated is None:
+            return question_data
+        self.post_cache.put(updated)
+        return updated
 
     def add_answer(self, question_id, body, user_id, content_license='CC BY-SA 2.5'):
         """
-        Adds an answer post to the Posts collection.
+        Adds an answer post to the Posts collection and atomically increments the AnswerCount of the question that it
+        answers and advances the question's LastActivityDate. If the question was read from the archive its thread is
+        restored to the hot tier first.
         :param question_id: value of the Id field of the question that this answer is answering
         :param body: answer text
         :param user_id: id of user who is posting the answer (if None the answer post that is added to the Posts
                         collection will not have a OwnerUserId field)
         :param content_license: 'CC BY-SA 2.5' by default
+        :return: concurrent.futures.Future that resolves once the answer and the update of the question have been
+                 written
         """
+        self._restore_if_archived({'Id': question_id, 'PostTypeId': QUESTION_TYPE_ID})
+        creation_date = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
         if user_id is not None:
             insertion = {
                 'Id': self._get_new_id('post'),
                 'PostTypeId': ANSWER_TYPE_ID,
                 'ParentId': question_id,
-                'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3],
+                'CreationDate': creation_date,
                 'Score': 0,
                 'Body': body,
                 'OwnerUserId': str(user_id),
@@ -301,79 +564,178 @@ class DBManager:
                 'Id': self._get_new_id('post'),
                 'PostTypeId': ANSWER_TYPE_ID,
                 'ParentId': question_id,
-                'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3],
+                'CreationDate': creation_date,
                 'Score': 0,
                 'Body': body,
                 'CommentCount': 0,
                 'ContentLicense': content_license
             }
-        write_res = self.posts.insert_one(insertion)
+        add_text_fields(insertion)
+        insertion['_id'] = ObjectId()
+        insert_future = self._write(self.posts, InsertOne(insertion))
+        self.post_cache.put(insertion)
+        query = {'Id': question_id, 'PostTypeId': QUESTION_TYPE_ID}
+        update = {'$inc': {'AnswerCount': 1}, '$max': {'LastActivityDate': creation_date}}
+        update_future = self._write(self.posts, UpdateOne(query, update, collation=ID_COLLATION))
+        self.post_cache.apply_update_by_id(question_id, update)
+        return gather_futures([insert_future, update_future])
+
+    def _get_archived_answers(self, question_data, num_found, exclude_id, include_archive):
+        """
+        Gets the answers to a question from the archive if asked for, if the question was read from the archive, or if
+        fewer answers were found in the hot tier than the question's AnswerCount.
+        :param question_data: dict corresponding to document of the question
+        :param num_found: number of answers found in the hot tier (including the accepted answer)
+        :param exclude_id: Id of the accepted answer (None if there is none)
+        :param include_archive: True to always read the archive
+        :return: list of dicts corresponding to the archived answers (empty if the archive was not read)
+        """
+        if not self.use_archive:
+            return []
+        if include_archive or question_data['Id'] in self._archived_ids or \
+                num_found < question_data.get('AnswerCount', 0):
+            return self._from_archive(self.archive.get_answers(question_data['Id'], exclude_id))
+        return []
 
-    def get_answers(self, question_data):
+    def get_answers(self, question_data, include_archive=False):
         """
         Gets the answers to the specified question. If the question has an accepted answer the accepted answer will
-        be put as the first element in the list.
+        be put as the first element in the list. The accepted answer is read through the document cache. The other
+        answers are only listed, so they are read without their full body fields (just the BodyPreview) and are not
+        added to the cache - selecting one reads the full answer with get_post. The hot tier is read first and the
+        archive only when needed (see _get_archived_answers).
         :param question_data: dict corresponding to document of question post to get the answers of
+        :param include_archive: True to also read the archived answers
         :return: tuple of bool, list of dicts where the bool corresponds to whether the first element of the list is the
                  accepted answer (True if so) and the list corresponds to all the answers to the specified question
         """
+        accepted_ans = None
         if 'AcceptedAnswerId' in question_data:
-            accepted_ans_query = {'Id': question_data['AcceptedAnswerId']}
-            accepted_ans = self.posts.find_one(accepted_ans_query)
+            accepted_ans = self.get_post_by_id(question_data['AcceptedAnswerId'])
+        if accepted_ans is not None:
             query = {'$and': [
                 {'Id': {'$ne': accepted_ans['Id']}},
                 {'PostTypeId': ANSWER_TYPE_ID},
                 {'ParentId': question_data['Id']}
             ]}
-            return True, [accepted_ans] + list(self.posts.find(query))
+            answers = list(self.posts.find(query, LISTING_PROJECTION))
+            answers += self._get_archived_answers(question_data, len(answers) + 1, accepted_ans['Id'], include_archive)
+            return True, [accepted_ans] + answers
         else:
             query = {'$and': [
                 {'PostTypeId': ANSWER_TYPE_ID},
                 {'ParentId': question_data['Id']}
             ]}
-            return False, list(self.posts.find(query))
+            answers = list(self.posts.find(query, LISTING_PROJECTION))
+            answers += self._get_archived_answers(question_data, len(answers), None, include_archive)
+            return False, answers
 
     def check_vote_eligibility(self, post_data, user_id):
         """
-        Checks to see whether a user id is eligible to vote on a post (i.e. they have not yet voted on the post).
+        Checks to see whether a user id is eligible to vote on a post (i.e. they have not yet voted on the post). Votes
+        that are still in the write queue are not in the database yet, so they are looked up in the pending votes that
+        add_vote records first. The archived votes are checked last.
         :param post_data: dict corresponding to document of post to add a vote to
         :param user_id: user id to add a vote from
         :return: True if the user id has not yet voted on the specified post (i.e. they are eligible), False otherwise
         """
-        query = {'$and': [
-            {'PostId': post_data['Id']},
-            {'UserId': str(user_id)}
-        ]}
-        return True if self.votes.find_one(query) is None else False
+        with self._queued_votes_lock:
+            if (post_data['Id'], str(user_id)) in self._queued_votes:
+                return False
+        if self.vote_buckets is not None:
+            if self.vote_buckets.has_voted(post_data['Id'], user_id):
+                return False
+        else:
+            query = {'$and': [
+                {'PostId': post_data['Id']},
+                {'UserId': str(user_id)}
+            ]}
+            if self.votes.find_one(query) is not None:
+                return False
+        # the post may have been archived since it was read (e.g. while it was cached), so the archived votes are
+        # checked whenever there is an archive and not just for the posts that were read from it
+        return not (self.use_archive and self.archive.has_voted(post_data['Id'], user_id))
+
+    def _track_queued_vote(self, post_id, user_id, future):
+        """
+        Records a vote that is in the write queue until its write has been acknowledged (or has failed).
+        :param post_id: PostId of the vote
+        :param user_id: UserId of the vote (as a string)
+        :param future: concurrent.futures.Future of the write of the vote
+        """
+        key = (post_id, user_id)
+        with self._queued_votes_lock:
+            self._queued_votes.add(key)
+
+        def on_done(_):
+            with self._queued_votes_lock:
+                self._queued_votes.discard(key)
+
+        future.add_done_callback(on_done)
 
     def add_vote(self, post_data, user_id):
         """
-        Adds a vote from the specified user on the specified post to the Votes collection and increments the score of
-        the post by one.
+        Adds a vote from the specified user on the specified post to the Votes collection (or to the bucket that its
+        position on the post falls in and the user's vote count rollup with the bucketed vote layout) and atomically
+        increments the score of the post by one and advances its LastActivityDate. If the post was read from the
+        archive its thread is restored to the hot tier first. A post can also have been archived after it was read
+        (e.g. while it was cached), so when there is an archive (or the writes are not queued) the update of the post is
+        sent before the vote and if it matches no post in the hot tier the thread is restored and the update is sent
+        again.
         :param post_data: dict corresponding to document of post to add a vote to
         :param user_id: user id to add a vote from (if a value of None is passed, there will be no UserId field in the
                         document inserted into the Votes collection)
+        :return: concurrent.futures.Future that resolves once the vote and the update of the post have been written
         """
+        self._restore_if_archived(post_data)
+        creation_date = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
+        query = {'_id': post_data['_id']}
+        update = {'$inc': {'Score': 1}, '$max': {'LastActivityDate': creation_date}}
+        if self.write_queue is None or self.use_archive:
+            result = self.posts.update_one(query, update)
+            if result.matched_count == 0 and self.archive.restore(self._get_thread_id(post_data)):
+                self.use_archive = True
+                result = self.posts.update_one(query, update)
+            update_future = completed_future(result)
+        else:
+            update_future = self._write(self.posts, UpdateOne(query, update))
+        self.post_cache.apply_update(post_data['_id'], update)
         if user_id is not None:
             insertion = {
                 'Id': self._get_new_id('vote'),
                 'PostId': post_data['Id'],
                 'VoteTypeId': '2',
                 'UserId': str(user_id),
-                'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
+                'CreationDate': creation_date
             }
         else:
             insertion = {
                 'Id': self._get_new_id('vote'),
                 'PostId': post_data['Id'],
                 'VoteTypeId': '2',
-                'CreationDate': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
+                'CreationDate': creation_date
             }
-        write_res = self.votes.insert_one(insertion)
-
-        query = {'_id': post_data['_id']}
-        update = {'$inc': {'Score': 1}}
-        self.posts.update_one(query, update)
+        if self.vote_buckets is not None:
+            seq = self.vote_buckets.allocate_bucket(post_data['Id'])
+            bucket_filter, bucket_update = self.vote_buckets.get_bucket_update(insertion, seq)
+            vote_futures = [
+                self._write(self.vote_buckets.buckets, UpdateOne(bucket_filter, bucket_update, upsert=True))
+            ]
+            if user_id is not None:
+                count_filter, count_update = self.vote_buckets.get_user_count_update(user_id)
+                vote_futures.append(
+                    self._write(self.vote_buckets.user_vote_counts, UpdateOne(count_filter, count_update, upsert=True))
+                )
+        else:
+            vote_futures = [self._write(self.votes, InsertOne(insertion))]
+        if user_id is not None and not vote_futures[0].done():
+            self._track_queued_vote(post_data['Id'], str(user_id), vote_futures[0])
+        return gather_futures(vote_futures + [update_future])
 
     def close(self):
+        """
+        Flushes any writes that are still in the write queue and then closes the MongoDB client.
+        """
+        if self.write_queue is not None:
+            self.write_queue.close()
         self.client.close()
\ No newline at end of file
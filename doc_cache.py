@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = 4096
+CACHE_TTL = 300
+
+
+class DocumentCache:
+    """
+    Bounded read-through cache of post documents keyed by _id (with a secondary mapping from Id to _id). Entries are
+    evicted in least recently used order once the cache holds max_size documents and expire ttl seconds after they
+    were last loaded from the database. Writes made by DBManager are applied to the cached copies (see apply_update) so
+    that they do not have to be read back. Documents are copied on the way in and out so callers can never modify the
+    cached copies. All methods are thread safe.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        """
+        Initializes an instance of this class.
+        :param max_size: max number of documents to hold (0 disables the cache)
+        :param ttl: number of seconds that a document stays valid after it is loaded
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._docs = OrderedDict()
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, post_oid):
+        """
+        Gets the cached document with the specified _id (if it has not expired) and marks it as most recently used. The
+        lock must be held by the caller.
+        :param post_oid: _id of the document
+        :return: dict corresponding to the cached document (not a copy) or None if it is not cached
+        """
+        entry = self._docs.get(post_oid)
+        if entry is None:
+            return None
+        expires, doc = entry
+        if expires < time.monotonic():
+            self._remove(post_oid)
+            return None
+        self._docs.move_to_end(post_oid)
+        return doc
+
+    def _remove(self, post_oid):
+        expires, doc = self._docs.pop(post_oid)
+        if self._ids.get(doc.get('Id')) == post_oid:
+            del self._ids[doc['Id']]
+
+    def get(self, post_oid):
+        """
+        :param post_oid: _id of the document
+        :return: a copy of the cached document or None if it is not cached
+        """
+        with self._lock:
+            doc = self._lookup(post_oid)
+            if doc is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(doc)
+
+    def get_by_id(self, post_id):
+        """
+        :param post_id: Id of the document
+        :return: a copy of the cached document or None if it is not cached
+        """
+        with self._lock:
+            post_oid = self._ids.get(post_id)
+            doc = None if post_oid is None else self._lookup(post_oid)
+            if doc is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(doc)
+
+    def put(self, doc):
+        """
+        Adds (or replaces) a document in the cache, evicting the least recently used documents if the cache is full.
+        :param doc: dict corresponding to the document (must include its _id)
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if doc['_id'] in self._docs:
+                self._remove(doc['_id'])
+            self._docs[doc['_id']] = (time.monotonic() + self.ttl, dict(doc))
+            if 'Id' in doc:
+                self._ids[doc['Id']] = doc['_id']
+            while len(self._docs) > self.max_size:
+                self._remove(next(iter(self._docs)))
+
+    def apply_update(self, post_oid, update):
+        """
+        Applies an update that has been written to the database to the cached copy of the document (if it is cached).
+        Supports the $inc, $max, and $set operators that DBManager uses.
+        :param post_oid: _id of the document that was updated
+        :param update: dict corresponding to the update document that was written
+        :return: a copy of the updated cached document or None if it is not cached
+        """
+        with self._lock:
+            doc = self._lookup(post_oid)
+            if doc is None:
+                return None
+            for field, amount in update.get('$inc', {}).items():
+                doc[field] = doc.get(field, 0) + amount
+            for field, value in update.get('$max', {}).items():
+                if field not in doc or doc[field] is None or doc[field] < value:
+                    doc[field] = value
+            for field, value in update.get('$set', {}).items():
+                doc[field] = value
+            return dict(doc)
+
+    def apply_update_by_id(self, post_id, update):
+        """
+        Same as apply_update but looks the document up by its Id.
+        :param post_id: Id of the document that was updated
+        :param update: dict corresponding to the update document that was written
+        :return: a copy of the updated cached document or None if it is not cached
+        """
+        with self._lock:
+            post_oid = self._ids.get(post_id)
+        return None if post_oid is None else self.apply_update(post_oid, update)
+
+    def invalidate(self, post_oid):
+        with self._lock:
+            if post_oid in self._docs:
+                self._remove(post_oid)
+
+    def get_stats(self):
+        """
+        :return: dict containing the number of hits, misses, hit rate, and number of cached documents
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': 0 if lookups == 0 else self.hits / lookups,
+                'size': len(self._docs)
+            }
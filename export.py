@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os import path
+from pymongo import MongoClient
+from data_io import open_file, compress_bytes
+from archive import ARCHIVED_POSTS_COLLECTION, ARCHIVED_VOTES_COLLECTION
+from text_fields import BODY_TEXT_FIELD, BODY_PREVIEW_FIELD
+from vote_buckets import get_vote_layout, BUCKETED_LAYOUT, BUCKETS_COLLECTION, FLAT_VOTES_PIPELINE
+
+DB_NAME = '291db'
+COLLECTION_NAMES = ['Posts', 'Tags', 'Votes']
+MANIFEST_FILE = 'manifest.json'
+DEFAULT_WORKERS = 4
+RANGES_PER_WORKER = 4
+# number of sampled _id values per range used to pick the range boundaries
+SAMPLES_PER_RANGE = 10
+CURSOR_BATCH_SIZE = 1000
+
+
+class ExportDocStore:
+    """
+    Class that exports the Posts, Tags, and Votes collections of the "291db" database to files that can be loaded back
+    into MongoDB with phase1 (the reverse of phase1.BuildDocStore). Archived posts and votes (see archive.py) are
+    exported together with the hot tier, so the files always hold every post and vote. Each source collection is split
+    into _id ranges that are read by parallel cursors and written to separately compressed parts which are then
+    concatenated into a single file per collection. A manifest describing the export is written alongside the data
+    files.
+    """
+
+    def __init__(self, port, output_dir, file_format='jsonl', compression='.gz', workers=DEFAULT_WORKERS):
+        """
+        Connects to the MongoDB server at the specified port and exports the collections to output_dir.
+        :param port: int corresponding to the port to connect to the MongoDB server at
+        :param output_dir: path of the directory to write the data files and the manifest to (created if necessary)
+        :param file_format: 'jsonl' (one document per line) or 'json' (the {"posts": {"row": [documents]}} format
+                            that phase1 has always accepted)
+        :param compression: one of '.gz', '.bz2', '.xz', or '' (no compression)
+        :param workers: number of parallel cursors to read with
+        """
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.compression = compression
+        self.workers = workers
+        self.client = MongoClient(port=port)
+        self.db = self.client[DB_NAME]
+        self.vote_layout = get_vote_layout(self.db)
+        os.makedirs(output_dir, exist_ok=True)
+        self._export_collections()
+        self._close()
+
+    def _get_ranges(self, collection):
+        """
+        Splits a collection into _id ranges of roughly equal size by sampling _id values and using evenly spaced
+        samples as the range boundaries. The first and last ranges are open-ended so that the ranges always cover the
+        whole collection.
+        :param collection: pymongo collection to split
+        :return: list of query filters, one per range
+        """
+        num_ranges = self.workers * RANGES_PER_WORKER
+        sample_pipeline = [
+            {'$sample': {'size': num_ranges * SAMPLES_PER_RANGE}},
+            {'$project': {'_id': 1}}
+        ]
+        sampled_ids = sorted(doc['_id'] for doc in collection.aggregate(sample_pipeline))
+        boundaries = []
+        for sample in sampled_ids[SAMPLES_PER_RANGE::SAMPLES_PER_RANGE]:
+            if len(boundaries) == 0 or sample != boundaries[-1]:
+                boundaries.append(sample)
+        if len(boundaries) == 0:
+            return [{}]
+        ranges = [{'_id': {'$lt': boundaries[0]}}]
+        for lower, upper in zip(boundaries, boundaries[1:]):
+            ranges.append({'_id': {'$gte': lower, '$lt': upper}})
+        ranges.append({'_id': {'$gte': boundaries[-1]}})
+        return ranges
+
+    def _get_sources(self, collection_name):
+        """
+        :param collection_name: name of the collection to export
+        :return: list of the pymongo collections that the documents of the collection are read from (with the bucketed
+                 vote layout the hot votes are read from their buckets, and the archived posts and votes are read from
+                 the archive collections)
+        """
+        if collection_name == 'Posts':
+            return [self.db['Posts'], self.db[ARCHIVED_POSTS_COLLECTION]]
+        if collection_name == 'Votes':
+            hot_votes = self.db[BUCKETS_COLLECTION if self.vote_layout == BUCKETED_LAYOUT else 'Votes']
+            return [hot_votes, self.db[ARCHIVED_VOTES_COLLECTION]]
+        return [self.db[collection_name]]
+
+    def _get_file_name(self, collection_name):
+        extension = '.jsonl' if self.file_format == 'jsonl' else '.json'
+        return collection_name + extension + self.compression
+
+    def _export_range(self, collection_name, source, query, part_path):
+        """
+        Reads the documents of a single _id range of a source collection and writes them to a part file. The _id field
+        is not exported (just like the input files of phase1) and neither are the derived plain text fields of the posts
+        (phase1 derives them again). Bucketed votes are unwound back into one document per vote. In json format the
+        documents are separated by commas but the part itself does not include the surrounding array so that parts can
+        be concatenated.
+        :param collection_name: name of the collection being exported
+        :param source: pymongo collection to read from (see _get_sources)
+        :param query: filter selecting the _id range
+        :param part_path: path of the part file to write to
+        :return: int corresponding to the number of documents written
+        """
+        num_docs = 0
+        if source.name == BUCKETS_COLLECTION:
+            pipeline = [{'$match': query}] + FLAT_VOTES_PIPELINE + [{'$project': {'_id': 0}}]
+            cursor = source.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
+        else:
+            projection = {'_id': 0}
+            if collection_name == 'Posts':
+                projection.update({BODY_TEXT_FIELD: 0, BODY_PREVIEW_FIELD: 0})
+            cursor = source.find(query, projection, batch_size=CURSOR_BATCH_SIZE)
+        with open_file(part_path, 'wt') as fp:
+            for doc in cursor:
+                if self.file_format == 'jsonl':
+                    fp.write(json.dumps(doc, default=str) + '\n')
+                else:
+                    fp.write(('' if num_docs == 0 else ',\n') + json.dumps(doc, default=str))
+                num_docs += 1
+        return num_docs
+
+    def _assemble_file(self, collection_name, part_paths, part_counts):
+        """
+        Concatenates the (independently compressed) parts of a collection into its data file. In json format the
+        wrapper object, and the commas between non-empty parts, are written as separately compressed pieces.
+        :param collection_name: name of the collection
+        :param part_paths: list of part file paths (in _id order per source collection)
+        :param part_counts: list of the number of documents in each part
+        :return: path of the assembled data file
+        """
+        file_path = path.join(self.output_dir, self._get_file_name(collection_name))
+        wrote_docs = False
+        with open(file_path, 'wb') as out:
+            if self.file_format == 'json':
+                header = '{{"{}": {{"row": [\n'.format(collection_name.lower())
+                out.write(compress_bytes(header.encode('utf-8'), self.compression))
+            for part_path, count in zip(part_paths, part_counts):
+                if count > 0:
+                    if self.file_format == 'json' and wrote_docs:
+                        out.write(compress_bytes(b',\n', self.compression))
+                    with open(part_path, 'rb') as part:
+                        while True:
+                            chunk = part.read(1 << 20)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+                    wrote_docs = True
+                os.remove(part_path)
+            if self.file_format == 'json':
+                out.write(compress_bytes(b'\n]}}\n', self.compression))
+            elif not wrote_docs:
+                # an empty file is not a valid bzip2 or xz stream so an empty compressed piece is written instead
+                out.write(compress_bytes(b'', self.compression))
+        return file_path
+
+    def _export_collections(self):
+        """
+        Exports every collection by reading all of the _id ranges of its source collections in parallel, assembling the
+        data files, and then writing the manifest.
+        """
+        start = time.time()
+        manifest = {
+            'database': DB_NAME,
+            'created': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+            'format': self.file_format,
+            'vote_layout': self.vote_layout,
+            'compression': self.compression,
+            'collections': {}
+        }
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for name in COLLECTION_NAMES:
+                futures[name] = []
+                for source in self._get_sources(name):
+                    for query in self._get_ranges(source):
+                        part_path = path.join(
+                            self.output_dir,
+                            '.{}.part-{:04d}{}'.format(name, len(futures[name]), self.compression)
+                        )
+                        future = executor.submit(self._export_range, name, source, query, part_path)
+                        futures[name].append((part_path, source.name, query, future))
+            for name in COLLECTION_NAMES:
+                part_paths = [part_path for part_path, _, _, _ in futures[name]]
+                part_counts = [future.result() for _, _, _, future in futures[name]]
+                file_path = self._assemble_file(name, part_paths, part_counts)
+                manifest['collections'][name] = {
+                    'file': path.basename(file_path),
+                    'documents': sum(part_counts),
+                    'bytes': path.getsize(file_path),
+                    'ranges': [
+                        {'source': source_name, 'query': json.loads(json.dumps(query, default=str)), 'documents': count}
+                        for (_, source_name, query, _), count in zip(futures[name], part_counts)
+                    ]
+                }
+        manifest['seconds'] = round(time.time() - start, 3)
+        with open(path.join(self.output_dir, MANIFEST_FILE), 'w') as fp:
+            json.dump(manifest, fp, indent=2)
+
+    def _close(self):
+        self.client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Exports the Posts, Tags, and Votes collections (archived posts and votes included) so that they '
+                    'can be reloaded with phase1.py'
+    )
+    parser.add_argument('port', type=int, help='port of the MongoDB server')
+    parser.add_argument('output_dir', help='directory to write the data files and manifest to')
+    parser.add_argument('--format', choices=['jsonl', 'json'], default='jsonl',
+                        help='jsonl (one document per line) or json (the phase1 {"posts": {"row": [...]}} format)')
+    parser.add_argument('--compression', choices=['gz', 'bz2', 'xz', 'none'], default='gz')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='number of parallel cursors')
+    args = parser.parse_args()
+    ExportDocStore(
+        args.port,
+        args.output_dir,
+        file_format=args.format,
+        compression='' if args.compression == 'none' else '.' + args.compression,
+        workers=args.workers
+    )
@@ -0,0 +1,278 @@
+import cProfile
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from data_io import ReadCounter
+from utils import get_percentile
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where the memory high-water mark is only reported when tracemalloc is enabled
+    resource = None
+
+# min number of seconds between two progress lines of the same collection
+PROGRESS_INTERVAL = 1.0
+# number of allocation sites written to the tracemalloc output file
+TRACEMALLOC_TOP_N = 50
+
+
+def get_max_rss():
+    """
+    :return: int corresponding to the memory high-water mark (max resident set size) of the process in bytes, or None
+             if it is not available on this platform
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class CollectionProgress:
+    """
+    Class that tracks the progress of loading a single data file into a collection (or table): rows inserted, bytes
+    read from disk, the time spent parsing and inserting each batch, and the memory high-water mark. Progress lines are
+    printed at most every PROGRESS_INTERVAL seconds.
+    """
+
+    def __init__(self, name, file_path, stream):
+        """
+        Initializes an instance of this class.
+        :param name: name of the collection being loaded
+        :param file_path: path of the data file being read
+        :param stream: text stream to print the progress lines to (None to print nothing)
+        """
+        self.name = name
+        self.file_path = file_path
+        self.stream = stream
+        self.rows = 0
+        self.num_batches = 0
+        self.parse_seconds = 0
+        self.insert_seconds = 0
+        self.batch_latencies = []
+        self.memory_peak = None
+        self.memory_peak_source = None
+        self.reader = None
+        self.source = None
+        self.start = time.perf_counter()
+        self.seconds = 0
+        self._last_print = self.start
+
+    def get_bytes_read(self):
+        return 0 if self.reader is None else self.reader.bytes_read
+
+    def record_batch(self, num_rows, parse_seconds, insert_seconds):
+        """
+        Records a batch that has been inserted.
+        :param num_rows: number of rows in the batch
+        :param parse_seconds: seconds spent reading and parsing the rows of the batch
+        :param insert_seconds: seconds spent inserting the batch (its latency)
+        """
+        self.rows += num_rows
+        self.num_batches += 1
+        self.parse_seconds += parse_seconds
+        self.insert_seconds += insert_seconds
+        self.batch_latencies.append(insert_seconds)
+        now = time.perf_counter()
+        if now - self._last_print >= PROGRESS_INTERVAL:
+            self._last_print = now
+            # progress lines overwrite each other on a terminal
+            isatty = getattr(self.stream, 'isatty', None)
+            self._print_progress(now, end='\r' if isatty is not None and isatty() else '\n')
+
+    def _print_progress(self, now, end):
+        if self.stream is None:
+            return
+        elapsed = max(now - self.start, 1e-9)
+        self.stream.write(
+            '{}: {:,} rows ({:,.0f} rows/s), {:.1f} MB read, batch latency {:.1f} ms avg / {:.1f} ms max{}'.format(
+                self.name,
+                self.rows,
+                self.rows / elapsed,
+                self.get_bytes_read() / 1e6,
+                1000 * self.insert_seconds / max(self.num_batches, 1),
+                1000 * max(self.batch_latencies, default=0),
+                end
+            )
+        )
+        self.stream.flush()
+
+    def finish(self):
+        """
+        Records the total time and the memory high-water mark of the load and prints the final progress line.
+        """
+        now = time.perf_counter()
+        self.seconds = now - self.start
+        if tracemalloc.is_tracing():
+            self.memory_peak, self.memory_peak_source = tracemalloc.get_traced_memory()[1], 'tracemalloc'
+        else:
+            self.memory_peak, self.memory_peak_source = get_max_rss(), 'max_rss'
+        self._print_progress(now, end='\n')
+
+    def get_summary(self):
+        """
+        :return: dict summarizing the load of the collection
+        """
+        latencies = sorted(self.batch_latencies)
+        return {
+            'file': self.file_path,
+            'rows': self.rows,
+            'bytes_read': self.get_bytes_read(),
+            'seconds': self.seconds,
+            'rows_per_second': self.rows / self.seconds if self.seconds > 0 else 0,
+            'parse_seconds': self.parse_seconds,
+            'insert_seconds': self.insert_seconds,
+            'batches': self.num_batches,
+            'batch_latency_ms': {
+                'avg': 1000 * self.insert_seconds / self.num_batches if self.num_batches > 0 else 0,
+                'p50': 1000 * get_percentile(latencies, 50),
+                'p95': 1000 * get_percentile(latencies, 95),
+                'max': 1000 * max(latencies, default=0)
+            },
+            # traced python allocations with tracemalloc enabled, otherwise the max rss of the process
+            'memory_peak_bytes': self.memory_peak,
+            'memory_peak_source': self.memory_peak_source
+        }
+
+
+class IngestStats:
+    """
+    Class that instruments a phase1 load: the wall time of each stage (dropping collections, loading each collection,
+    building the search index, repairing the counters, etc.), the progress of each collection (see
+    CollectionProgress), optional cProfile and tracemalloc output files, and a machine-readable json summary so that
+    load times can be compared across releases.
+    """
+
+    def __init__(self, stream=sys.stderr, profile_path=None, tracemalloc_path=None):
+        """
+        Initializes an instance of this class.
+        :param stream: text stream to print the progress to (None to print nothing)
+        :param profile_path: path of the file to write the cProfile stats of the load to (None to not profile)
+        :param tracemalloc_path: path of the file to write the top allocation sites (by tracemalloc) to (None to not
+                                 trace allocations - tracing slows the load down considerably)
+        """
+        self.stream = stream
+        self.profile_path = profile_path
+        self.tracemalloc_path = tracemalloc_path
+        self.profiler = None
+        self.stages = []
+        self.collections = {}
+        self.created = None
+        self.start = None
+        self.seconds = 0
+        self.error = None
+
+    def begin(self):
+        """
+        Starts timing the load (and the profiler and tracemalloc if their output files were given).
+        """
+        self.created = datetime.now().isoformat()
+        if self.tracemalloc_path is not None:
+            tracemalloc.start()
+        if self.profile_path is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+
+    def end(self):
+        """
+        Stops timing the load and writes the cProfile and tracemalloc output files.
+        """
+        self.seconds = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+        if self.tracemalloc_path is not None:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(self.tracemalloc_path, 'w') as f:
+                f.write('current: {} bytes, peak: {} bytes\n\n'.format(current, peak))
+                for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP_N]:
+                    f.write(str(stat) + '\n')
+        if self.stream is not None:
+            self.stream.write('{} {:.1f} s ({})\n'.format(
+                'Done in' if self.error is None else 'Failed after',
+                self.seconds,
+                ', '.join('{} {:.1f} s'.format(name, seconds) for name, seconds in self.stages)
+            ))
+            self.stream.flush()
+
+    @contextmanager
+    def run(self):
+        """
+        Context manager that times the load between begin and end. end is called even if the load fails so that the
+        timings of the stages that ran and the profiler and tracemalloc output files are not lost (the error is
+        recorded in the summary).
+        """
+        self.begin()
+        try:
+            yield self
+        except BaseException as e:
+            self.error = repr(e)
+            raise
+        finally:
+            self.end()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that records the wall time of a stage of the load.
+        :param name: name of the stage
+        """
+        if self.stream is not None:
+            self.stream.write('{}...\n'.format(name))
+            self.stream.flush()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    @contextmanager
+    def track_collection(self, name, file_path):
+        """
+        Context manager that opens a data file for reading through a ReadCounter (pass progress.source to
+        data_io.iter_rows) and tracks the load of the collection as a stage named after it.
+        :param name: name of the collection
+        :param file_path: path of the data file
+        :return: CollectionProgress of the collection
+        """
+        with self.stage('load ' + name), open(file_path, 'rb') as raw:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            progress = CollectionProgress(name, file_path, self.stream)
+            progress.reader = ReadCounter(raw)
+            progress.source = io.BufferedReader(progress.reader)
+            try:
+                yield progress
+            finally:
+                progress.finish()
+                self.collections[name] = progress
+
+    def get_summary(self):
+        """
+        :return: dict summarizing the load (json serializable)
+        """
+        return {
+            'created': self.created,
+            'python': platform.python_version(),
+            'seconds': self.seconds,
+            'error': self.error,
+            'stages': [{'name': name, 'seconds': seconds} for name, seconds in self.stages],
+            'collections': {name: progress.get_summary() for name, progress in self.collections.items()}
+        }
+
+    def write_summary(self, summary_path):
+        """
+        Writes the summary of the load to a json file.
+        :param summary_path: path of the file to write the summary to
+        """
+        with open(summary_path, 'w') as f:
+            json.dump(self.get_summary(), f, indent=2)
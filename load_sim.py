@@ -0,0 +1,324 @@
+import argparse
+import json
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pymongo import MongoClient
+from db_manager import DBManager, DB_NAME, QUESTION_TYPE_ID, ID_COLLATION
+from utils import get_percentile
+from vote_buckets import get_vote_layout, BUCKETED_LAYOUT, BUCKETS_COLLECTION, FLAT_VOTES_PIPELINE
+
+# relative frequency of each action taken by a simulated user
+ACTION_WEIGHTS = {'search': 40, 'view': 30, 'answer': 10, 'vote': 20}
+DEFAULT_USER_COUNTS = [1, 2, 4, 8, 16]
+DEFAULT_DURATION = 10
+# simulated users act on behalf of user ids drawn from a shared pool so that two simulated users can act as the same
+# user at the same time (which is what exposes double votes)
+DEFAULT_ID_POOL_SIZE = 20
+SIM_USER_ID_BASE = 900000000
+# number of questions sampled for the keywords to search for (only these questions are voted on)
+QUESTION_SAMPLE_SIZE = 200
+SIM_ANSWER_BODY = 'load_sim answer'
+
+
+def simulate_user(port, user_index, duration, id_pool, keywords, question_ids, db_options):
+    """
+    Runs one simulated user against the MongoDB server for duration seconds. The user repeatedly picks an action
+    (weighted by ACTION_WEIGHTS) the way a person would use the screens: searching for a keyword, viewing one of the
+    results, answering the viewed question, or voting on it (after checking eligibility, like BaseScreen does).
+    Only the sampled questions are viewed (whenever the results include one) and voted on, so that the audit only
+    has to snapshot those. This is a module level function so that it can be run in a separate process.
+    :param port: int corresponding to the port to connect to the MongoDB server at
+    :param user_index: index of the simulated user (used to seed its random number generator)
+    :param duration: number of seconds to run for
+    :param id_pool: list of ints corresponding to the user ids the simulated user acts as
+    :param keywords: list of keywords to search for
+    :param question_ids: list of the Id values of the sampled questions
+    :param db_options: dict of keyword arguments to create the DBManager with
+    :return: dict containing the latencies (in seconds) of each action, the number of errors (and how many times each
+             error occurred), the number of votes that were added per post Id, and the document cache stats
+    """
+    rng = random.Random(user_index)
+    # the indexes have already been set up by LoadSimulator
+    db_manager = DBManager(port, create_indexes=False, **db_options)
+    question_ids = set(question_ids)
+    actions, weights = list(ACTION_WEIGHTS), list(ACTION_WEIGHTS.values())
+    latencies = {action: [] for action in actions}
+    votes_added = {}
+    errors = 0
+    error_counts = {}
+    results = []
+    question = None
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        action = rng.choices(actions, weights)[0]
+        if action != 'search' and len(results) == 0:
+            action = 'search'
+        if action in ['answer', 'vote'] and question is None:
+            action = 'view'
+        if action == 'vote' and question['Id'] not in question_ids:
+            action = 'view'
+        start = time.perf_counter()
+        try:
+            if action == 'search':
+                results = db_manager.get_search_results(rng.choice(keywords))
+            elif action == 'view':
+                sampled = [result for result in results if result['Id'] in question_ids]
+                question = db_manager.increment_view_count(rng.choice(sampled or results))
+            elif action == 'answer':
+                future = db_manager.add_answer(question['Id'], SIM_ANSWER_BODY, rng.choice(id_pool))
+                future.result()
+            else:
+                user_id = rng.choice(id_pool)
+                if db_manager.check_vote_eligibility(question, user_id):
+                    db_manager.add_vote(question, user_id).result()
+                    votes_added[question['Id']] = votes_added.get(question['Id'], 0) + 1
+        except Exception as e:
+            errors += 1
+            error = '{}: {}'.format(type(e).__name__, e)
+            error_counts[error] = error_counts.get(error, 0) + 1
+            continue
+        latencies[action].append(time.perf_counter() - start)
+    stats = db_manager.get_cache_stats()
+    db_manager.close()
+    return {
+        'latencies': latencies,
+        'errors': errors,
+        'error_counts': error_counts,
+        'votes_added': votes_added,
+        'cache': stats
+    }
+
+
+class LoadSimulator:
+    """
+    Class that runs increasing numbers of concurrent simulated users (as threads or processes) against a local MongoDB
+    server and reports the throughput and latency percentiles of each run along with an audit of the data the run
+    left behind (duplicate Ids, double votes, and drift between the Score of a post and the number of votes on it).
+    The simulated users write answers and votes, so this should only be run against a scratch database.
+    """
+
+    def __init__(self, port, user_counts=None, duration=DEFAULT_DURATION, use_processes=False,
+                 id_pool_size=DEFAULT_ID_POOL_SIZE, db_options=None):
+        """
+        Initializes an instance of this class.
+        :param port: int corresponding to the port to connect to the MongoDB server at
+        :param user_counts: list of ints corresponding to the numbers of concurrent users to run with
+        :param duration: number of seconds each run lasts
+        :param use_processes: True to run each simulated user in its own process, False to use threads
+        :param id_pool_size: number of distinct user ids that the simulated users share
+        :param db_options: dict of keyword arguments to create each user's DBManager with
+        """
+        self.port = port
+        self.user_counts = DEFAULT_USER_COUNTS if user_counts is None else user_counts
+        self.duration = duration
+        self.use_processes = use_processes
+        self.id_pool = [SIM_USER_ID_BASE + i for i in range(id_pool_size)]
+        self.db_options = {} if db_options is None else db_options
+        self.client = MongoClient(port=port)
+        self.db = self.client[DB_NAME]
+        self.vote_layout = get_vote_layout(self.db)
+        self.question_ids, self.keywords = self._sample_questions()
+        # the indexes are set up once here rather than by every simulated user's DBManager
+        DBManager(port).close()
+
+    def _sample_questions(self):
+        """
+        :return: tuple of list, list corresponding to the Id values of a random sample of questions and the keywords
+                 taken from their titles
+        """
+        pipeline = [
+            {'$match': {'PostTypeId': QUESTION_TYPE_ID}},
+            {'$sample': {'size': QUESTION_SAMPLE_SIZE}},
+            {'$project': {'Id': 1, 'Title': 1}}
+        ]
+        question_ids = []
+        keywords = set()
+        for question in self.db['Posts'].aggregate(pipeline):
+            question_ids.append(question['Id'])
+            keywords.update(word.lower() for word in re.findall(r'\w{3,}', question.get('Title') or ''))
+        assert len(keywords) > 0, 'the Posts collection does not contain any questions with titles to search for'
+        return sorted(question_ids), sorted(keywords)
+
+    def _aggregate_votes(self, pipeline):
+        """
+        Runs an aggregation over the votes as if they were stored one document per vote (bucketed votes are unwound
+        first).
+        :param pipeline: list of aggregation stages
+        :return: list of the results
+        """
+        if self.vote_layout == BUCKETED_LAYOUT:
+            return list(self.db[BUCKETS_COLLECTION].aggregate(FLAT_VOTES_PIPELINE + pipeline, allowDiskUse=True))
+        return list(self.db['Votes'].aggregate(pipeline, allowDiskUse=True))
+
+    def _get_score_snapshot(self, post_ids):
+        """
+        :param post_ids: list of post Id values
+        :return: tuple of dict, dict mapping each post Id to its Score and to the number of votes on it respectively
+        """
+        posts = self.db['Posts'].find({'Id': {'$in': post_ids}}, {'Id': 1, 'Score': 1}, collation=ID_COLLATION)
+        scores = {post['Id']: post.get('Score', 0) for post in posts}
+        vote_counts_pipeline = [
+            {'$match': {'PostId': {'$in': post_ids}}},
+            {'$group': {'_id': '$PostId', 'num_votes': {'$sum': 1}}}
+        ]
+        vote_counts = {res['_id']: res['num_votes'] for res in self._aggregate_votes(vote_counts_pipeline)}
+        return scores, vote_counts
+
+    def _count_duplicates(self, collection_name, group_key, match=None):
+        """
+        :param collection_name: name of the collection to check ('Posts' or 'Votes')
+        :param group_key: the field (or dict of fields) that should be unique
+        :param match: optional filter restricting the documents that are checked
+        :return: int corresponding to the number of documents beyond the first that share a value of group_key
+        """
+        pipeline = [] if match is None else [{'$match': match}]
+        pipeline += [
+            {'$group': {'_id': group_key, 'n': {'$sum': 1}}},
+            {'$match': {'n': {'$gt': 1}}},
+            {'$group': {'_id': None, 'extra': {'$sum': {'$subtract': ['$n', 1]}}}}
+        ]
+        if collection_name == 'Votes':
+            res = self._aggregate_votes(pipeline)
+        else:
+            res = list(self.db[collection_name].aggregate(pipeline, allowDiskUse=True))
+        return 0 if len(res) == 0 else res[0]['extra']
+
+    def _audit(self, before, votes_added):
+        """
+        Audits the database after a run.
+        :param before: tuple of dicts returned by _get_score_snapshot before the run (for the sampled questions)
+        :param votes_added: dict mapping each post Id that was voted on to the number of votes that were added to it
+        :return: dict containing the number of duplicate post Ids, duplicate vote Ids, double votes by the simulated
+                 users, and the number of posts (and total amount) by which the Score changed by a different amount
+                 than the number of votes on the post
+        """
+        scores_before, votes_before = before
+        scores_after, votes_after = self._get_score_snapshot(list(votes_added))
+        drifted_posts = 0
+        total_drift = 0
+        for post_id in votes_added:
+            score_delta = scores_after.get(post_id, 0) - scores_before.get(post_id, 0)
+            votes_delta = votes_after.get(post_id, 0) - votes_before.get(post_id, 0)
+            if score_delta != votes_delta:
+                drifted_posts += 1
+                total_drift += abs(score_delta - votes_delta)
+        return {
+            'duplicate_post_ids': self._count_duplicates('Posts', '$Id'),
+            'duplicate_vote_ids': self._count_duplicates('Votes', '$Id'),
+            'double_votes': self._count_duplicates(
+                'Votes',
+                {'PostId': '$PostId', 'UserId': '$UserId'},
+                match={'UserId': {'$in': [str(user_id) for user_id in self.id_pool]}}
+            ),
+            'score_drift_posts': drifted_posts,
+            'score_drift_total': total_drift
+        }
+
+    def _run_level(self, num_users):
+        """
+        Runs num_users simulated users concurrently and then audits the database.
+        :param num_users: number of concurrent simulated users
+        :return: dict containing the results of the run
+        """
+        # only the sampled questions are voted on so only their Scores and vote counts are snapshotted
+        before = self._get_score_snapshot(self.question_ids)
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        start = time.perf_counter()
+        with executor_class(max_workers=num_users) as executor:
+            futures = [
+                executor.submit(simulate_user, self.port, i, self.duration, self.id_pool, self.keywords,
+                                self.question_ids, self.db_options)
+                for i in range(num_users)
+            ]
+            user_results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        latencies = {action: [] for action in ACTION_WEIGHTS}
+        votes_added = {}
+        error_counts = {}
+        for res in user_results:
+            for error, n in res['error_counts'].items():
+                error_counts[error] = error_counts.get(error, 0) + n
+            for action, values in res['latencies'].items():
+                latencies[action] += values
+            for post_id, n in res['votes_added'].items():
+                votes_added[post_id] = votes_added.get(post_id, 0) + n
+        all_latencies = sorted(value for values in latencies.values() for value in values)
+        cache_hits = sum(res['cache']['hits'] for res in user_results)
+        cache_lookups = cache_hits + sum(res['cache']['misses'] for res in user_results)
+        return {
+            'users': num_users,
+            'ops': len(all_latencies),
+            'errors': sum(res['errors'] for res in user_results),
+            'error_counts': error_counts,
+            'throughput': len(all_latencies) / elapsed,
+            'latency_ms': self._summarize(all_latencies),
+            'action_latency_ms': {action: self._summarize(sorted(values)) for action, values in latencies.items()},
+            'cache_hit_rate': 0 if cache_lookups == 0 else cache_hits / cache_lookups,
+            'audit': self._audit(before, votes_added)
+        }
+
+    @staticmethod
+    def _summarize(sorted_latencies):
+        return {
+            'count': len(sorted_latencies),
+            'p50': get_percentile(sorted_latencies, 50) * 1000,
+            'p95': get_percentile(sorted_latencies, 95) * 1000,
+            'p99': get_percentile(sorted_latencies, 99) * 1000
+        }
+
+    def run(self):
+        """
+        Runs every concurrency level in turn, printing a line of results after each one.
+        :return: list of dicts containing the results of each level
+        """
+        print('{:>6} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8} {:>8} {:>8} {:>6}'.format(
+            'users', 'ops', 'errors', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'dup pid', 'dup vid', 'dbl vote', 'drift'
+        ))
+        levels = []
+        for num_users in self.user_counts:
+            res = self._run_level(num_users)
+            audit = res['audit']
+            print('{:>6} {:>8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>8} {:>8} {:>8} {:>6}'.format(
+                res['users'], res['ops'], res['errors'], res['throughput'], res['latency_ms']['p50'],
+                res['latency_ms']['p95'], res['latency_ms']['p99'], audit['duplicate_post_ids'],
+                audit['duplicate_vote_ids'], audit['double_votes'], audit['score_drift_total']
+            ))
+            for error, n in sorted(res['error_counts'].items(), key=lambda item: -item[1]):
+                print('{:>6} x {}'.format(n, error))
+            levels.append(res)
+        return levels
+
+    def close(self):
+        self.client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Runs concurrent simulated users against DBManager and audits the results (writes answers and '
+                    'votes, so only run it against a scratch database)'
+    )
+    parser.add_argument('port', type=int, help='port of the MongoDB server')
+    parser.add_argument('--users', default=','.join(str(n) for n in DEFAULT_USER_COUNTS),
+                        help='comma separated numbers of concurrent users to run with')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds per concurrency level')
+    parser.add_argument('--processes', action='store_true', help='run users in processes instead of threads')
+    parser.add_argument('--id-pool', type=int, default=DEFAULT_ID_POOL_SIZE,
+                        help='number of user ids shared by the simulated users')
+    parser.add_argument('--write-queue', action='store_true', help='create the DBManagers with the write queue')
+    parser.add_argument('--json', help='file to write the full results to')
+    args = parser.parse_args()
+    simulator = LoadSimulator(
+        args.port,
+        user_counts=[int(n) for n in args.users.split(',')],
+        duration=args.duration,
+        use_processes=args.processes,
+        id_pool_size=args.id_pool,
+        db_options={'use_write_queue': args.write_queue}
+    )
+    results = simulator.run()
+    simulator.close()
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
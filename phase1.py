@@ -1,65 +1,232 @@
-import json
+import argparse
+import os
+import sqlite3
 import sys
-from os import path
-from pymongo import MongoClient
+import time
+from data_io import find_data_file, iter_rows, iter_batches
+from storage import is_port
+from ingest_stats import IngestStats
+from text_fields import add_text_fields, create_text_index
+import sqlite_store
 
 DB_NAME = '291db'
-POSTS_FILE = 'Posts.json'
-TAGS_FILE = 'Tags.json'
-VOTES_FILE = 'Votes.json'
+COLLECTION_NAMES = ['Posts', 'Tags', 'Votes']
+INSERT_BATCH_SIZE = 1000
+
+
+def load_data_file(stats, name, file_path, insert_batch, prepare_row=None):
+    """
+    Streams the documents in a data file in batches of INSERT_BATCH_SIZE (so that the whole file is never held in
+    memory) and passes each batch to insert_batch, recording the time spent parsing and inserting each batch.
+    :param stats: IngestStats instance to record the progress of the load with
+    :param name: name of the collection (or table) being loaded
+    :param file_path: path of the data file to read the documents from
+    :param insert_batch: function that inserts a list of documents
+    :param prepare_row: function applied to each document before it is inserted (counted as parse time)
+    """
+    with stats.track_collection(name, file_path) as progress:
+        rows = iter_rows(file_path, progress.source)
+        if prepare_row is not None:
+            rows = map(prepare_row, rows)
+        start = time.perf_counter()
+        for batch in iter_batches(rows, INSERT_BATCH_SIZE):
+            parsed = time.perf_counter()
+            insert_batch(batch)
+            inserted = time.perf_counter()
+            progress.record_batch(len(batch), parsed - start, inserted - parsed)
+            start = inserted
+
+
+def get_derived_collection_names():
+    """
+    :return: list of the names of the collections derived from the Posts, Tags, and Votes collections (which are
+             dropped along with them)
+    """
+    from search_engine import GRAMS_COLLECTION
+    from vote_buckets import (BUCKETS_COLLECTION, USER_VOTE_COUNTS_COLLECTION, POST_VOTE_COUNTS_COLLECTION,
+                              METADATA_COLLECTION)
+    from views import VIEWS_COLLECTION
+    from archive import ARCHIVED_POSTS_COLLECTION, ARCHIVED_VOTES_COLLECTION
+    return [
+        GRAMS_COLLECTION,
+        BUCKETS_COLLECTION,
+        USER_VOTE_COUNTS_COLLECTION,
+        POST_VOTE_COUNTS_COLLECTION,
+        METADATA_COLLECTION,
+        VIEWS_COLLECTION,
+        ARCHIVED_POSTS_COLLECTION,
+        ARCHIVED_VOTES_COLLECTION
+    ]
 
 
 class BuildDocStore:
     """
     Class that connects to the specified MongoDB server, creates a database named "291db" (if it does not exist), and 
-    then creates three collections named Posts, Tags, and Votes.
+    then creates three collections named Posts, Tags, and Votes. pymongo and the MongoDB only modules are imported
+    when they are used so that BuildSQLiteStore works without pymongo installed.
     """
 
-    def __init__(self, port):
-        self.client = MongoClient(port=port)
-        self.db = self.client[DB_NAME]
-        self._drop_collections()
-        self.posts, self.tags, self.votes = self.db['Posts'], self.db['Tags'], self.db['Votes']
-        self._populate_collections()
-        self._close()
+    def __init__(self, port, data_dir='.', stats=None):
+        """
+        Finds the data files for the Posts, Tags, and Votes collections in data_dir (each may be json, json lines, or a
+        Stack Exchange xml dump - optionally compressed with gzip, bzip2, or xz, see data_io.find_data_file) and then
+        (re)creates and populates the collections.
+        :param port: int corresponding to the port to connect to the MongoDB server at
+        :param data_dir: path of the directory containing the data files (current directory by default)
+        :param stats: ingest_stats.IngestStats instance to instrument the load with (one that prints progress to stderr
+                      by default)
+        """
+        from pymongo import MongoClient
+        self.stats = IngestStats() if stats is None else stats
+        with self.stats.run():
+            self.data_files = {name: find_data_file(data_dir, name) for name in COLLECTION_NAMES}
+            self.client = MongoClient(port=port)
+            try:
+                self.db = self.client[DB_NAME]
+                with self.stats.stage('drop collections'):
+                    self._drop_collections()
+                self.posts, self.tags, self.votes = self.db['Posts'], self.db['Tags'], self.db['Votes']
+                self._populate_collections()
+            finally:
+                self._close()
 
     def _drop_collections(self):
         """
-        Drops the three collections named Posts, Tags, and Votes if they already exist.
+        Drops the three collections named Posts, Tags, and Votes if they already exist, along with the collections
+        derived from them (the n-gram index, the bucketed vote layout, the metadata, the hot question views, and the
+        archive).
         """
-        assert path.exists(POSTS_FILE), 'no "Posts.json" file exists in the current directory'
-        assert path.exists(TAGS_FILE), 'no "Tags.json" file exists in the current directory'
-        assert path.exists(VOTES_FILE), 'no "Votes.json" file exists in the current directory'
-        coll_names = ['Posts', 'Tags', 'Votes']
+        for name, file_path in self.data_files.items():
+            assert file_path is not None, 'no data file for the {} collection exists in the data directory'.format(name)
         coll_list = self.db.list_collection_names()
-        for name in coll_names:
+        for name in COLLECTION_NAMES + get_derived_collection_names():
             if name in coll_list:
                 self.db.drop_collection(name)
 
+    def _populate_collection(self, collection, file_path):
+        """
+        Streams the documents in the data file into the specified collection (see load_data_file). The plain text
+        fields of the posts (see text_fields.add_text_fields) are derived as they are loaded.
+        :param collection: pymongo collection to populate
+        :param file_path: path of the data file to read the documents from
+        """
+        load_data_file(
+            self.stats,
+            collection.name,
+            file_path,
+            lambda batch: collection.insert_many(batch, ordered=False),
+            add_text_fields if collection.name == 'Posts' else None
+        )
+
     def _populate_collections(self):
         """
-        Populates the Posts, Tags, and Votes collections with the data in Posts.json, Tags.json, and Votes.json
-        respectively.
+        Populates the Posts, Tags, and Votes collections with the data in their respective data files, builds the
+        n-gram search index for the questions, recomputes the AnswerCount and LastActivityDate of every question, and
+        creates the $text index of the questions and the indexes of the hot question views.
         """
-        with open(POSTS_FILE) as p:
-            p_data = json.load(p)
-        with open(TAGS_FILE) as t:
-            t_data = json.load(t)
-        with open(VOTES_FILE) as v:
-            v_data = json.load(v)
-        p_res = self.posts.insert_many(p_data['posts']['row'], ordered=False)
-        t_res = self.tags.insert_many(t_data['tags']['row'], ordered=False)
-        v_res = self.votes.insert_many(v_data['votes']['row'], ordered=False)
+        from search_engine import NGramSearchEngine, GRAMS_COLLECTION
+        from counters import repair_question_counters
+        from views import HotQuestionViews
+        self._populate_collection(self.posts, self.data_files['Posts'])
+        self._populate_collection(self.tags, self.data_files['Tags'])
+        self._populate_collection(self.votes, self.data_files['Votes'])
+        with self.stats.stage('build search index'):
+            NGramSearchEngine(self.posts, self.db[GRAMS_COLLECTION]).build()
+        with self.stats.stage('repair counters'):
+            repair_question_counters(self.posts)
+        with self.stats.stage('create indexes'):
+            create_text_index(self.posts)
+            HotQuestionViews(self.db).create_indexes()
 
     def _close(self):
         self.client.close()
 
 
+class BuildSQLiteStore:
+    """
+    Class that (re)creates a SQLite database file with the tables that sqlite_store.SQLiteManager works with (posts,
+    tags, and votes) and populates them from the same data files as BuildDocStore.
+    """
+
+    def __init__(self, db_path, data_dir='.', stats=None):
+        """
+        Finds the data files for the Posts, Tags, and Votes tables in data_dir (see BuildDocStore) and then (re)creates
+        the database file and populates its tables.
+        :param db_path: path of the SQLite database file to create (replaced if it already exists)
+        :param data_dir: path of the directory containing the data files (current directory by default)
+        :param stats: ingest_stats.IngestStats instance to instrument the load with (one that prints progress to stderr
+                      by default)
+        """
+        self.stats = IngestStats() if stats is None else stats
+        with self.stats.run():
+            self.data_files = {name: find_data_file(data_dir, name) for name in COLLECTION_NAMES}
+            for name, file_path in self.data_files.items():
+                assert file_path is not None, \
+                    'no data file for the {} collection exists in the data directory'.format(name)
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            self.conn = sqlite3.connect(db_path)
+            try:
+                sqlite_store.create_schema(self.conn)
+                self._populate_tables()
+            finally:
+                self._close()
+
+    def _populate_table(self, table, file_path):
+        """
+        Streams the rows in the data file into the specified table (see load_data_file), deriving the plain text fields
+        of the posts as they are loaded.
+        :param table: one of 'posts', 'tags', or 'votes'
+        :param file_path: path of the data file to read the rows from
+        """
+        load_data_file(
+            self.stats,
+            table,
+            file_path,
+            lambda batch: sqlite_store.insert_documents(self.conn, table, batch),
+            add_text_fields if table == 'posts' else None
+        )
+
+    def _populate_tables(self):
+        """
+        Populates the posts, tags, and votes tables with the data in their respective data files, recomputes the
+        AnswerCount and LastActivityDate of every question, builds the full text index of the questions, and seeds the
+        Id sequences - all in a single transaction.
+        """
+        with self.conn:
+            for name in COLLECTION_NAMES:
+                self._populate_table(name.lower(), self.data_files[name])
+            with self.stats.stage('repair counters'):
+                sqlite_store.repair_question_counters(self.conn)
+            with self.stats.stage('build search index'):
+                sqlite_store.build_search_index(self.conn)
+            sqlite_store.seed_id_sequences(self.conn)
+
+    def _close(self):
+        self.conn.close()
+
+
 if __name__ == '__main__':
-    assert (len(sys.argv) == 2), 'please enter the correct number of arguments - this program should be run using ' \
-                                 '"python3 phase1.py PORT_NUMBER"'
+    parser = argparse.ArgumentParser(description='Creates and populates the Posts, Tags, and Votes collections (or the '
+                                                 'tables of a SQLite database file) from the data files')
+    parser.add_argument('target', help='port of the MongoDB server or path of the SQLite database file to create')
+    parser.add_argument('data_dir', nargs='?', default='.', help='directory containing the data files')
+    parser.add_argument('--summary', metavar='FILE', help='write a json summary of the load to FILE')
+    parser.add_argument('--profile', metavar='FILE', help='write the cProfile stats of the load to FILE')
+    parser.add_argument('--tracemalloc', metavar='FILE', help='write the top allocation sites of the load to FILE')
+    parser.add_argument('--quiet', action='store_true', help='do not print the progress of the load')
+    args = parser.parse_args()
+    ingest_stats = IngestStats(
+        stream=None if args.quiet else sys.stderr,
+        profile_path=args.profile,
+        tracemalloc_path=args.tracemalloc
+    )
     try:
-        p = int(sys.argv[1])
-        BuildDocStore(p)
-    except ValueError:
-        assert False, 'ValueError - please ensure that the port number specified is an integer'
+        if is_port(args.target):
+            BuildDocStore(int(args.target), args.data_dir, ingest_stats)
+        else:
+            BuildSQLiteStore(args.target, args.data_dir, ingest_stats)
+    finally:
+        # a failed load still gets a summary (with the stages that ran and the error)
+        if args.summary is not None:
+            ingest_stats.write_summary(args.summary)
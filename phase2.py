@@ -1,6 +1,6 @@
 import sys
 from screens import *
-from db_manager import DBManager
+from storage import open_storage
 
 DB_NAME = '291db'
 
@@ -10,30 +10,29 @@ class Driver:
     Runs phase 2.
     """
 
-    def __init__(self, port):
+    def __init__(self, target):
         """
-        Gets an instance of the DBManager class which provides access to the MongoDB server at the specified port.
-        :param port: command line argument specifying the port to connect to the MongoDB server at
+        Gets the storage backend that the screens work with - a DBManager which provides access to the MongoDB server
+        at the specified port or a SQLiteManager which provides access to the specified SQLite database file.
+        :param target: command line argument specifying the port to connect to the MongoDB server at or the path of
+                       the SQLite database file
         """
-        self.db_manager = DBManager(port)
+        self.db_manager = open_storage(target)
 
     def run(self):
         """
         Runs the start screen where the user can optionally specify a user id then runs the main menu screen from which
-        all the functionality of the program can be accessed. Closes the MongoDB client represented by the DBManager
-        instance and clears the shell screen upon exiting.
+        all the functionality of the program can be accessed. Closes the storage backend and clears the shell screen
+        upon exiting.
         """
         user_id, report_info = StartScreen(self.db_manager).run()
         MainMenu(self.db_manager, user_id, report_info).run()
         self.db_manager.close()
         clear_screen()
+        flush_output()
 
 
 if __name__ == '__main__':
     assert (len(sys.argv) == 2), 'please enter the correct number of arguments - this program should be run using ' \
-                                 '"python3 phase2.py PORT_NUMBER"'
-    try:
-        port_no = int(sys.argv[1])
-        Driver(port_no).run()
-    except ValueError:
-        assert False, 'ValueError - please ensure that the port number specified is an integer'
+                                 '"python3 phase2.py PORT_NUMBER|SQLITE_FILE"'
+    Driver(sys.argv[1]).run()
@@ -1,13 +1,18 @@
-import os
+import terminal
+from terminal import echo, prompt, flush_output
+from text_fields import BODY_TEXT_FIELD, BODY_PREVIEW_FIELD, PREVIEW_LENGTH
 
 MAX_PER_PAGE = 10
+# derived fields of the posts that are not shown when all the fields of a post are displayed
+HIDDEN_FIELDS = [BODY_TEXT_FIELD, BODY_PREVIEW_FIELD]
 
 
 def clear_screen():
     """
-    Clears the current shell screen.
+    Clears the current shell screen. The clear is buffered along with everything the next screen prints (see
+    terminal.Renderer) so that a screen transition is a single write with no subprocess.
     """
-    os.system('clear')
+    terminal.clear_screen()
 
 
 def select_from_menu(valid_inputs):
@@ -19,11 +24,11 @@ def select_from_menu(valid_inputs):
     :param valid_inputs: list including all the inputs that should be considered valid
     :return: a string corresponding to the users valid selection
     """
-    selection = input('> ')
+    selection = prompt('> ')
     while selection.lower() not in valid_inputs:
-        print('"{}" is an invalid selection, please enter a valid selection from the menu above.'
-              .format(selection))
-        selection = input('> ')
+        echo('"{}" is an invalid selection, please enter a valid selection from the menu above.'
+             .format(selection))
+        selection = prompt('> ')
     return selection.lower()
 
 
@@ -58,16 +63,16 @@ class BaseScreen:
         :param user_id: int representing user id of user or None if they did not specify one
         """
         clear_screen()
-        print('ADD VOTE')
+        echo('ADD VOTE')
         if user_id is not None:
             eligible = self.db_manager.check_vote_eligibility(post_data, user_id)
             if not eligible:
-                input('\nInvalid action requested...\n'
-                      'You have already voted on this post so you are not eligible to vote again - please enter any key'
-                      ' to return to the main menu:\n> ')
+                prompt('\nInvalid action requested...\n'
+                       'You have already voted on this post so you are not eligible to vote again - please enter any '
+                       'key to return to the main menu:\n> ')
                 return
         self.db_manager.add_vote(post_data, user_id)
-        input('\nSuccessfully added your vote to the post - please enter any key to return to the main menu:\n> ')
+        prompt('\nSuccessfully added your vote to the post - please enter any key to return to the main menu:\n> ')
 
     def run(self):
         """
@@ -89,10 +94,10 @@ class StartScreen(BaseScreen):
         BaseScreen.__init__(self, db_manager=db_manager)
 
     def _setup(self):
-        print('START SCREEN')
-        print('\nWould you like to provide a user id?\n'
-              '\t[1] Yes\n'
-              '\t[2] No')
+        echo('START SCREEN')
+        echo('\nWould you like to provide a user id?\n'
+             '\t[1] Yes\n'
+             '\t[2] No')
 
     def run(self):
         """
@@ -109,13 +114,13 @@ class StartScreen(BaseScreen):
         selection = select_from_menu(valid_inputs)
         if selection == '1':
             try:
-                user_id = int(input('\nPlease enter the user id that you would like to use:\n> '))
+                user_id = int(prompt('\nPlease enter the user id that you would like to use:\n> '))
                 invalid = False
             except ValueError:
                 invalid = True
             while invalid:
                 try:
-                    user_id = int(input('Invalid input - user id must be numeric. Please try again:\n> '))
+                    user_id = int(prompt('Invalid input - user id must be numeric. Please try again:\n> '))
                     invalid = False
                 except ValueError:
                     invalid = True
@@ -150,11 +155,11 @@ class MainMenu(BaseScreen):
     def _setup(self):
         """
         Displays a report if a user id was specified and displays the main menu options (post a question, search for
-        questions, end program).
+        questions, browse popular questions, end program).
         """
-        print('MAIN MENU\n\nWelcome {}!'.format('anonymous' if self.user_id is None else self.user_id))
+        echo('MAIN MENU\n\nWelcome {}!'.format('anonymous' if self.user_id is None else self.user_id))
         if len(self.report_info) == 5:
-            print(
+            echo(
                 '\nNumber of owned questions: {}\n'
                 'Average score for owned questions: {}\n'
                 'Number of owned answers: {}\n'
@@ -167,10 +172,11 @@ class MainMenu(BaseScreen):
                     self.report_info[4]
                 )
             )
-        print('\nPlease select the task you would like to perform:\n'
-              '\t[1] Post a question\n'
-              '\t[2] Search for questions\n'
-              '\t[e] End program')
+        echo('\nPlease select the task you would like to perform:\n'
+             '\t[1] Post a question\n'
+             '\t[2] Search for questions\n'
+             '\t[3] Browse popular questions\n'
+             '\t[e] End program')
 
     def _refresh(self):
         """
@@ -188,16 +194,18 @@ class MainMenu(BaseScreen):
 
     def run(self):
         """
-        Gives the user the option to either post a question or search for questions and carries out the corresponding
-        action. Repeats until the user decides to end the program.
+        Gives the user the option to either post a question, search for questions, or browse popular questions and
+        carries out the corresponding action. Repeats until the user decides to end the program.
         """
-        valid_inputs = ['1', '2', 'e']
+        valid_inputs = ['1', '2', '3', 'e']
         while True:
             selection = select_from_menu(valid_inputs)
             if selection == '1':
                 PostQuestion(self.db_manager, self.user_id).run()
             elif selection == '2':
                 SearchForQuestions(self.db_manager, self.user_id).run()
+            elif selection == '3':
+                BrowsePopularQuestions(self.db_manager, self.user_id).run()
             elif selection == 'e':
                 break
             self._refresh()
@@ -218,7 +226,7 @@ class PostQuestion(BaseScreen):
         BaseScreen.__init__(self, db_manager=db_manager)
 
     def _setup(self):
-        print('POST QUESTION')
+        echo('POST QUESTION')
 
     def run(self):
         """
@@ -227,23 +235,23 @@ class PostQuestion(BaseScreen):
         """
         valid_inputs = ['1', '2']
         tags = []
-        title = input('\nPlease enter the title of the question you would like to post:\n> ')
-        body = input('\nPlease enter the body of the question you would like to post:\n> ')
-        print('\nWould you like to add tag(s)?\n'
-              '\t[1] Yes\n'
-              '\t[2] No')
+        title = prompt('\nPlease enter the title of the question you would like to post:\n> ')
+        body = prompt('\nPlease enter the body of the question you would like to post:\n> ')
+        echo('\nWould you like to add tag(s)?\n'
+             '\t[1] Yes\n'
+             '\t[2] No')
         selection = select_from_menu(valid_inputs)
         while selection == '1':
-            tag = input('Enter the tag you would like to add:\n> ')
+            tag = prompt('Enter the tag you would like to add:\n> ')
             tags.append(tag)
-            print('\nWould you like to add another tag?\n'
-                  '\t[1] Yes\n'
-                  '\t[2] No')
+            echo('\nWould you like to add another tag?\n'
+                 '\t[1] Yes\n'
+                 '\t[2] No')
             selection = select_from_menu(valid_inputs)
         self.db_manager.add_question(title, body, tags, self.user_id)
         clear_screen()
-        print('POST QUESTION')
-        input('\nQuestion successfully posted - please enter any key to return to the main menu:\n> ')
+        echo('POST QUESTION')
+        prompt('\nQuestion successfully posted - please enter any key to return to the main menu:\n> ')
 
 
 class SearchForQuestions(BaseScreen):
@@ -262,16 +270,16 @@ class SearchForQuestions(BaseScreen):
         BaseScreen.__init__(self, db_manager=db_manager)
 
     def _setup(self):
-        print('SEARCH FOR QUESTIONS')
+        echo('SEARCH FOR QUESTIONS')
 
     def run(self):
         """
         Allows the user to provide one or more space separated keywords which are passed to the SearchResults screen
         which retrieves the results.
         """
-        keywords = input('\nPlease enter a space separated list of one or more keywords:\n> ')
+        keywords = prompt('\nPlease enter a space separated list of one or more keywords:\n> ')
         while len(keywords) == 0:
-            keywords = input('Invalid input - you must enter at least one keyword:\n> ')
+            keywords = prompt('Invalid input - you must enter at least one keyword:\n> ')
         SearchResults(self.db_manager, self.user_id, keywords).run()
 
 
@@ -290,11 +298,14 @@ class SearchResults(BaseScreen):
         """
         self.valid_inputs = []
         self.user_id = user_id
+        self.keywords = keywords
         BaseScreen.__init__(self, db_manager=db_manager)
         self.search_res = self.db_manager.get_search_results(keywords)
+        # the archived questions are only searched if the user asks for them once the results have run out
+        self.can_search_archive = self.db_manager.has_archive()
 
     def _setup(self):
-        print('SEARCH RESULTS')
+        echo('SEARCH RESULTS')
 
     def _display_search_results(self, current_ind):
         """
@@ -312,7 +323,7 @@ class SearchResults(BaseScreen):
                 return None
             self.valid_inputs.append(str(ind + 1))
             q = self.search_res[ind]
-            print(
+            echo(
                 '\n[{}] {}\n'
                 '\tCreationDate: {}\tScore: {}\tAnswerCount: {}'.format(
                     ind + 1, q['Title'], q['CreationDate'], q['Score'], q['AnswerCount']
@@ -329,27 +340,99 @@ class SearchResults(BaseScreen):
         while True:
             num_printed = self._display_search_results(current_ind)
             if (num_printed is None) or (current_ind + num_printed == len(self.search_res)):
-                print(
+                echo(
                     '\nPlease select the action that you would like to take:\n'
-                    '\t[#] Enter the number corresponding to the question that you would like to perform an action on\n'
-                    '\t[r] Return to the main menu'
+                    '\t[#] Enter the number corresponding to the question that you would like to perform an action on'
                 )
-                selection = select_from_menu(self.valid_inputs + ['r'])
+                if self.can_search_archive:
+                    echo('\t[a] Also search the archived questions')
+                echo('\t[r] Return to the main menu')
+                selection = select_from_menu(self.valid_inputs + (['a', 'r'] if self.can_search_archive else ['r']))
+                if selection == 'a':
+                    self.search_res = self.db_manager.get_search_results(self.keywords, include_archive=True)
+                    self.can_search_archive = False
             else:
                 current_ind += num_printed
-                print(
+                echo(
                     '\nPlease select the action that you would like to take:\n'
                     '\t[#] Enter the number corresponding to the question that you would like to perform an action on\n'
                     '\t[m] See more search results\n'
                     '\t[r] Return to the main menu'
                 )
                 selection = select_from_menu(self.valid_inputs + ['m', 'r'])
-            if selection != 'm':
+            if selection not in ['m', 'a']:
                 break
         if selection != 'r':
             QuestionAction(self.db_manager, self.user_id, self.search_res[int(selection) - 1]).run()
 
 
+class BrowsePopularQuestions(BaseScreen):
+    """
+    Class representing the browse popular questions screen. Allows the user to choose how the popular questions are
+    ranked (by score, views, or recent activity) and optionally a tag to limit them to.
+    """
+
+    def __init__(self, db_manager, user_id):
+        """
+        Initializes an instance of this class.
+        :param db_manager: an instance of the db_manager.DBManager class
+        :param user_id: user id specified by the user (if they did not specify one pass a None value)
+        """
+        self.user_id = user_id
+        BaseScreen.__init__(self, db_manager=db_manager)
+
+    def _setup(self):
+        echo('BROWSE POPULAR QUESTIONS')
+        echo('\nHow would you like the popular questions to be ranked?\n'
+             '\t[1] Highest score\n'
+             '\t[2] Most views\n'
+             '\t[3] Most recent activity')
+
+    def run(self):
+        """
+        Allows the user to choose the ranking and an optional tag which are passed to the PopularQuestions screen
+        which retrieves the questions.
+        """
+        kinds = {'1': 'score', '2': 'views', '3': 'activity'}
+        selection = select_from_menu(list(kinds))
+        tag = prompt('\nPlease enter a tag to limit the questions to (or leave it empty for all questions):\n> ')
+        PopularQuestions(self.db_manager, self.user_id, kinds[selection], tag.strip() or None).run()
+
+
+class PopularQuestions(SearchResults):
+    """
+    Class representing the popular questions screen. Displays (up to 10 at a time) the questions of a materialized hot
+    questions view, which is read with a single query, and otherwise behaves exactly like the search results screen.
+    """
+
+    def __init__(self, db_manager, user_id, kind, tag):
+        """
+        Initializes an instance of this class.
+        :param db_manager: an instance of the db_manager.DBManager class
+        :param user_id: user id specified by the user (if they did not specify one pass a None value)
+        :param kind: 'score', 'views', or 'activity'
+        :param tag: tag to limit the questions to (None for all questions)
+        """
+        self.valid_inputs = []
+        self.user_id = user_id
+        BaseScreen.__init__(self, db_manager=db_manager)
+        self.search_res = self.db_manager.get_hot_questions(kind, tag)
+        self.can_search_archive = False
+
+    def _setup(self):
+        echo('POPULAR QUESTIONS')
+
+    def run(self):
+        """
+        Displays the popular questions (see SearchResults.run) or notifies the user if there are none.
+        """
+        if len(self.search_res) == 0:
+            prompt('\nThere are no popular questions to show (the views may not have been refreshed yet) - please '
+                   'enter any key to return to the main menu:\n> ')
+            return
+        SearchResults.run(self)
+
+
 class QuestionAction(BaseScreen):
     """
     Class representing the question action screen. Displays all the fields of the selected question an allows the user
@@ -374,10 +457,11 @@ class QuestionAction(BaseScreen):
         the user can take.
         """
         self.question_data = self.db_manager.increment_view_count(self.question_data)
-        print('QUESTION ACTION\n')
+        echo('QUESTION ACTION\n')
         for key, value in self.question_data.items():
-            print('{} : {}'.format(key, value))
-        print(
+            if key not in HIDDEN_FIELDS:
+                echo('{} : {}'.format(key, value))
+        echo(
             '\nPlease select the action that you would like to take:\n'
             '\t[1] Answer the question\n'
             '\t[2] List existing answers\n'
@@ -396,18 +480,18 @@ class QuestionAction(BaseScreen):
         a confirmation upon completion allowing the user to return to the main menu.
         """
         clear_screen()
-        print('ANSWER QUESTION')
-        body = input('\nPlease enter the text corresponding to your answer:\n> ')
+        echo('ANSWER QUESTION')
+        body = prompt('\nPlease enter the text corresponding to your answer:\n> ')
         self.db_manager.add_answer(self.question_data['Id'], body, self.user_id)
         clear_screen()
-        print('ANSWER QUESTION')
-        input('\nAnswer successfully posted - please enter any key to return to the main menu:\n> ')
+        echo('ANSWER QUESTION')
+        prompt('\nAnswer successfully posted - please enter any key to return to the main menu:\n> ')
 
     def _display_answers(self, current_ind, answers, has_accepted):
         """
         Displays the up to 10 answers (at a time) to the selected question. If the question has an accepted answer it
-        is displayed first and is marked with a star. Shows up to the first 80 characters of the body text, the creation
-        date, and the score of each answer.
+        is displayed first and is marked with a star. Shows the plain text preview of the body (its first 80
+        characters), the creation date, and the score of each answer.
         :param current_ind: integer representing the number of search results that have already been displayed
         :param answers: a list containing the data of each answer to the selected question
         :param has_accepted: whether the first index (current_ind + i) is an accepted answer
@@ -418,23 +502,25 @@ class QuestionAction(BaseScreen):
         """
         valid_inputs = []
         clear_screen()
-        print('EXISTING ANSWERS')
+        echo('EXISTING ANSWERS')
         for i in range(MAX_PER_PAGE):
             ind = i + current_ind
             if ind + 1 > len(answers):
                 return None, valid_inputs
             valid_inputs.append(str(ind + 1))
             a = answers[ind]
+            # posts that predate the preview field are listed with the start of their body instead
+            preview = a[BODY_PREVIEW_FIELD] if BODY_PREVIEW_FIELD in a else a.get('Body', '')[:PREVIEW_LENGTH]
             if has_accepted and (i == 0):
-                print('\n[{}]******************************\n'
-                      '{}\n'
-                      'CreationDate: {}\n'
-                      'Score: {}'.format(ind + 1, a['Body'][:80], a['CreationDate'], a['Score']))
+                echo('\n[{}]******************************\n'
+                     '{}\n'
+                     'CreationDate: {}\n'
+                     'Score: {}'.format(ind + 1, preview, a['CreationDate'], a['Score']))
             else:
-                print('\n[{}]------------------------------\n'
-                      '{}\n'
-                      'CreationDate: {}\n'
-                      'Score: {}'.format(ind + 1, a['Body'][:80], a['CreationDate'], a['Score']))
+                echo('\n[{}]------------------------------\n'
+                     '{}\n'
+                     'CreationDate: {}\n'
+                     'Score: {}'.format(ind + 1, preview, a['CreationDate'], a['Score']))
         return MAX_PER_PAGE, valid_inputs
 
     def _list_answers(self):
@@ -449,7 +535,7 @@ class QuestionAction(BaseScreen):
             num_printed, valid_inputs = self._display_answers(current_ind, answers, has_accepted)
             has_accepted = False
             if (num_printed is None) or (current_ind + num_printed == len(answers)):
-                print(
+                echo(
                     '\nPlease select the action that you would like to take:\n'
                     '\t[#] Enter the number corresponding to the answer that you would like to perform an action on\n'
                     '\t[r] Return to the main menu'
@@ -457,7 +543,7 @@ class QuestionAction(BaseScreen):
                 selection = select_from_menu(valid_inputs + ['r'])
             else:
                 current_ind += num_printed
-                print(
+                echo(
                     '\nPlease select the action that you would like to take:\n'
                     '\t[#] Enter the number corresponding to the answer that you would like to perform an action on\n'
                     '\t[m] See more answers\n'
@@ -503,14 +589,17 @@ class AnswerAction(BaseScreen):
 
     def _setup(self):
         """
-        Displays all the fields of the selected answer and the answer actions that the user is able to take.
+        Displays all the fields of the selected answer (re-read through the DBManager document cache so that the fields
+        are up to date) and the answer actions that the user is able to take.
         """
-        print('ANSWER ACTION\n')
+        echo('ANSWER ACTION\n')
+        self.answer_data = self.db_manager.get_post(self.answer_data['_id']) or self.answer_data
         for key, value in self.answer_data.items():
-            print('{} : {}'.format(key, value))
-        print('\nPlease select the action that you would like to take:\n'
-              '\t[1] Add a vote\n'
-              '\t[r] Return to the main menu')
+            if key not in HIDDEN_FIELDS:
+                echo('{} : {}'.format(key, value))
+        echo('\nPlease select the action that you would like to take:\n'
+             '\t[1] Add a vote\n'
+             '\t[r] Return to the main menu')
 
     def run(self):
         """
@@ -0,0 +1,157 @@
+import itertools
+import re
+from pymongo import ASCENDING
+from text_fields import get_search_text, BODY_TEXT_FIELD, SEARCH_FIELDS
+
+GRAMS_COLLECTION = 'SearchGrams'
+GRAM_SIZE = 3
+QUESTION_TYPE_ID = '1'
+GRAM_BATCH_SIZE = 10000
+
+
+def get_grams(text):
+    """
+    Gets the set of n-grams (of length GRAM_SIZE) of the text. The text is padded at the end so that every substring
+    shorter than GRAM_SIZE is also the prefix of at least one n-gram (which is what allows short keywords to be looked
+    up with an index-backed prefix match).
+    :param text: string to get the n-grams of
+    :return: set of strings corresponding to the n-grams of the text
+    """
+    padded = text + ' ' * (GRAM_SIZE - 1)
+    return {padded[i:i + GRAM_SIZE] for i in range(len(text))}
+
+
+class NGramSearchEngine:
+    """
+    Class that maintains an n-gram index of the title, body, and tags of every question and uses it to find case-
+    insensitive partial matches of keywords. The index is stored in its own collection with one document per (n-gram,
+    question) pair - {'g': n-gram, 'p': _id of question} - so that the posting list of an n-gram is a range scan of the
+    compound (g, p) index.
+    """
+
+    def __init__(self, posts, grams):
+        """
+        Initializes an instance of this class.
+        :param posts: pymongo collection containing the posts
+        :param grams: pymongo collection to store the n-gram index in
+        """
+        self.posts = posts
+        self.grams = grams
+        self.gram_post_index = 'gram_post_index'
+
+    def create_indexes(self):
+        """
+        Creates the index that the posting lists are read from (if it has not already been created).
+        """
+        self.grams.create_index([('g', ASCENDING), ('p', ASCENDING)], unique=True, name=self.gram_post_index)
+
+    def is_built(self):
+        """
+        :return: True if the n-gram index has been built (i.e. it contains at least one entry), False otherwise
+        """
+        return self.grams.estimated_document_count() > 0
+
+    def _find_questions(self, query, projection, body_projection):
+        """
+        Finds questions, reading the html body only of the ones that have no plain text body yet (posts that have not
+        been backfilled, see text_fields.backfill_text_fields) so that get_search_text can derive it from the html.
+        :param query: filter selecting the questions
+        :param projection: projection of the questions that have a plain text body (leaving out Body)
+        :param body_projection: projection of the questions that do not (including Body, None for whole documents)
+        :return: iterator over dicts corresponding to the questions
+        """
+        with_text = dict(query, **{BODY_TEXT_FIELD: {'$exists': True}})
+        without_text = dict(query, **{BODY_TEXT_FIELD: {'$exists': False}})
+        return itertools.chain(self.posts.find(with_text, projection), self.posts.find(without_text, body_projection))
+
+    def build(self):
+        """
+        (Re)builds the n-gram index for all of the questions in the posts collection. The entries are inserted in
+        batches of GRAM_BATCH_SIZE and the index on the entries is created once they have all been inserted.
+        """
+        self.grams.drop()
+        batch = []
+        projection = {field: 1 for field in SEARCH_FIELDS}
+        for question in self._find_questions({'PostTypeId': QUESTION_TYPE_ID}, projection, dict(projection, Body=1)):
+            for gram in get_grams(get_search_text(question)):
+                batch.append({'g': gram, 'p': question['_id']})
+            if len(batch) >= GRAM_BATCH_SIZE:
+                self.grams.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            self.grams.insert_many(batch, ordered=False)
+        self.create_indexes()
+
+    def get_entries(self, post_data):
+        """
+        :param post_data: dict corresponding to the document of the question (must include its _id)
+        :return: list of dicts corresponding to the index entries of the question's n-grams
+        """
+        return [{'g': gram, 'p': post_data['_id']} for gram in get_grams(get_search_text(post_data))]
+
+    def index_post(self, post_data):
+        """
+        Adds the n-grams of a newly inserted question to the index.
+        :param post_data: dict corresponding to the document of the question (must include its _id)
+        """
+        entries = self.get_entries(post_data)
+        if entries:
+            self.grams.insert_many(entries, ordered=False)
+
+    def remove_post(self, post_data):
+        """
+        Removes the n-grams of a question from the index (each entry is deleted through the (g, p) index rather than
+        by scanning for the question's _id).
+        :param post_data: dict corresponding to the document of the question (must include its _id)
+        """
+        grams = list(get_grams(get_search_text(post_data)))
+        if grams:
+            self.grams.delete_many({'g': {'$in': grams}, 'p': post_data['_id']})
+
+    def _find_candidates(self, keyword):
+        """
+        Gets the _id values of the questions that may contain the keyword. For keywords at least GRAM_SIZE long this is
+        the intersection of the posting lists of all of the keyword's n-grams (computed by counting how many of the
+        n-grams each question appears under). Shorter keywords are looked up with a prefix match on the n-grams.
+        :param keyword: lower case keyword
+        :return: list of _id values of candidate questions
+        """
+        if len(keyword) >= GRAM_SIZE:
+            keyword_grams = list({keyword[i:i + GRAM_SIZE] for i in range(len(keyword) - GRAM_SIZE + 1)})
+            pipeline = [
+                {'$match': {'g': {'$in': keyword_grams}}},
+                {'$group': {'_id': '$p', 'num_grams': {'$sum': 1}}},
+                {'$match': {'num_grams': len(keyword_grams)}}
+            ]
+        else:
+            pipeline = [
+                {'$match': {'g': {'$regex': '^' + re.escape(keyword)}}},
+                {'$group': {'_id': '$p'}}
+            ]
+        return [res['_id'] for res in self.grams.aggregate(pipeline, allowDiskUse=True)]
+
+    def search(self, keywords):
+        """
+        Gets the questions that contain at least one of the keywords (case-insensitive, partial matches included) in
+        their title, body, or tags. Candidates are found with the n-gram index and then verified against their text
+        since n-grams can appear in a question without being adjacent. Results are ranked by the number of keywords
+        matched and then by the total number of keyword occurrences.
+        :param keywords: space separated string of keywords
+        :return: list of dicts corresponding to the documents of the matching questions
+        """
+        keyword_list = list(dict.fromkeys(keywords.lower().split()))
+        candidates = set()
+        for keyword in keyword_list:
+            candidates.update(self._find_candidates(keyword))
+        if len(candidates) == 0:
+            return []
+        ranked = []
+        query = {'_id': {'$in': list(candidates)}, 'PostTypeId': QUESTION_TYPE_ID}
+        for question in self._find_questions(query, {'Body': 0}, None):
+            text = get_search_text(question)
+            counts = [text.count(keyword) for keyword in keyword_list]
+            num_matched = sum(1 for count in counts if count > 0)
+            if num_matched > 0:
+                ranked.append((num_matched, sum(counts), question))
+        ranked.sort(key=lambda res: (res[0], res[1]), reverse=True)
+        return [question for _, _, question in ranked]
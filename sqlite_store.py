@@ -0,0 +1,475 @@
+import json
+import sqlite3
+from datetime import datetime
+from storage import StorageBackend
+from text_fields import add_text_fields, get_search_text, BODY_TEXT_FIELD, BODY_PREVIEW_FIELD, LISTING_PROJECTION
+from utils import completed_future
+
+QUESTION_TYPE_ID = '1'
+ANSWER_TYPE_ID = '2'
+HOT_QUESTIONS_LIMIT = 50
+# the kinds of hot question listings and the column that the questions of each kind are ranked by
+HOT_QUESTION_KINDS = {'score': 'Score', 'views': 'ViewCount', 'activity': 'LastActivityDate'}
+# fields that get their own column, every other field of a document is kept in the json "extra" column
+POST_COLUMNS = [
+    'Id', 'PostTypeId', 'ParentId', 'AcceptedAnswerId', 'OwnerUserId', 'Score', 'ViewCount', 'AnswerCount',
+    'CommentCount', 'FavoriteCount', 'CreationDate', 'LastActivityDate', 'Title', 'Body', 'Tags', 'ContentLicense',
+    BODY_TEXT_FIELD, BODY_PREVIEW_FIELD
+]
+# columns of the posts that are listed (every column except the full body ones)
+LISTING_COLUMNS = ', '.join(['_id'] + [c for c in POST_COLUMNS if c not in LISTING_PROJECTION] + ['extra'])
+VOTE_COLUMNS = ['Id', 'PostId', 'VoteTypeId', 'UserId', 'CreationDate']
+TAG_COLUMNS = ['Id', 'TagName', 'Count']
+TABLE_COLUMNS = {'posts': POST_COLUMNS, 'votes': VOTE_COLUMNS, 'tags': TAG_COLUMNS}
+INT_COLUMNS = {'Score', 'ViewCount', 'AnswerCount', 'CommentCount', 'FavoriteCount', 'Count'}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    _id INTEGER PRIMARY KEY, {post_columns}, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS post_Id_index ON posts (Id);
+CREATE INDEX IF NOT EXISTS find_answers_index ON posts (PostTypeId, ParentId);
+CREATE INDEX IF NOT EXISTS post_owner_index ON posts (PostTypeId, OwnerUserId);
+CREATE INDEX IF NOT EXISTS post_hot_score_index ON posts (PostTypeId, Score DESC);
+CREATE INDEX IF NOT EXISTS post_hot_views_index ON posts (PostTypeId, ViewCount DESC);
+CREATE INDEX IF NOT EXISTS post_hot_activity_index ON posts (PostTypeId, LastActivityDate DESC);
+CREATE TABLE IF NOT EXISTS votes (
+    _id INTEGER PRIMARY KEY, {vote_columns}, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS vote_userid_index ON votes (UserId);
+CREATE INDEX IF NOT EXISTS vote_postid_userid_index ON votes (PostId, UserId);
+CREATE TABLE IF NOT EXISTS tags (
+    _id INTEGER PRIMARY KEY, {tag_columns}, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS tag_name_index ON tags (TagName);
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name TEXT PRIMARY KEY, seq INTEGER NOT NULL
+);
+""".format(
+    post_columns=', '.join('{} {}'.format(c, 'INTEGER' if c in INT_COLUMNS else 'TEXT') for c in POST_COLUMNS),
+    vote_columns=', '.join('{} TEXT'.format(c) for c in VOTE_COLUMNS),
+    tag_columns=', '.join('{} {}'.format(c, 'INTEGER' if c in INT_COLUMNS else 'TEXT') for c in TAG_COLUMNS)
+)
+# full text index of the plain text of the questions (trigrams give case-insensitive substring matches, like the
+# n-gram index used with MongoDB - older SQLite versions without the trigram tokenizer fall back to whole word matches)
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(Title, BodyText, Tags, content='posts', " \
+             "content_rowid='_id'{})"
+TRIGRAM_TOKENIZER = ", tokenize='trigram'"
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _get_now():
+    return datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
+
+
+def create_schema(conn):
+    """
+    Creates the posts, votes, and tags tables (and their indexes) and the full text index of the questions if they do
+    not already exist.
+    :param conn: sqlite3 connection
+    """
+    conn.executescript(SCHEMA)
+    try:
+        conn.execute(FTS_SCHEMA.format(TRIGRAM_TOKENIZER))
+    except sqlite3.OperationalError:
+        conn.execute(FTS_SCHEMA.format(''))
+
+
+def uses_trigrams(conn):
+    """
+    :param conn: sqlite3 connection
+    :return: True if the full text index uses the trigram tokenizer, False otherwise
+    """
+    res = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'posts_fts'").fetchone()
+    return res is not None and 'trigram' in res[0]
+
+
+def _get_insert_statement(table):
+    columns = TABLE_COLUMNS[table]
+    return 'INSERT INTO {} ({}, extra) VALUES ({})'.format(
+        table, ', '.join(columns), ', '.join('?' * (len(columns) + 1))
+    )
+
+
+def _get_row(table, doc):
+    """
+    :param table: one of 'posts', 'votes', or 'tags'
+    :param doc: dict corresponding to the document
+    :return: list of the column values of the row storing the document - the fields with their own column are stored
+             in it and the rest of the fields are stored as json in the extra column
+    """
+    columns = TABLE_COLUMNS[table]
+    extra = {key: value for key, value in doc.items() if key not in columns and key != '_id'}
+    return [doc.get(column) for column in columns] + [json.dumps(extra) if extra else None]
+
+
+def insert_documents(conn, table, docs):
+    """
+    Inserts documents into a table (see _get_row).
+    :param conn: sqlite3 connection
+    :param table: one of 'posts', 'votes', or 'tags'
+    :param docs: list of dicts corresponding to the documents
+    """
+    conn.executemany(_get_insert_statement(table), [_get_row(table, doc) for doc in docs])
+
+
+def insert_document(conn, table, doc):
+    """
+    Inserts a single document into a table (see _get_row).
+    :param conn: sqlite3 connection
+    :param table: one of 'posts', 'votes', or 'tags'
+    :param doc: dict corresponding to the document
+    :return: the rowid of the inserted row (the _id of the document)
+    """
+    return conn.execute(_get_insert_statement(table), _get_row(table, doc)).lastrowid
+
+
+def build_search_index(conn):
+    """
+    (Re)builds the full text index of the questions.
+    :param conn: sqlite3 connection
+    """
+    conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('delete-all')")
+    conn.execute(
+        'INSERT INTO posts_fts (rowid, Title, BodyText, Tags) SELECT _id, Title, BodyText, Tags FROM posts '
+        'WHERE PostTypeId = ?',
+        (QUESTION_TYPE_ID,)
+    )
+
+
+def repair_question_counters(conn):
+    """
+    Recomputes the AnswerCount and LastActivityDate of every question from its answers (the SQLite equivalent of
+    counters.repair_question_counters).
+    :param conn: sqlite3 connection
+    """
+    conn.execute(
+        'UPDATE posts SET '
+        'AnswerCount = (SELECT COUNT(*) FROM posts a WHERE a.PostTypeId = ? AND a.ParentId = posts.Id), '
+        'LastActivityDate = MAX('
+        '  COALESCE(LastActivityDate, CreationDate), '
+        '  COALESCE((SELECT MAX(COALESCE(a.LastActivityDate, a.CreationDate)) FROM posts a '
+        '            WHERE a.PostTypeId = ? AND a.ParentId = posts.Id), \'\')'
+        ') WHERE PostTypeId = ?',
+        (ANSWER_TYPE_ID, ANSWER_TYPE_ID, QUESTION_TYPE_ID)
+    )
+
+
+def seed_id_sequences(conn, tables=None):
+    """
+    Sets the Id sequence of each table to the largest Id in it (the Id column is TEXT, so finding the largest Id
+    scans the table - this is only done once after a load and new Ids are taken from the sequence instead).
+    :param conn: sqlite3 connection
+    :param tables: list of the tables to seed the sequences of (every table by default)
+    """
+    for table in TABLE_COLUMNS if tables is None else tables:
+        conn.execute(
+            'INSERT OR REPLACE INTO id_sequences (name, seq) '
+            'SELECT ?, COALESCE(MAX(CAST(Id AS INTEGER)), 0) FROM {}'.format(table),
+            (table,)
+        )
+
+
+def _row_to_doc(row):
+    """
+    :param row: sqlite3.Row of one of the tables
+    :return: dict corresponding to the document stored in the row (columns that are NULL are left out, like missing
+             fields of a MongoDB document)
+    """
+    doc = {key: row[key] for key in row.keys() if key != 'extra' and row[key] is not None}
+    if row['extra']:
+        doc.update(json.loads(row['extra']))
+    return doc
+
+
+class SQLiteManager(StorageBackend):
+    """
+    Class handling the interaction between python and an embedded SQLite database (an alternative to the MongoDB
+    DBManager for single user deployments and test runs that avoids running a server). Supports the same operations
+    as DBManager: searching questions with an FTS5 index, listing answers, the user report, and posting and voting.
+    """
+
+    def __init__(self, db_path):
+        """
+        Opens (creating if necessary) the SQLite database file at db_path.
+        :param db_path: path of the SQLite database file
+        """
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        create_schema(self.conn)
+        self.use_trigrams = uses_trigrams(self.conn)
+
+    def _get_new_id(self, table):
+        """
+        Gets a new unique Id value for the specified table by incrementing its Id sequence (a primary key lookup). Must
+        be called inside the transaction that inserts the row so that no other connection can take the same Id.
+        :param table: one of 'posts', 'votes', or 'tags'
+        :return: a new unique Id value (as a string)
+        """
+        cursor = self.conn.execute('UPDATE id_sequences SET seq = seq + 1 WHERE name = ?', (table,))
+        if cursor.rowcount == 0:
+            # database files built before the sequences existed are seeded from their Ids the first time
+            seed_id_sequences(self.conn, [table])
+            self.conn.execute('UPDATE id_sequences SET seq = seq + 1 WHERE name = ?', (table,))
+        return str(self.conn.execute('SELECT seq FROM id_sequences WHERE name = ?', (table,)).fetchone()[0])
+
+    def _assemble_tag_string(self, tags):
+        """
+        Assembles a tag string by wrapping each tag with '<' and '>'. If any of the tags do not exist in the tags
+        table they are added and for the tags that already exist their Count value is incremented.
+        :param tags: list containing the tags
+        :return: tag string containing each tag wrapped with '<' and '>'
+        """
+        if len(tags) == 0:
+            return None
+        tag_string = ''
+        for tag in tags:
+            if tag not in tag_string:
+                tag_string += '<' + tag + '>'
+                cursor = self.conn.execute('UPDATE tags SET Count = Count + 1 WHERE TagName = ?', (tag,))
+                if cursor.rowcount == 0:
+                    insert_document(self.conn, 'tags', {'Id': self._get_new_id('tags'), 'TagName': tag, 'Count': 1})
+        return tag_string
+
+    def get_num_owned_posts_and_avg_score(self, user_id, post_type):
+        """
+        Gets the number of owned posts of a certain type (either question - PostTypeId of 1, or answer - PostTypeId of
+        2) and the average score of those posts.
+        :param user_id: int corresponding to the OwnerUserId to look for
+        :param post_type: int corresponding to the post type (1 if post type is question and 2 if post type is answer)
+        :return: tuple of int, float where the int corresponds to the number of owned posts and the float corresponds
+                 to the average score of those posts.
+        """
+        res = self.conn.execute(
+            'SELECT COUNT(*), AVG(Score) FROM posts WHERE PostTypeId = ? AND OwnerUserId = ?',
+            (str(post_type), str(user_id))
+        ).fetchone()
+        return res[0], 0 if res[1] is None else res[1]
+
+    def get_num_votes(self, user_id):
+        """
+        Gets the number of votes registered by a user.
+        :param user_id: int corresponding to the UserId to look for
+        :return: an int corresponding to the number of votes registered by the user
+        """
+        return self.conn.execute('SELECT COUNT(*) FROM votes WHERE UserId = ?', (str(user_id),)).fetchone()[0]
+
+    def add_question(self, title, body, tags, user_id, content_license='CC BY-SA 2.5'):
+        """
+        Adds a question post to the posts table and the full text index.
+        :param title: question title
+        :param body: question body
+        :param tags: list containing the question tags
+        :param user_id: id of user who is posting the question (if None the question will not have an OwnerUserId)
+        :param content_license: 'CC BY-SA 2.5' by default
+        :return: concurrent.futures.Future that has already resolved (the write is complete when this returns)
+        """
+        creation_date = _get_now()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            insertion = {
+                'Id': self._get_new_id('posts'),
+                'PostTypeId': QUESTION_TYPE_ID,
+                'CreationDate': creation_date,
+                'Score': 0,
+                'ViewCount': 0,
+                'Body': body,
+                'OwnerUserId': None if user_id is None else str(user_id),
+                'Title': title,
+                'Tags': self._assemble_tag_string(tags),
+                'AnswerCount': 0,
+                'CommentCount': 0,
+                'FavoriteCount': 0,
+                'ContentLicense': content_license,
+                'LastActivityDate': creation_date
+            }
+            add_text_fields(insertion)
+            post_oid = insert_document(self.conn, 'posts', insertion)
+            self.conn.execute(
+                'INSERT INTO posts_fts (rowid, Title, BodyText, Tags) VALUES (?, ?, ?, ?)',
+                (post_oid, title, insertion[BODY_TEXT_FIELD], insertion['Tags'])
+            )
+        return completed_future(post_oid)
+
+    def get_search_results(self, keywords, include_archive=False):
+        """
+        Gets the questions that contain at least one of the searched keywords in either their title, body, or tag
+        fields (case-insensitive, partial matches included). Keywords long enough for the trigram index are looked up
+        in it and shorter ones are matched with instr. The candidates are ranked the same way as with MongoDB - by the
+        number of keywords matched and then the total number of occurrences.
+        :param keywords: space separated string of keywords
+        :param include_archive: ignored (the SQLite backend has no archive tier)
+        :return: list of dicts corresponding to the matching questions
+        """
+        keyword_list = list(dict.fromkeys(keywords.lower().split()))
+        indexed = [kw for kw in keyword_list if not self.use_trigrams or len(kw) >= TRIGRAM_MIN_LENGTH]
+        short = [kw for kw in keyword_list if kw not in indexed]
+        rows = []
+        if indexed:
+            fts_query = ' OR '.join('"{}"'.format(kw.replace('"', '""')) for kw in indexed)
+            rows += self.conn.execute(
+                'SELECT posts.* FROM posts_fts JOIN posts ON posts._id = posts_fts.rowid WHERE posts_fts MATCH ?',
+                (fts_query,)
+            ).fetchall()
+        for kw in short:
+            rows += self.conn.execute(
+                "SELECT * FROM posts WHERE PostTypeId = ? AND instr(lower("
+                "COALESCE(Title, '') || ' ' || COALESCE(BodyText, '') || ' ' || COALESCE(Tags, '')), ?) > 0",
+                (QUESTION_TYPE_ID, kw)
+            ).fetchall()
+        ranked = {}
+        for row in rows:
+            if row['_id'] in ranked:
+                continue
+            question = _row_to_doc(row)
+            text = get_search_text(question)
+            counts = [text.count(kw) for kw in keyword_list]
+            num_matched = sum(1 for count in counts if count > 0)
+            # whole word (non trigram) matches are kept even if the keyword is not a substring of the raw text
+            ranked[row['_id']] = (max(num_matched, 1), sum(counts), question)
+        return [question for _, _, question in sorted(ranked.values(), key=lambda res: (res[0], res[1]), reverse=True)]
+
+    def get_hot_questions(self, kind, tag=None):
+        """
+        Gets the top questions by score, views, or recent activity (overall or for a tag). These are index-backed
+        queries so, unlike with MongoDB, there is no materialized view to maintain.
+        :param kind: 'score', 'views', or 'activity'
+        :param tag: tag name to get the top questions of (None for the top questions overall)
+        :return: list of dicts corresponding to the top questions in rank order
+        """
+        column = HOT_QUESTION_KINDS[kind]
+        if tag is None:
+            rows = self.conn.execute(
+                'SELECT * FROM posts WHERE PostTypeId = ? ORDER BY {} DESC LIMIT ?'.format(column),
+                (QUESTION_TYPE_ID, HOT_QUESTIONS_LIMIT)
+            ).fetchall()
+        else:
+            query = 'SELECT * FROM posts WHERE PostTypeId = ? AND instr(Tags, ?) > 0 ORDER BY {} DESC LIMIT ?'
+            rows = self.conn.execute(
+                query.format(column),
+                (QUESTION_TYPE_ID, '<' + tag + '>', HOT_QUESTIONS_LIMIT)
+            ).fetchall()
+        return [_row_to_doc(row) for row in rows]
+
+    def get_post(self, post_oid):
+        """
+        :param post_oid: _id (rowid) of the post
+        :return: dict corresponding to the post or None if it does not exist
+        """
+        row = self.conn.execute('SELECT * FROM posts WHERE _id = ?', (post_oid,)).fetchone()
+        return None if row is None else _row_to_doc(row)
+
+    def get_post_by_id(self, post_id):
+        """
+        :param post_id: Id of the post
+        :return: dict corresponding to the post or None if it does not exist
+        """
+        row = self.conn.execute('SELECT * FROM posts WHERE Id = ?', (post_id,)).fetchone()
+        return None if row is None else _row_to_doc(row)
+
+    def increment_view_count(self, question_data):
+        """
+        Increments the view count of a specified question by 1.
+        :param question_data: dict corresponding to the question
+        :return: dict corresponding to the updated question (ViewCount value has been incremented)
+        """
+        with self.conn:
+            self.conn.execute('UPDATE posts SET ViewCount = COALESCE(ViewCount, 0) + 1 WHERE _id = ?',
+                              (question_data['_id'],))
+        return self.get_post(question_data['_id'])
+
+    def add_answer(self, question_id, body, user_id, content_license='CC BY-SA 2.5'):
+        """
+        Adds an answer post to the posts table and increments the AnswerCount and advances the LastActivityDate of the
+        question that it answers (in the same transaction).
+        :param question_id: value of the Id field of the question that this answer is answering
+        :param body: answer text
+        :param user_id: id of user who is posting the answer (if None the answer will not have an OwnerUserId)
+        :param content_license: 'CC BY-SA 2.5' by default
+        :return: concurrent.futures.Future that has already resolved (the write is complete when this returns)
+        """
+        creation_date = _get_now()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            insertion = {
+                'Id': self._get_new_id('posts'),
+                'PostTypeId': ANSWER_TYPE_ID,
+                'ParentId': question_id,
+                'CreationDate': creation_date,
+                'Score': 0,
+                'Body': body,
+                'OwnerUserId': None if user_id is None else str(user_id),
+                'CommentCount': 0,
+                'ContentLicense': content_license
+            }
+            add_text_fields(insertion)
+            post_oid = insert_document(self.conn, 'posts', insertion)
+            self.conn.execute(
+                'UPDATE posts SET AnswerCount = COALESCE(AnswerCount, 0) + 1, '
+                'LastActivityDate = MAX(COALESCE(LastActivityDate, \'\'), ?) WHERE Id = ? AND PostTypeId = ?',
+                (creation_date, question_id, QUESTION_TYPE_ID)
+            )
+        return completed_future(post_oid)
+
+    def get_answers(self, question_data, include_archive=False):
+        """
+        Gets the answers to the specified question. If the question has an accepted answer the accepted answer will
+        be put as the first element in the list. The other answers are read without their full body columns (just the
+        BodyPreview).
+        :param question_data: dict corresponding to the question to get the answers of
+        :param include_archive: ignored (the SQLite backend has no archive tier)
+        :return: tuple of bool, list of dicts where the bool corresponds to whether the first element of the list is the
+                 accepted answer (True if so) and the list corresponds to all the answers to the specified question
+        """
+        accepted_ans = None
+        if 'AcceptedAnswerId' in question_data:
+            accepted_ans = self.get_post_by_id(question_data['AcceptedAnswerId'])
+        rows = self.conn.execute(
+            'SELECT {} FROM posts WHERE PostTypeId = ? AND ParentId = ? AND Id IS NOT ?'.format(LISTING_COLUMNS),
+            (ANSWER_TYPE_ID, question_data['Id'], None if accepted_ans is None else accepted_ans['Id'])
+        ).fetchall()
+        answers = [_row_to_doc(row) for row in rows]
+        if accepted_ans is not None:
+            return True, [accepted_ans] + answers
+        return False, answers
+
+    def check_vote_eligibility(self, post_data, user_id):
+        """
+        Checks to see whether a user id is eligible to vote on a post (i.e. they have not yet voted on the post).
+        :param post_data: dict corresponding to the post to add a vote to
+        :param user_id: user id to add a vote from
+        :return: True if the user id has not yet voted on the specified post (i.e. they are eligible), False otherwise
+        """
+        res = self.conn.execute(
+            'SELECT 1 FROM votes WHERE PostId = ? AND UserId = ? LIMIT 1',
+            (post_data['Id'], str(user_id))
+        ).fetchone()
+        return res is None
+
+    def add_vote(self, post_data, user_id):
+        """
+        Adds a vote from the specified user on the specified post to the votes table and increments the score of the
+        post by one and advances its LastActivityDate (in the same transaction).
+        :param post_data: dict corresponding to the post to add a vote to
+        :param user_id: user id to add a vote from (if a value of None is passed, the vote will not have a UserId)
+        :return: concurrent.futures.Future that has already resolved (the write is complete when this returns)
+        """
+        creation_date = _get_now()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            insertion = {
+                'Id': self._get_new_id('votes'),
+                'PostId': post_data['Id'],
+                'VoteTypeId': '2',
+                'UserId': None if user_id is None else str(user_id),
+                'CreationDate': creation_date
+            }
+            vote_oid = insert_document(self.conn, 'votes', insertion)
+            self.conn.execute(
+                'UPDATE posts SET Score = COALESCE(Score, 0) + 1, '
+                'LastActivityDate = MAX(COALESCE(LastActivityDate, \'\'), ?) WHERE _id = ?',
+                (creation_date, post_data['_id'])
+            )
+        return completed_future(vote_oid)
+
+    def close(self):
+        self.conn.close()
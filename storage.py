@@ -0,0 +1,170 @@
+from abc import ABC, abstractmethod
+
+
+class StorageBackend(ABC):
+    """
+    Base class representing the storage backend that the screens work with. Child classes must implement the abstract
+    methods below (see db_manager.DBManager for the MongoDB backend and sqlite_store.SQLiteManager for the embedded
+    backend). Posts are passed around as dicts in the same form as the documents of the Posts collection - with an _id
+    that identifies the post within the backend. The methods that write return a concurrent.futures.Future that
+    resolves once the write has been made durable (backends that write synchronously return one that is already
+    resolved).
+    """
+
+    @abstractmethod
+    def get_num_owned_posts_and_avg_score(self, user_id, post_type):
+        """
+        Gets the number of posts of a type owned by a user and the average score of those posts.
+        :param user_id: OwnerUserId to look for
+        :param post_type: int corresponding to the post type (1 for questions and 2 for answers)
+        :return: tuple of int, float corresponding to the number of owned posts and their average score (0 if there
+                 are none)
+        """
+
+    @abstractmethod
+    def get_num_votes(self, user_id):
+        """
+        :param user_id: UserId to look for
+        :return: int corresponding to the number of votes registered by the user
+        """
+
+    @abstractmethod
+    def add_question(self, title, body, tags, user_id, content_license='CC BY-SA 2.5'):
+        """
+        Adds a question post (with an AnswerCount of 0 and a LastActivityDate equal to its CreationDate), adds its tags
+        to the tags that do not exist yet and increments the Count of the ones that do, and makes the question
+        searchable.
+        :param title: question title
+        :param body: question body (html)
+        :param tags: list containing the question tags (may be empty)
+        :param user_id: id of the user posting the question (None for an anonymous question without an OwnerUserId)
+        :param content_license: 'CC BY-SA 2.5' by default
+        :return: concurrent.futures.Future that resolves once the question has been written
+        """
+
+    @abstractmethod
+    def get_search_results(self, keywords, include_archive=False):
+        """
+        Gets the questions that contain at least one of the keywords in their title, body, or tags, best matches
+        first.
+        :param keywords: space separated string of keywords
+        :param include_archive: True to also search the archived questions (ignored by backends without an archive)
+        :return: list of dicts corresponding to the matching questions (their full body fields may be left out)
+        """
+
+    def has_archive(self):
+        """
+        :return: True if the backend has archived posts that can be searched, False otherwise
+        """
+        return False
+
+    @abstractmethod
+    def get_hot_questions(self, kind, tag=None):
+        """
+        Gets the top questions by score, view count, or recent activity.
+        :param kind: 'score', 'views', or 'activity'
+        :param tag: tag name to get the top questions of (None for the top questions overall)
+        :return: list of dicts corresponding to summaries of the top questions (at least their _id, Id, Title, Score,
+                 ViewCount, AnswerCount, CreationDate, and LastActivityDate) in rank order
+        """
+
+    @abstractmethod
+    def get_post(self, post_oid):
+        """
+        :param post_oid: _id of the post
+        :return: dict corresponding to the post (with its full body) or None if it does not exist
+        """
+
+    @abstractmethod
+    def get_post_by_id(self, post_id):
+        """
+        :param post_id: Id of the post
+        :return: dict corresponding to the post (with its full body) or None if it does not exist
+        """
+
+    def get_cache_stats(self):
+        """
+        :return: dict containing the hits, misses, hit rate, and size of the post document cache (all 0 for backends
+                 without one)
+        """
+        return {'hits': 0, 'misses': 0, 'hit_rate': 0, 'size': 0}
+
+    @abstractmethod
+    def increment_view_count(self, question_data):
+        """
+        Increments the ViewCount of a question by 1 (views do not count as activity).
+        :param question_data: dict corresponding to the question
+        :return: dict corresponding to the updated question
+        """
+
+    @abstractmethod
+    def add_answer(self, question_id, body, user_id, content_license='CC BY-SA 2.5'):
+        """
+        Adds an answer post and, in the same logical write, increments the AnswerCount of the question it answers and
+        advances the question's LastActivityDate.
+        :param question_id: Id of the question being answered
+        :param body: answer body (html)
+        :param user_id: id of the user posting the answer (None for an anonymous answer without an OwnerUserId)
+        :param content_license: 'CC BY-SA 2.5' by default
+        :return: concurrent.futures.Future that resolves once the answer and the update of the question have been
+                 written
+        """
+
+    @abstractmethod
+    def get_answers(self, question_data, include_archive=False):
+        """
+        Gets the answers to a question, the accepted answer (if any) first.
+        :param question_data: dict corresponding to the question
+        :param include_archive: True to also read the archived answers (ignored by backends without an archive)
+        :return: tuple of bool, list of dicts where the bool is True if the first answer is the accepted answer and the
+                 list holds the answers (only the accepted answer is guaranteed to include its full body, the others
+                 at least include their BodyPreview)
+        """
+
+    @abstractmethod
+    def check_vote_eligibility(self, post_data, user_id):
+        """
+        :param post_data: dict corresponding to the post to vote on
+        :param user_id: user id to vote from
+        :return: True if the user has not voted on the post yet (including votes that have not been written yet),
+                 False otherwise
+        """
+
+    @abstractmethod
+    def add_vote(self, post_data, user_id):
+        """
+        Adds a vote from a user on a post and, in the same logical write, increments the Score of the post and advances
+        its LastActivityDate.
+        :param post_data: dict corresponding to the post to vote on
+        :param user_id: user id to vote from (None for a vote without a UserId)
+        :return: concurrent.futures.Future that resolves once the vote and the update of the post have been written
+        """
+
+    @abstractmethod
+    def close(self):
+        """
+        Writes anything that is still pending and releases the connection to the storage.
+        """
+
+
+def is_port(target):
+    """
+    :param target: command line argument naming the storage to use
+    :return: True if the target is a port number (MongoDB), False if it is the path of a SQLite database file
+    """
+    return isinstance(target, int) or target.isdigit()
+
+
+def open_storage(target, **kwargs):
+    """
+    Opens the storage backend named by target.
+    :param target: port of a MongoDB server (int or string of digits) or the path of a SQLite database file
+    :param kwargs: keyword arguments for the backend's constructor
+    :return: a db_manager.DBManager connected to the MongoDB server at the port or a sqlite_store.SQLiteManager for the
+             database file
+    """
+    if is_port(target):
+        from db_manager import DBManager
+        return DBManager(int(target), **kwargs)
+    from sqlite_store import SQLiteManager
+    return SQLiteManager(target, **kwargs)
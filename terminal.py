@@ -0,0 +1,92 @@
+import atexit
+import os
+import sys
+
+# move the cursor home, clear the screen, and clear the scrollback buffer
+CLEAR_SEQUENCE = '\x1b[H\x1b[2J\x1b[3J'
+
+
+class Renderer:
+    """
+    Class that buffers everything a screen prints and writes it to the terminal in a single write (when the user is
+    prompted for input or the buffer is explicitly flushed). Clearing the screen is done with ANSI escape sequences
+    rather than by running the clear command in a subprocess. If the output is not a terminal that understands ANSI
+    escape sequences (e.g. it is piped to a file) nothing is written to clear the screen and the buffered output is
+    written out instead of being discarded.
+    """
+
+    def __init__(self, stream=None):
+        """
+        Initializes an instance of this class.
+        :param stream: text stream to write to (whatever sys.stdout is when the buffer is written by default, so that
+                       redirecting sys.stdout also redirects the screens)
+        """
+        self._stream = stream
+        self._buffer = []
+
+    @property
+    def stream(self):
+        return sys.stdout if self._stream is None else self._stream
+
+    def supports_ansi(self):
+        """
+        :return: True if the stream is a terminal that understands ANSI escape sequences, False otherwise
+        """
+        isatty = getattr(self.stream, 'isatty', None)
+        return isatty is not None and isatty() and os.environ.get('TERM', '') != 'dumb'
+
+    def clear(self):
+        """
+        Clears the screen. Anything still in the buffer would be cleared straight away so it is dropped rather than
+        written (unless the stream is not an ANSI terminal, in which case it is written out).
+        """
+        if self.supports_ansi():
+            self._buffer = [CLEAR_SEQUENCE]
+        else:
+            self.flush()
+
+    def write(self, text=''):
+        """
+        Adds a line of text to the buffer.
+        :param text: text to add (a newline is appended)
+        """
+        self._buffer.append(str(text) + '\n')
+
+    def flush(self):
+        """
+        Writes the buffer to the stream in one write.
+        """
+        if self._buffer:
+            self.stream.write(''.join(self._buffer))
+            self._buffer = []
+        self.stream.flush()
+
+    def prompt(self, text=''):
+        """
+        Writes the buffer followed by the prompt text in one write and then reads a line of input.
+        :param text: prompt text
+        :return: string containing the line of input (without the trailing newline)
+        """
+        self._buffer.append(text)
+        self.flush()
+        return input()
+
+
+renderer = Renderer()
+atexit.register(renderer.flush)
+
+
+def clear_screen():
+    renderer.clear()
+
+
+def echo(text=''):
+    renderer.write(text)
+
+
+def prompt(text=''):
+    return renderer.prompt(text)
+
+
+def flush_output():
+    renderer.flush()
@@ -0,0 +1,67 @@
+import os
+import sys
+import pytest
+
+# the modules of the program live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _union_with(docs, database, options):
+    """
+    Handles the $unionWith stage (which mongomock does not implement).
+    """
+    return list(docs) + list(database[options['coll']].aggregate(options.get('pipeline', [])))
+
+
+def _merge(docs, database, options):
+    """
+    Handles the $merge stage (which mongomock does not implement) for the {'whenMatched': 'replace'} form that the
+    program uses.
+    """
+    assert options.get('whenMatched') == 'replace', 'only whenMatched "replace" is supported'
+    target = database[options['into']]
+    on = options.get('on', '_id')
+    for doc in docs:
+        target.replace_one({on: doc[on]}, doc, upsert=True)
+    return []
+
+
+@pytest.fixture
+def mongo_client(monkeypatch):
+    """
+    :return: mongomock client standing in for a MongoDB server (the test is skipped if mongomock is not installed)
+    """
+    mongomock = pytest.importorskip('mongomock')
+    # mongomock does not implement collations (so Id values are compared as strings)
+    monkeypatch.setitem(mongomock.not_implemented._IGNORED_FEATURES, 'collation', True)
+    monkeypatch.setitem(mongomock.aggregate._PIPELINE_HANDLERS, '$unionWith', _union_with)
+    monkeypatch.setitem(mongomock.aggregate._PIPELINE_HANDLERS, '$merge', _merge)
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def connect(mongo_client, monkeypatch):
+    """
+    :return: function that makes the MongoClient of the given modules connect to the mongomock client
+    """
+    def patch(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, 'MongoClient', lambda *args, **kwargs: mongo_client)
+    return patch
+
+
+@pytest.fixture
+def manager_factory(mongo_client, connect):
+    """
+    :return: function that creates a db_manager.DBManager connected to the mongomock client (closed after the test)
+    """
+    import db_manager
+    connect(db_manager)
+    managers = []
+
+    def create(**kwargs):
+        managers.append(db_manager.DBManager(1, **kwargs))
+        return managers[-1]
+    yield create
+    for manager in managers:
+        manager.close()
@@ -0,0 +1,162 @@
+import pytest
+from archive import PostArchive, ARCHIVED_POSTS_COLLECTION
+from search_engine import NGramSearchEngine, GRAMS_COLLECTION
+from text_fields import add_text_fields
+from views import HotQuestionViews, get_view_id
+from vote_buckets import VoteBucketStore, BUCKETS_COLLECTION
+
+OLD = '2001-01-01T00:00:00.000'
+NEW = '2999-01-01T00:00:00.000'
+POSTS = [
+    # an inactive thread
+    {'Id': '1', 'PostTypeId': '1', 'Title': 'old sorting question', 'LastActivityDate': OLD},
+    {'Id': '2', 'PostTypeId': '2', 'ParentId': '1', 'LastActivityDate': OLD},
+    # an old question kept in the hot tier by an active answer
+    {'Id': '3', 'PostTypeId': '1', 'Title': 'old question', 'LastActivityDate': OLD},
+    {'Id': '4', 'PostTypeId': '2', 'ParentId': '3', 'LastActivityDate': NEW},
+    # an active question
+    {'Id': '5', 'PostTypeId': '1', 'Title': 'new question', 'LastActivityDate': NEW},
+    # another inactive thread (without answers)
+    {'Id': '6', 'PostTypeId': '1', 'Title': 'old sorting question', 'LastActivityDate': OLD}
+]
+VOTES = [
+    {'Id': str(i), 'PostId': post_id, 'VoteTypeId': '2', 'UserId': 'u' + str(i)}
+    for i, post_id in enumerate(['1', '2', '2', '3', '5', '6'], 1)
+]
+
+
+@pytest.fixture
+def db(mongo_client):
+    db = mongo_client['291db']
+    db['Posts'].insert_many([add_text_fields(dict(post, Body='<p>body</p>')) for post in POSTS])
+    db['Votes'].insert_many([dict(vote) for vote in VOTES])
+    NGramSearchEngine(db['Posts'], db[GRAMS_COLLECTION]).build()
+    return db
+
+
+def _ids(collection, query=None):
+    return sorted(doc['Id'] for doc in collection.find(query or {}))
+
+
+def test_archive(db):
+    archive = PostArchive(db)
+    assert not archive.exists()
+    # a batch size of 1 makes every batch continue the walk of the previous one
+    batches = []
+    assert archive.archive(batch_size=1, on_batch=batches.append) == {'questions': 2, 'answers': 1, 'votes': 4}
+    assert [sorted(post['Id'] for post in batch) for batch in batches] == [['1', '2'], ['6']]
+    assert archive.exists()
+    assert _ids(db['Posts']) == ['3', '4', '5']
+    assert _ids(db[ARCHIVED_POSTS_COLLECTION]) == ['1', '2', '6']
+    assert _ids(db['Votes']) == ['4', '5']
+    assert _ids(archive.archived_votes) == ['1', '2', '3', '6']
+    assert NGramSearchEngine(db['Posts'], db[GRAMS_COLLECTION]).search('sorting') == []
+    # rerunning the archive finds nothing new
+    assert archive.archive() == {'questions': 0, 'answers': 0, 'votes': 0}
+    assert archive.get_max_id('post') == 6
+    assert archive.get_max_id('vote') == 6
+    assert archive.has_voted('2', 'u3')
+    assert archive.get_num_votes('u1') == 1
+    assert [answer['Id'] for answer in archive.get_answers('1')] == ['2']
+
+
+def test_restore_round_trip(db):
+    before = {post['Id']: post for post in db['Posts'].find()}
+    archive = PostArchive(db)
+    archive.archive()
+    assert not archive.restore('2')
+    assert not archive.restore('404')
+    assert archive.restore('1')
+    assert _ids(db['Posts']) == ['1', '2', '3', '4', '5']
+    assert db['Posts'].find_one({'Id': '1'}) == before['1']
+    assert _ids(db['Votes']) == ['1', '2', '3', '4', '5']
+    assert _ids(db[ARCHIVED_POSTS_COLLECTION]) == ['6']
+    assert _ids(archive.archived_votes) == ['6']
+    assert [question['Id'] for question in NGramSearchEngine(db['Posts'], db[GRAMS_COLLECTION]).search('sorting')] \
+        == ['1']
+
+
+def test_restore_into_buckets(db):
+    archive = PostArchive(db)
+    archive.archive()
+    VoteBucketStore(db).migrate(db['Votes'])
+    assert archive.restore('1')
+    buckets = {bucket['PostId']: bucket for bucket in db[BUCKETS_COLLECTION].find()}
+    assert sorted(vote['Id'] for vote in buckets['2']['votes']) == ['2', '3']
+    # the restored post's counter places its next vote in the bucket that holds its restored votes
+    assert VoteBucketStore(db).allocate_bucket('2') == 0
+    assert buckets['2']['n'] == 2
+
+
+def test_activity_restores_thread(db, manager_factory):
+    PostArchive(db).archive()
+    manager = manager_factory()
+    assert manager.has_archive()
+    question = manager.get_post_by_id('1')
+    assert question is not None
+    assert manager.get_post_by_id('404') is None
+    assert not manager.check_vote_eligibility(question, 'u1')
+    manager.add_answer('1', '<p>new answer</p>', 'u9').result()
+    assert _ids(db['Posts'], {'ParentId': '1'}) == ['2', '7']
+    assert _ids(db[ARCHIVED_POSTS_COLLECTION]) == ['6']
+    assert manager.posts.find_one({'Id': '1'})['AnswerCount'] == 1
+    assert manager.get_num_owned_posts_and_avg_score('u9', 2) == (1, 0)
+
+
+def test_archive_reads_only_inactive_questions(db, monkeypatch):
+    archive = PostArchive(db)
+    queries = []
+    find = archive.posts.find
+
+    def recording_find(query, *args, **kwargs):
+        queries.append(query)
+        return find(query, *args, **kwargs)
+
+    monkeypatch.setattr(archive.posts, 'find', recording_find)
+    archive.archive(batch_size=1)
+    question_queries = [query for query in queries if query.get('PostTypeId') == '1']
+    # one batch per inactive question (3 is kept back by its answer) and a last one that finds nothing more
+    assert len(question_queries) == 4
+    assert all(query['LastActivityDate']['$lt'] < NEW for query in question_queries)
+    assert question_queries[-1]['$nor'][0]['LastActivityDate'] == OLD
+
+
+def test_archive_removes_questions_from_views(db):
+    hot_views = HotQuestionViews(db)
+    questions = {post['Id']: {'_id': post['_id'], 'Id': post['Id']} for post in db['Posts'].find({'PostTypeId': '1'})}
+    for kind, tag, ids in [('score', None, ['5', '1', '3', '6']), ('score', 'python', ['1', '6'])]:
+        hot_views.views.insert_one({'_id': get_view_id(kind, tag), 'questions': [questions[i] for i in ids]})
+    PostArchive(db).archive()
+    assert [question['Id'] for question in hot_views.get_view('score')] == ['5', '3']
+    assert hot_views.get_view('score', 'python') == []
+
+
+def test_vote_on_a_post_archived_while_cached(db, manager_factory):
+    manager = manager_factory()
+    question = manager.get_post_by_id('1')
+    # another process archives the thread while the manager still has the question cached
+    PostArchive(db).archive()
+    assert manager.get_post_by_id('1') == question
+    manager.add_vote(question, 'u9').result()
+    assert manager.has_archive()
+    assert db['Posts'].find_one({'Id': '1'})['Score'] == 1
+    assert _ids(db[ARCHIVED_POSTS_COLLECTION]) == ['6']
+    assert _ids(db['Votes'], {'PostId': '1'}) == ['1', '7']
+
+
+def test_eligibility_of_a_post_archived_after_it_was_read(db, manager_factory):
+    question = db['Posts'].find_one({'Id': '6'})
+    PostArchive(db).archive()
+    # the question was listed before it was archived, so it was never read from the archive
+    assert not manager_factory().check_vote_eligibility(question, 'u6')
+
+
+def test_manager_archive_evicts_cached_posts(db, manager_factory):
+    manager = manager_factory()
+    question = manager.get_post_by_id('1')
+    assert manager.archive_inactive() == {'questions': 2, 'answers': 1, 'votes': 4}
+    assert manager.has_archive()
+    assert manager.post_cache.get(question['_id']) is None
+    assert manager.get_post_by_id('1') == db[ARCHIVED_POSTS_COLLECTION].find_one({'Id': '1'})
+    manager.add_vote(manager.get_post_by_id('1'), 'u9').result()
+    assert db['Posts'].find_one({'Id': '1'})['Score'] == 1
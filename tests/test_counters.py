@@ -0,0 +1,37 @@
+from counters import repair_question_counters
+
+POSTS = [
+    {'Id': '1', 'PostTypeId': '1', 'CreationDate': '2020-01-01T00:00:00.000', 'AnswerCount': 7},
+    {'Id': '2', 'PostTypeId': '2', 'ParentId': '1', 'CreationDate': '2020-01-03T00:00:00.000'},
+    {'Id': '3', 'PostTypeId': '2', 'ParentId': '1', 'CreationDate': '2020-01-02T00:00:00.000',
+     'LastActivityDate': '2020-01-05T00:00:00.000'},
+    {'Id': '10', 'PostTypeId': '1', 'CreationDate': '2020-01-01T00:00:00.000',
+     'LastActivityDate': '2021-01-01T00:00:00.000'},
+    {'Id': '11', 'PostTypeId': '2', 'ParentId': '10', 'CreationDate': '2020-06-01T00:00:00.000'},
+    {'Id': '12', 'PostTypeId': '1', 'CreationDate': '2020-01-01T00:00:00.000', 'AnswerCount': 2}
+]
+
+
+def test_repair_question_counters(mongo_client):
+    posts = mongo_client['291db']['Posts']
+    posts.insert_many([dict(post) for post in POSTS])
+    assert repair_question_counters(posts) == 2
+    questions = {post['Id']: post for post in posts.find({'PostTypeId': '1'})}
+    assert questions['1']['AnswerCount'] == 2
+    assert questions['1']['LastActivityDate'] == '2020-01-05T00:00:00.000'
+    # LastActivityDate is never moved back
+    assert questions['10']['AnswerCount'] == 1
+    assert questions['10']['LastActivityDate'] == '2021-01-01T00:00:00.000'
+    assert questions['12']['AnswerCount'] == 0
+    assert questions['12']['LastActivityDate'] == '2020-01-01T00:00:00.000'
+
+
+def test_add_answer_maintains_counters(manager_factory):
+    manager = manager_factory()
+    manager.posts.insert_one({'Id': '1', 'PostTypeId': '1', 'AnswerCount': 0,
+                              'LastActivityDate': '2000-01-01T00:00:00.000'})
+    manager.add_answer('1', '<p>answer</p>', '2')
+    question = manager.posts.find_one({'Id': '1'})
+    answer = manager.posts.find_one({'Id': '2'})
+    assert question['AnswerCount'] == 1
+    assert question['LastActivityDate'] == answer['CreationDate']
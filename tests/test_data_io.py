@@ -0,0 +1,88 @@
+import io
+import json
+import pytest
+import data_io
+
+DOCS = [
+    {'Id': '1', 'PostTypeId': '1', 'Title': 'a "quoted" title ]', 'Score': 3},
+    {'Id': '2', 'PostTypeId': '2', 'ParentId': '1', 'Score': 0}
+]
+XML = (
+    '<?xml version="1.0" encoding="utf-8"?>\n<posts>\n'
+    '  <row Id="1" PostTypeId="1" Title="a &quot;quoted&quot; title ]" Score="3" />\n'
+    '  <row Id="2" PostTypeId="2" ParentId="1" Score="0" />\n'
+    '</posts>\n'
+)
+
+
+def _write(tmp_path, name, text):
+    file_path = str(tmp_path / name)
+    with data_io.open_file(file_path, 'wt') as fp:
+        fp.write(text)
+    return file_path
+
+
+@pytest.mark.parametrize('compression', ['', '.gz', '.bz2', '.xz'])
+def test_iter_rows_json(tmp_path, compression):
+    file_path = _write(tmp_path, 'Posts.json' + compression, json.dumps({'posts': {'row': DOCS}}))
+    assert list(data_io.iter_rows(file_path)) == DOCS
+
+
+def test_iter_rows_json_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_io, 'READ_CHUNK_SIZE', 7)
+    file_path = _write(tmp_path, 'Posts.json', json.dumps({'posts': {'row': DOCS * 20}}, indent=2))
+    assert list(data_io.iter_rows(file_path)) == DOCS * 20
+
+
+def test_iter_rows_json_truncated(tmp_path):
+    file_path = _write(tmp_path, 'Posts.json', json.dumps({'posts': {'row': DOCS}})[:-10])
+    with pytest.raises(ValueError):
+        list(data_io.iter_rows(file_path))
+
+
+@pytest.mark.parametrize('name', ['Posts.jsonl', 'Posts.ndjson.gz'])
+def test_iter_rows_json_lines(tmp_path, name):
+    file_path = _write(tmp_path, name, '\n'.join(json.dumps(doc) for doc in DOCS) + '\n\n')
+    assert list(data_io.iter_rows(file_path)) == DOCS
+
+
+@pytest.mark.parametrize('compression', ['', '.bz2'])
+def test_iter_rows_xml(tmp_path, compression):
+    file_path = _write(tmp_path, 'Posts.xml' + compression, XML)
+    assert list(data_io.iter_rows(file_path)) == DOCS
+
+
+def test_find_data_file(tmp_path):
+    assert data_io.find_data_file(str(tmp_path), 'Posts') is None
+    _write(tmp_path, 'Posts.xml', XML)
+    _write(tmp_path, 'Posts.jsonl.gz', '')
+    assert data_io.find_data_file(str(tmp_path), 'Posts') == str(tmp_path / 'Posts.jsonl.gz')
+
+
+def test_get_format():
+    assert data_io.get_format('Votes.JSON.XZ') == 'json'
+    assert data_io.get_format('Votes.ndjson') == 'jsonl'
+    assert data_io.get_format('Votes.xml.gz') == 'xml'
+    assert data_io.get_format('Votes.csv') is None
+
+
+def test_iter_batches():
+    assert list(data_io.iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(data_io.iter_batches([], 2)) == []
+
+
+def test_iter_rows_read_counter(tmp_path):
+    file_path = _write(tmp_path, 'Posts.json.gz', json.dumps({'posts': {'row': DOCS}}))
+    with open(file_path, 'rb') as raw:
+        counter = data_io.ReadCounter(raw)
+        assert list(data_io.iter_rows(file_path, io.BufferedReader(counter))) == DOCS
+    assert counter.bytes_read == (tmp_path / 'Posts.json.gz').stat().st_size
+
+
+def test_compressed_pieces_concatenate(tmp_path):
+    for compression in ['', '.gz', '.bz2', '.xz']:
+        file_path = str(tmp_path / ('Posts.jsonl' + compression))
+        with open(file_path, 'wb') as fp:
+            for doc in DOCS:
+                fp.write(data_io.compress_bytes((json.dumps(doc) + '\n').encode('utf-8'), compression))
+        assert list(data_io.iter_rows(file_path)) == DOCS
@@ -0,0 +1,69 @@
+from doc_cache import DocumentCache
+
+
+def test_get_copies():
+    cache = DocumentCache()
+    cache.put({'_id': 1, 'Id': '1', 'Score': 0})
+    doc = cache.get(1)
+    doc['Score'] = 100
+    assert cache.get(1)['Score'] == 0
+    assert cache.get_by_id('1')['_id'] == 1
+    assert cache.get(2) is None
+    assert cache.get_stats() == {'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'size': 1}
+
+
+def test_lru_eviction():
+    cache = DocumentCache(max_size=2)
+    cache.put({'_id': 1, 'Id': '1'})
+    cache.put({'_id': 2, 'Id': '2'})
+    cache.get(1)
+    cache.put({'_id': 3, 'Id': '3'})
+    assert cache.get(2) is None
+    assert cache.get_by_id('2') is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+
+def test_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('doc_cache.time.monotonic', lambda: now[0])
+    cache = DocumentCache(ttl=10)
+    cache.put({'_id': 1, 'Id': '1'})
+    now[0] = 109.0
+    assert cache.get(1) is not None
+    now[0] = 111.0
+    assert cache.get(1) is None
+    assert cache.get_stats()['size'] == 0
+
+
+def test_disabled():
+    cache = DocumentCache(max_size=0)
+    cache.put({'_id': 1})
+    assert cache.get(1) is None
+
+
+def test_apply_update():
+    cache = DocumentCache()
+    cache.put({'_id': 1, 'Id': '1', 'Score': 1, 'LastActivityDate': '2020-01-02'})
+    updated = cache.apply_update(1, {'$inc': {'Score': 1}, '$max': {'LastActivityDate': '2020-01-01'}})
+    assert updated == {'_id': 1, 'Id': '1', 'Score': 2, 'LastActivityDate': '2020-01-02'}
+    cache.apply_update_by_id('1', {'$set': {'Title': 'new'}, '$max': {'LastActivityDate': '2020-01-03'}})
+    assert cache.get(1)['Title'] == 'new'
+    assert cache.get(1)['LastActivityDate'] == '2020-01-03'
+    assert cache.apply_update(2, {'$inc': {'Score': 1}}) is None
+    cache.invalidate(1)
+    assert cache.get_by_id('1') is None
+
+
+def test_manager_reads_through_cache(manager_factory):
+    manager = manager_factory()
+    manager.posts.insert_one({'Id': '1', 'PostTypeId': '1', 'Score': 0, 'ViewCount': 0})
+    manager.votes.insert_one({'Id': '1', 'PostId': '9', 'VoteTypeId': '2'})
+    question = manager.get_post_by_id('1')
+    manager.add_vote(question, '2')
+    manager.increment_view_count(manager.get_post(question['_id']))
+    # the cached copy was updated in place of reading the post back
+    cached = manager.get_post_by_id('1')
+    assert (cached['Score'], cached['ViewCount']) == (1, 1)
+    stored = manager.posts.find_one({'Id': '1'})
+    assert (stored['Score'], stored['ViewCount']) == (1, 1)
+    assert manager.get_cache_stats()['hits'] >= 2
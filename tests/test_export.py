@@ -0,0 +1,51 @@
+import json
+import pytest
+import export
+from data_io import iter_rows
+
+POSTS = [{'Id': str(i), 'PostTypeId': '1', 'Title': 'question {}'.format(i), 'Body': '<p>body</p>',
+          'BodyText': 'body', 'BodyPreview': 'body'} for i in range(1, 121)]
+TAGS = [{'Id': '1', 'TagName': 'python', 'Count': 120}]
+
+
+@pytest.fixture
+def db(mongo_client, connect):
+    connect(export)
+    db = mongo_client[export.DB_NAME]
+    db['Posts'].insert_many([dict(post) for post in POSTS])
+    db['Tags'].insert_many([dict(tag) for tag in TAGS])
+    return db
+
+
+@pytest.mark.parametrize('file_format,compression', [('jsonl', '.gz'), ('json', '.bz2'), ('json', '')])
+def test_export_round_trip(db, tmp_path, file_format, compression):
+    export.ExportDocStore(1, str(tmp_path), file_format=file_format, compression=compression, workers=2)
+    with open(str(tmp_path / export.MANIFEST_FILE)) as fp:
+        manifest = json.load(fp)
+    posts_entry = manifest['collections']['Posts']
+    assert posts_entry['documents'] == len(POSTS)
+    assert len(posts_entry['ranges']) > 1
+    assert sum(entry['documents'] for entry in posts_entry['ranges']) == len(POSTS)
+    posts = list(iter_rows(str(tmp_path / posts_entry['file'])))
+    # the derived plain text fields are not exported
+    expected = [{name: post[name] for name in ['Id', 'PostTypeId', 'Title', 'Body']} for post in POSTS]
+    assert sorted(posts, key=lambda post: int(post['Id'])) == expected
+    assert list(iter_rows(str(tmp_path / manifest['collections']['Tags']['file']))) == TAGS
+    # the empty Votes collection still gets a readable file
+    assert list(iter_rows(str(tmp_path / manifest['collections']['Votes']['file']))) == []
+    assert [name for name in tmp_path.iterdir() if name.name.startswith('.')] == []
+
+
+def test_export_includes_the_archive(db, tmp_path):
+    db['ArchivedPosts'].insert_one({'Id': '121', 'PostTypeId': '1', 'Title': 'archived', 'BodyText': 'body'})
+    db['Votes'].insert_one({'Id': '1', 'PostId': '1', 'VoteTypeId': '2'})
+    db['ArchivedVotes'].insert_one({'Id': '2', 'PostId': '121', 'VoteTypeId': '2'})
+    export.ExportDocStore(1, str(tmp_path), workers=1)
+    with open(str(tmp_path / export.MANIFEST_FILE)) as fp:
+        manifest = json.load(fp)
+    posts = list(iter_rows(str(tmp_path / manifest['collections']['Posts']['file'])))
+    assert len(posts) == len(POSTS) + 1
+    assert {'Id': '121', 'PostTypeId': '1', 'Title': 'archived'} in posts
+    votes = list(iter_rows(str(tmp_path / manifest['collections']['Votes']['file'])))
+    assert sorted(vote['Id'] for vote in votes) == ['1', '2']
+    assert {entry['source'] for entry in manifest['collections']['Votes']['ranges']} == {'Votes', 'ArchivedVotes'}
@@ -0,0 +1,87 @@
+import io
+import json
+import pytest
+import phase1
+from ingest_stats import IngestStats
+
+POSTS = [
+    {'Id': '1', 'PostTypeId': '1', 'Title': 'Sorting a Dictionary', 'Body': '<p>by value</p>', 'Tags': '<python>',
+     'CreationDate': '2020-01-01T00:00:00.000'},
+    {'Id': '2', 'PostTypeId': '2', 'ParentId': '1', 'Body': '<p>use sorted</p>',
+     'CreationDate': '2020-01-02T00:00:00.000'}
+]
+TAGS = [{'Id': '1', 'TagName': 'python', 'Count': 1}]
+VOTES = [{'Id': str(i), 'PostId': '1', 'VoteTypeId': '2'} for i in range(1, 6)]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for name, docs in [('Posts', POSTS), ('Tags', TAGS)]:
+        with open(str(tmp_path / (name + '.json')), 'w') as fp:
+            json.dump({name.lower(): {'row': docs}}, fp)
+    with open(str(tmp_path / 'Votes.jsonl'), 'w') as fp:
+        fp.write(''.join(json.dumps(vote) + '\n' for vote in VOTES))
+    return tmp_path
+
+
+def test_load_data_file(data_dir, monkeypatch):
+    monkeypatch.setattr(phase1, 'INSERT_BATCH_SIZE', 2)
+    stream = io.StringIO()
+    stats = IngestStats(stream=stream)
+    batches = []
+    with stats.run():
+        phase1.load_data_file(stats, 'Votes', str(data_dir / 'Votes.jsonl'), batches.append,
+                              lambda vote: dict(vote, seen=True))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert all(vote['seen'] for batch in batches for vote in batch)
+    summary = stats.get_summary()
+    assert summary['error'] is None
+    assert [stage['name'] for stage in summary['stages']] == ['load Votes']
+    votes = summary['collections']['Votes']
+    assert (votes['rows'], votes['batches']) == (5, 3)
+    assert votes['bytes_read'] == (data_dir / 'Votes.jsonl').stat().st_size
+    assert 'Votes: 5 rows' in stream.getvalue()
+    assert stream.getvalue().splitlines()[-1].startswith('Done in')
+
+
+def test_run_records_the_error(tmp_path):
+    stream = io.StringIO()
+    stats = IngestStats(stream=stream, profile_path=str(tmp_path / 'load.prof'),
+                        tracemalloc_path=str(tmp_path / 'load.txt'))
+    with pytest.raises(ValueError):
+        with stats.run():
+            with stats.stage('parse'):
+                raise ValueError('bad row')
+    assert stats.get_summary()['error'] == "ValueError('bad row')"
+    assert [stage['name'] for stage in stats.get_summary()['stages']] == ['parse']
+    assert stream.getvalue().splitlines()[-1].startswith('Failed after')
+    # the profiler and tracemalloc output of a failed load are still written
+    assert (tmp_path / 'load.prof').exists()
+    assert (tmp_path / 'load.txt').read_text().startswith('current:')
+
+
+def test_failed_sqlite_load_is_summarized(data_dir):
+    (data_dir / 'Votes.jsonl').unlink()
+    stats = IngestStats(stream=None)
+    with pytest.raises(AssertionError):
+        phase1.BuildSQLiteStore(str(data_dir / '291.db'), str(data_dir), stats)
+    summary_path = str(data_dir / 'summary.json')
+    stats.write_summary(summary_path)
+    with open(summary_path) as fp:
+        assert 'no data file for the Votes collection' in json.load(fp)['error']
+
+
+def test_build_doc_store(data_dir, mongo_client, monkeypatch):
+    monkeypatch.setattr('pymongo.MongoClient', lambda *args, **kwargs: mongo_client)
+    db = mongo_client[phase1.DB_NAME]
+    db['SearchGrams'].insert_one({'g': 'old', 'p': None})
+    stats = IngestStats(stream=None)
+    phase1.BuildDocStore(1, str(data_dir), stats)
+    assert [stage[0] for stage in stats.stages] == ['drop collections', 'load Posts', 'load Tags', 'load Votes',
+                                                    'build search index', 'repair counters', 'create indexes']
+    assert {name: progress.rows for name, progress in stats.collections.items()} == \
+        {'Posts': 2, 'Tags': 1, 'Votes': 5}
+    question = db['Posts'].find_one({'Id': '1'})
+    assert (question['AnswerCount'], question['BodyText']) == (1, 'by value')
+    assert db['SearchGrams'].count_documents({'g': 'old'}) == 0
+    assert db['SearchGrams'].count_documents({'p': question['_id']}) > 0
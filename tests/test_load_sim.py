@@ -0,0 +1,74 @@
+import pytest
+import db_manager
+import load_sim
+from search_engine import NGramSearchEngine, GRAMS_COLLECTION
+from text_fields import add_text_fields
+from utils import get_percentile
+
+
+def test_get_percentile():
+    values = list(range(1, 101))
+    assert get_percentile(values, 50) == 50
+    assert get_percentile(values, 99) == 99
+    assert get_percentile(values, 100) == 100
+    assert get_percentile([7], 1) == 7
+    assert get_percentile([], 50) == 0
+
+
+@pytest.fixture
+def simulator(mongo_client, connect):
+    connect(db_manager, load_sim)
+    db = mongo_client[db_manager.DB_NAME]
+    db['Posts'].insert_many([
+        add_text_fields({'Id': str(i), 'PostTypeId': '1', 'Title': 'sorting question {}'.format(i),
+                         'Body': '<p>body</p>', 'Score': 0, 'ViewCount': 0, 'AnswerCount': 0})
+        for i in range(1, 6)
+    ])
+    NGramSearchEngine(db['Posts'], db[GRAMS_COLLECTION]).build()
+    simulator = load_sim.LoadSimulator(1, user_counts=[1], duration=0.2, id_pool_size=2)
+    yield simulator
+    simulator.close()
+
+
+def test_run(simulator, capsys):
+    assert simulator.keywords == ['question', 'sorting']
+    assert simulator.question_ids == ['1', '2', '3', '4', '5']
+    capsys.readouterr()
+    [level] = simulator.run()
+    assert level['users'] == 1
+    assert level['ops'] > 0
+    assert (level['errors'], level['error_counts']) == (0, {})
+    # the simulated users do not set up the indexes again
+    assert 'Creating indexes' not in capsys.readouterr().out
+    assert level['latency_ms']['count'] == level['ops']
+    # a single user never double votes and every vote it adds is reflected in the Score of the post
+    assert level['audit'] == {
+        'duplicate_post_ids': 0,
+        'duplicate_vote_ids': 0,
+        'double_votes': 0,
+        'score_drift_posts': 0,
+        'score_drift_total': 0
+    }
+
+
+def test_votes_stay_within_the_sample(simulator, monkeypatch):
+    simulator.question_ids = ['2']
+    snapshots = []
+    get_score_snapshot = simulator._get_score_snapshot
+    monkeypatch.setattr(simulator, '_get_score_snapshot',
+                        lambda post_ids: snapshots.append(list(post_ids)) or get_score_snapshot(post_ids))
+    [level] = simulator.run()
+    assert snapshots[0] == ['2']
+    assert set(snapshots[1]) <= {'2'}
+    assert level['audit']['score_drift_posts'] == 0
+
+
+def test_run_records_errors(simulator, monkeypatch):
+    def fail(*args, **kwargs):
+        raise ValueError('search failed')
+
+    monkeypatch.setattr(db_manager.DBManager, 'get_search_results', fail)
+    [level] = simulator.run()
+    assert level['ops'] == 0
+    assert level['errors'] > 0
+    assert level['error_counts'] == {'ValueError: search failed': level['errors']}
@@ -0,0 +1,60 @@
+import pytest
+from search_engine import NGramSearchEngine, get_grams, GRAM_SIZE
+from text_fields import add_text_fields
+
+QUESTIONS = [
+    {'Id': '1', 'PostTypeId': '1', 'Title': 'Sorting a Dictionary', 'Body': '<p>by value</p>', 'Tags': '<python>'},
+    {'Id': '2', 'PostTypeId': '1', 'Title': 'MongoDB indexes', 'Body': '<p>compound <b>index</b></p>',
+     'Tags': '<mongodb><python>'},
+    {'Id': '3', 'PostTypeId': '1', 'Title': 'Rust lifetimes', 'Body': '<p>borrow checker</p>', 'Tags': '<rust>'},
+    {'Id': '4', 'PostTypeId': '2', 'ParentId': '1', 'Body': '<p>dictionary answer</p>'}
+]
+
+
+@pytest.fixture
+def engine(mongo_client):
+    db = mongo_client['291db']
+    db['Posts'].insert_many([add_text_fields(dict(post)) for post in QUESTIONS])
+    engine = NGramSearchEngine(db['Posts'], db['SearchGrams'])
+    engine.build()
+    return engine
+
+
+def _ids(questions):
+    return [question['Id'] for question in questions]
+
+
+def test_get_grams():
+    assert get_grams('abcd') == {'abc', 'bcd', 'cd ', 'd  '}
+    assert all(len(gram) == GRAM_SIZE for gram in get_grams('x'))
+
+
+def test_search_partial_case_insensitive(engine):
+    assert _ids(engine.search('DICTION')) == ['1']
+    assert _ids(engine.search('lifetime')) == ['3']
+    # answers are not searched
+    assert _ids(engine.search('answer')) == []
+
+
+def test_search_short_keyword(engine):
+    assert sorted(_ids(engine.search('py'))) == ['1', '2']
+
+
+def test_search_verifies_adjacency(engine):
+    # every n-gram of the keyword appears in question 2 but not next to each other
+    assert _ids(engine.search('indexindex')) == []
+
+
+def test_search_ranks_by_keywords_matched(engine):
+    assert _ids(engine.search('python index')) == ['2', '1']
+    assert engine.search('nothing-matches') == []
+
+
+def test_index_and_remove_post(engine):
+    post = add_text_fields({'Id': '5', 'PostTypeId': '1', 'Title': 'Haskell monads', 'Body': '', 'Tags': ''})
+    post['_id'] = engine.posts.insert_one(post).inserted_id
+    engine.index_post(post)
+    assert _ids(engine.search('monad')) == ['5']
+    engine.remove_post(post)
+    assert engine.grams.count_documents({'p': post['_id']}) == 0
+    assert engine.is_built()
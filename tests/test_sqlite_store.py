@@ -0,0 +1,97 @@
+import json
+import pytest
+from ingest_stats import IngestStats
+from phase1 import BuildSQLiteStore
+from sqlite_store import SQLiteManager
+
+POSTS = [
+    {'Id': '1', 'PostTypeId': '1', 'Title': 'Sorting a Dictionary', 'Body': '<p>sort by <b>value</b></p>',
+     'Tags': '<python>', 'Score': 2, 'ViewCount': 10, 'OwnerUserId': '7', 'AcceptedAnswerId': '3',
+     'CreationDate': '2020-01-01T00:00:00.000'},
+    {'Id': '2', 'PostTypeId': '1', 'Title': 'Rust lifetimes', 'Body': '<p>borrow checker</p>', 'Tags': '<rust>',
+     'Score': 5, 'ViewCount': 1, 'OwnerUserId': '7', 'CreationDate': '2020-01-02T00:00:00.000'},
+    {'Id': '3', 'PostTypeId': '2', 'ParentId': '1', 'Body': '<p>use sorted</p>', 'Score': 1,
+     'CreationDate': '2020-01-03T00:00:00.000'},
+    {'Id': '4', 'PostTypeId': '2', 'ParentId': '1', 'Body': '<p>or a loop</p>', 'Score': 0,
+     'CreationDate': '2020-01-04T00:00:00.000'}
+]
+TAGS = [{'Id': '1', 'TagName': 'python', 'Count': 1}, {'Id': '2', 'TagName': 'rust', 'Count': 1}]
+VOTES = [{'Id': '1', 'PostId': '1', 'VoteTypeId': '2', 'UserId': '8', 'CreationDate': '2020-01-05T00:00:00.000'}]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    for name, docs in [('Posts', POSTS), ('Tags', TAGS), ('Votes', VOTES)]:
+        with open(str(tmp_path / (name + '.json')), 'w') as fp:
+            json.dump({name.lower(): {'row': docs}}, fp)
+    db_path = str(tmp_path / '291.db')
+    BuildSQLiteStore(db_path, str(tmp_path), IngestStats(stream=None))
+    manager = SQLiteManager(db_path)
+    yield manager
+    manager.close()
+
+
+def _ids(posts):
+    return [post['Id'] for post in posts]
+
+
+def test_load_repairs_counters(manager):
+    question = manager.get_post_by_id('1')
+    assert question['AnswerCount'] == 2
+    assert question['LastActivityDate'] == '2020-01-04T00:00:00.000'
+    assert question['BodyText'] == 'sort by value'
+    assert manager.get_num_votes('8') == 1
+    assert manager.get_num_owned_posts_and_avg_score('7', 1) == (2, 3.5)
+    assert manager.get_num_owned_posts_and_avg_score('9', 2) == (0, 0)
+
+
+def test_search(manager):
+    assert _ids(manager.get_search_results('DICTION')) == ['1']
+    assert _ids(manager.get_search_results('py')) == ['1']
+    # 'rust' is in the title and tags of question 2 so it ranks above the single match of 'value'
+    assert _ids(manager.get_search_results('rust value')) == ['2', '1']
+    assert manager.get_search_results('nothing') == []
+    assert not manager.has_archive()
+
+
+def test_answers(manager):
+    accepted, answers = manager.get_answers(manager.get_post_by_id('1'))
+    assert accepted
+    assert _ids(answers) == ['3', '4']
+    assert 'Body' in answers[0]
+    assert answers[1]['BodyPreview'] == 'or a loop'
+
+
+def test_post_and_vote(manager):
+    question_oid = manager.add_question('Haskell monads', '<p>what is a monad</p>', ['haskell', 'python'], 9).result()
+    question = manager.get_post(question_oid)
+    assert question['Id'] == '5'
+    assert question['Tags'] == '<haskell><python>'
+    assert _ids(manager.get_search_results('monad')) == ['5']
+    manager.add_answer('5', '<p>a burrito</p>', None).result()
+    question = manager.get_post_by_id('5')
+    assert question['AnswerCount'] == 1
+    assert manager.check_vote_eligibility(question, 9)
+    manager.add_vote(question, 9).result()
+    assert not manager.check_vote_eligibility(question, 9)
+    question = manager.increment_view_count(question)
+    assert (question['Score'], question['ViewCount']) == (1, 1)
+    assert _ids(manager.get_hot_questions('activity'))[0] == '5'
+    assert _ids(manager.get_hot_questions('score', 'python')) == ['1', '5']
+    assert _ids(manager.get_hot_questions('views', 'rust')) == ['2']
+    assert manager.get_cache_stats()['size'] == 0
+
+
+def test_new_ids_come_from_the_sequences(manager):
+    seqs = dict(manager.conn.execute('SELECT name, seq FROM id_sequences').fetchall())
+    assert seqs == {'posts': 4, 'votes': 1, 'tags': 2}
+    plan = ' '.join(row[-1] for row in manager.conn.execute(
+        'EXPLAIN QUERY PLAN UPDATE id_sequences SET seq = seq + 1 WHERE name = ?', ('posts',)
+    ).fetchall())
+    assert 'SCAN' not in plan
+    # a database file built before the sequences existed is seeded from its Ids on the first insert
+    with manager.conn:
+        manager.conn.execute('DELETE FROM id_sequences')
+    manager.add_vote(manager.get_post_by_id('2'), 9).result()
+    manager.add_vote(manager.get_post_by_id('2'), 10).result()
+    assert [row[0] for row in manager.conn.execute('SELECT Id FROM votes ORDER BY _id')] == ['1', '2', '3']
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import Future
+import pytest
+import storage
+from storage import StorageBackend, is_port, open_storage
+from sqlite_store import SQLiteManager
+from utils import completed_future, gather_futures
+
+
+def test_incomplete_backend_cannot_be_created():
+    class IncompleteBackend(StorageBackend):
+        def close(self):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_open_storage(tmp_path):
+    assert is_port('27017') and is_port(27017)
+    assert not is_port(str(tmp_path / '291.db'))
+    backend = open_storage(str(tmp_path / '291.db'))
+    assert isinstance(backend, SQLiteManager)
+    backend.close()
+
+
+def test_sqlite_path_does_not_need_pymongo():
+    # setting pymongo to None in sys.modules makes any import of it fail
+    code = 'import sys; sys.modules["pymongo"] = None; import phase1, phase2, sqlite_store'
+    repo_dir = os.path.dirname(os.path.abspath(storage.__file__))
+    res = subprocess.run([sys.executable, '-c', code], cwd=repo_dir, capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+
+
+def test_gather_futures():
+    pending = Future()
+    combined = gather_futures([completed_future(1), pending])
+    assert not combined.done()
+    pending.set_result(2)
+    assert combined.result(timeout=0) == [1, 2]
+    assert gather_futures([]).result(timeout=0) == []
+    failed = Future()
+    failed.set_exception(ValueError('write failed'))
+    with pytest.raises(ValueError):
+        gather_futures([completed_future(1), failed]).result(timeout=0)
@@ -0,0 +1,73 @@
+import io
+import pytest
+import screens
+import terminal
+
+
+class TTY(io.StringIO):
+    """
+    Text stream that claims to be a terminal and counts the writes made to it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.num_writes = 0
+
+    def isatty(self):
+        return True
+
+    def write(self, text):
+        self.num_writes += 1
+        return super().write(text)
+
+
+@pytest.fixture
+def tty(monkeypatch):
+    monkeypatch.setenv('TERM', 'xterm')
+    stream = TTY()
+    monkeypatch.setattr(terminal, 'renderer', terminal.Renderer(stream))
+    return stream
+
+
+def test_screen_is_a_single_write(tty, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda: 'x')
+    terminal.echo('stale')
+    terminal.clear_screen()
+    terminal.echo('TITLE')
+    terminal.echo(1)
+    assert tty.getvalue() == ''
+    assert terminal.prompt('> ') == 'x'
+    assert tty.getvalue() == terminal.CLEAR_SEQUENCE + 'TITLE\n1\n> '
+    assert tty.num_writes == 1
+
+
+def test_not_a_terminal(monkeypatch):
+    stream = io.StringIO()
+    renderer = terminal.Renderer(stream)
+    renderer.write('kept')
+    renderer.clear()
+    renderer.write('next')
+    renderer.flush()
+    # output that is not going to a terminal is never cleared or dropped
+    assert stream.getvalue() == 'kept\nnext\n'
+
+
+def test_dumb_terminal(monkeypatch):
+    monkeypatch.setenv('TERM', 'dumb')
+    assert not terminal.Renderer(TTY()).supports_ansi()
+
+
+def test_select_from_menu(tty, monkeypatch):
+    inputs = iter(['9', 'Q'])
+    monkeypatch.setattr('builtins.input', lambda: next(inputs))
+    assert screens.select_from_menu(['1', 'q']) == 'q'
+    assert '"9" is an invalid selection' in tty.getvalue()
+
+
+def test_default_stream_follows_stdout(monkeypatch):
+    renderer = terminal.Renderer()
+    stream = io.StringIO()
+    monkeypatch.setattr('sys.stdout', stream)
+    renderer.write('redirected')
+    renderer.flush()
+    assert stream.getvalue() == 'redirected\n'
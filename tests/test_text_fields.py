@@ -0,0 +1,82 @@
+from pymongo import TEXT
+from search_engine import NGramSearchEngine, GRAMS_COLLECTION
+from text_fields import (strip_html, add_text_fields, get_search_text, backfill_text_fields, migrate, needs_migration,
+                         PREVIEW_LENGTH)
+
+OLD_POSTS = [
+    {'Id': '1', 'PostTypeId': '1', 'Title': 'Escaping', 'Body': '<p>use &lt;b&gt; and\n\n<code>&amp;amp;</code></p>',
+     'Tags': '<html>'},
+    {'Id': '2', 'PostTypeId': '2', 'ParentId': '1', 'Body': '<p>' + 'word ' * 40 + '</p>'},
+    {'Id': '3', 'PostTypeId': '1', 'Title': 'No body'}
+]
+
+
+def test_strip_html():
+    assert strip_html('<p>use &lt;b&gt; and\n\n<code>&amp;amp;</code></p>') == 'use <b> and &amp;'
+    assert strip_html('') == ''
+
+
+def test_add_text_fields():
+    post = add_text_fields({'Body': '<p>' + 'word ' * 40 + '</p>'})
+    assert post['BodyText'] == ('word ' * 40).strip()
+    assert post['BodyPreview'] == post['BodyText'][:PREVIEW_LENGTH]
+    assert add_text_fields({'Title': 'no body'}) == {'Title': 'no body'}
+
+
+def test_get_search_text():
+    assert get_search_text({'Title': 'Title', 'BodyText': 'text', 'Body': '<p>html</p>', 'Tags': '<a>'}) == \
+        'title\ntext\n<a>'
+    # posts that have not been backfilled are searched by their html body stripped of its tags
+    assert get_search_text({'Title': 'Title', 'Body': '<p>html</p>'}) == 'title\nhtml'
+
+
+def test_backfill(mongo_client):
+    posts = mongo_client['291db']['Posts']
+    posts.insert_many([dict(post) for post in OLD_POSTS])
+    assert backfill_text_fields(posts) == 2
+    assert posts.find_one({'Id': '1'})['BodyText'] == 'use <b> and &amp;'
+    assert 'BodyText' not in posts.find_one({'Id': '3'})
+    assert backfill_text_fields(posts) == 0
+
+
+def test_search_before_backfill(mongo_client):
+    db = mongo_client['291db']
+    db['Posts'].insert_many([dict(post) for post in OLD_POSTS])
+    db['Posts'].insert_one(add_text_fields({'Id': '4', 'PostTypeId': '1', 'Title': 'New', 'Body': '<p>amp</p>'}))
+    engine = NGramSearchEngine(db['Posts'], db[GRAMS_COLLECTION])
+    engine.build()
+    # the html body of the question that has not been backfilled is indexed without its tags
+    assert sorted(question['Id'] for question in engine.search('amp')) == ['1', '4']
+    assert engine.search('code') == []
+    assert all('Body' not in question for question in engine.search('new'))
+
+
+def test_manager_leaves_the_migration_to_text_fields(mongo_client, manager_factory, capsys):
+    posts = mongo_client['291db']['Posts']
+    posts.insert_many([dict(post) for post in OLD_POSTS])
+    posts.create_index([('Tags', TEXT), ('Title', TEXT), ('Body', TEXT)], name='question_search_index')
+    assert needs_migration(posts)
+    manager_factory()
+    assert 'python3 text_fields.py' in capsys.readouterr().out
+    # startup neither backfills nor touches the text index
+    index_names = [index['name'] for index in posts.list_indexes()]
+    assert 'question_search_index' in index_names
+    assert 'question_text_index' not in index_names
+    assert posts.count_documents({'BodyText': {'$exists': True}}) == 0
+
+
+def test_migrate(mongo_client, manager_factory):
+    posts = mongo_client['291db']['Posts']
+    posts.insert_many([dict(post) for post in OLD_POSTS])
+    posts.create_index([('Tags', TEXT), ('Title', TEXT), ('Body', TEXT)], name='question_search_index')
+    assert migrate(posts) == 2
+    index_names = [index['name'] for index in posts.list_indexes()]
+    assert 'question_search_index' not in index_names
+    assert 'question_text_index' in index_names
+    assert posts.count_documents({'Body': {'$exists': True}, 'BodyText': {'$exists': False}}) == 0
+    assert not needs_migration(posts)
+    manager = manager_factory()
+    accepted, answers = manager.get_answers(manager.get_post_by_id('1'))
+    assert not accepted
+    assert 'Body' not in answers[0]
+    assert answers[0]['BodyPreview'] == ('word ' * 40)[:PREVIEW_LENGTH]
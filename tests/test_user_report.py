@@ -0,0 +1,67 @@
+import csv
+import json
+import pytest
+from archive import ARCHIVED_POSTS_COLLECTION, ARCHIVED_VOTES_COLLECTION
+from data_io import open_file
+from user_report import UserReport
+from vote_buckets import VoteBucketStore
+
+POSTS = [
+    {'Id': '1', 'PostTypeId': '1', 'OwnerUserId': '7', 'Score': 4},
+    {'Id': '2', 'PostTypeId': '2', 'ParentId': '1', 'OwnerUserId': '7', 'Score': 1},
+    {'Id': '3', 'PostTypeId': '2', 'ParentId': '1', 'OwnerUserId': '8', 'Score': 3},
+    {'Id': '4', 'PostTypeId': '2', 'ParentId': '1', 'Score': 9}
+]
+ARCHIVED_POSTS = [{'Id': '5', 'PostTypeId': '1', 'OwnerUserId': '7', 'Score': 0}]
+VOTES = [
+    {'Id': '1', 'PostId': '1', 'UserId': '8'},
+    {'Id': '2', 'PostId': '2', 'UserId': '9'},
+    {'Id': '3', 'PostId': '3'}
+]
+ARCHIVED_VOTES = [{'Id': '4', 'PostId': '5', 'UserId': '8'}]
+EXPECTED = [
+    {'UserId': '7', 'NumQuestions': 2, 'AvgQuestionScore': 2, 'NumAnswers': 1, 'AvgAnswerScore': 1, 'NumVotes': 0},
+    {'UserId': '8', 'NumQuestions': 0, 'AvgQuestionScore': 0, 'NumAnswers': 1, 'AvgAnswerScore': 3, 'NumVotes': 2},
+    {'UserId': '9', 'NumQuestions': 0, 'AvgQuestionScore': 0, 'NumAnswers': 0, 'AvgAnswerScore': 0, 'NumVotes': 1}
+]
+
+
+@pytest.fixture
+def db(mongo_client):
+    db = mongo_client['291db']
+    for name, docs in [('Posts', POSTS), (ARCHIVED_POSTS_COLLECTION, ARCHIVED_POSTS), ('Votes', VOTES),
+                       (ARCHIVED_VOTES_COLLECTION, ARCHIVED_VOTES)]:
+        db[name].insert_many([dict(doc) for doc in docs])
+    return db
+
+
+def test_iter_rows(db):
+    assert list(UserReport(db).iter_rows()) == EXPECTED
+
+
+def test_iter_rows_bucketed(db):
+    VoteBucketStore(db).migrate(db['Votes'])
+    # with the bucketed layout the rollup is the only source of vote counts (the archived votes are not read again)
+    rows = list(UserReport(db).iter_rows())
+    assert [row['NumVotes'] for row in rows] == [0, 1, 1]
+
+
+def test_int_user_ids(mongo_client, monkeypatch):
+    report = UserReport(mongo_client['291db'])
+    stats = {'NumQuestions': 1, 'QuestionScore': 5, 'NumAnswers': 0, 'AnswerScore': 0, 'NumVotes': 0}
+    monkeypatch.setattr(report, '_iter_user_stats', lambda: iter([dict(stats, _id=12)]))
+    assert list(report.iter_rows()) == [dict(EXPECTED[2], UserId='12', NumQuestions=1, AvgQuestionScore=5, NumVotes=0)]
+
+
+def test_write(db, tmp_path):
+    report = UserReport(db)
+    csv_path = str(tmp_path / 'report.csv')
+    assert report.write(csv_path) == len(EXPECTED)
+    with open(csv_path, newline='') as fp:
+        rows = list(csv.DictReader(fp))
+    assert [row['UserId'] for row in rows] == ['7', '8', '9']
+    assert rows[0]['AvgQuestionScore'] == '2.0'
+    jsonl_path = str(tmp_path / 'report.jsonl.gz')
+    assert report.write(jsonl_path, 'jsonl') == len(EXPECTED)
+    with open_file(jsonl_path) as fp:
+        assert [json.loads(line) for line in fp] == EXPECTED
@@ -0,0 +1,156 @@
+import os
+import pytest
+import views
+from views import HotQuestionViews, get_view_id
+
+QUESTIONS = [
+    {'Id': str(i), 'PostTypeId': '1', 'Title': 'question {}'.format(i), 'Tags': '<python>', 'Score': score,
+     'ViewCount': view_count, 'AnswerCount': 0, 'CreationDate': '2020-01-01T00:00:00.000',
+     'LastActivityDate': last_activity}
+    for i, (score, view_count, last_activity) in enumerate([(5, 10, '2020-01-03'), (9, 1, '2020-01-01'),
+                                                            (1, 50, '2020-01-02')], 1)
+]
+
+# database that the tests against a real MongoDB server use (dropped afterwards)
+MONGOD_TEST_DB = '291db_test_views'
+
+
+@pytest.fixture
+def hot_views(mongo_client):
+    db = mongo_client[views.DB_NAME]
+    db['Posts'].insert_many([dict(question) for question in QUESTIONS])
+    db['Posts'].insert_one({'Id': '4', 'PostTypeId': '2', 'ParentId': '1', 'Score': 100})
+    return HotQuestionViews(db)
+
+
+class RecordingRefresh:
+    """
+    Stands in for HotQuestionViews._refresh_tags (mongomock does not implement $topN) and records its arguments.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, refreshed, tags=None, question_ids=None):
+        self.calls.append((tags, question_ids))
+
+
+class RecordingCollection:
+    """
+    Stands in for the Posts collection and records the pipelines it is asked to run.
+    """
+
+    def __init__(self):
+        self.pipelines = []
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        return iter([])
+
+
+def test_refresh_overall(hot_views):
+    hot_views._refresh_overall('2020-02-01')
+    assert [question['Id'] for question in hot_views.get_view('score')] == ['2', '1', '3']
+    assert [question['Id'] for question in hot_views.get_view('views')] == ['3', '1', '2']
+    assert [question['Id'] for question in hot_views.get_view('activity')] == ['1', '3', '2']
+    assert set(hot_views.get_view('score')[0]) == set(views.SUMMARY_FIELDS) | {'_id'}
+    assert hot_views.get_view('score', 'python') == []
+
+
+def test_refresh_full_then_incremental(hot_views, monkeypatch):
+    refresh_tags = RecordingRefresh()
+    monkeypatch.setattr(hot_views, '_refresh_tags', refresh_tags)
+    monkeypatch.setattr(hot_views, '_get_touched_questions', lambda since: (['oid'], ['python']))
+    assert hot_views.get_last_refresh() is None
+    # the first refresh is always a full one
+    assert hot_views.refresh() is None
+    assert hot_views.get_last_refresh() is not None
+    assert hot_views.refresh() == ['python']
+    assert hot_views.refresh(full=True) is None
+    assert refresh_tags.calls == [(None, None), (['python'], ['oid']), (None, None)]
+
+
+def test_refresh_without_activity(hot_views, monkeypatch):
+    refresh_tags = RecordingRefresh()
+    monkeypatch.setattr(hot_views, '_refresh_tags', refresh_tags)
+    monkeypatch.setattr(hot_views, '_get_touched_questions', lambda since: ([], []))
+    hot_views.refresh()
+    assert hot_views.refresh() == []
+    assert refresh_tags.calls == [(None, None)]
+
+
+def test_incremental_refresh_reads_questions_in_views(hot_views, monkeypatch):
+    question = hot_views.posts.find_one({'Id': '3'})
+    hot_views.views.insert_one({'_id': get_view_id('score', 'python'), 'questions': [{'_id': question['_id']}]})
+    assert hot_views._get_view_question_ids('score', ['python', 'rust']) == {question['_id']}
+    assert hot_views._get_view_question_ids('views', ['python']) == set()
+    posts = RecordingCollection()
+    monkeypatch.setattr(hot_views, 'posts', posts)
+    hot_views._refresh_tags('2020-02-01', ['python'], ['touched'])
+    pipelines = posts.pipelines
+    match = pipelines[list(views.VIEW_KINDS).index('score')][0]['$match']
+    assert set(match['_id']['$in']) == {'touched', question['_id']}
+    assert {'$match': {'tag_list': {'$in': ['python']}}} in pipelines[0]
+
+
+def test_create_indexes(hot_views):
+    hot_views.create_indexes()
+    index_names = [index['name'] for index in hot_views.posts.list_indexes()]
+    assert all('post_hot_{}_index'.format(kind) in index_names for kind in views.VIEW_KINDS)
+
+
+def test_manager_reads_views(mongo_client, manager_factory):
+    manager = manager_factory()
+    mongo_client[views.DB_NAME]['Posts'].insert_many([dict(question) for question in QUESTIONS])
+    HotQuestionViews(manager.db)._refresh_overall('2020-02-01')
+    assert [question['Id'] for question in manager.get_hot_questions('score')] == ['2', '1', '3']
+
+
+@pytest.fixture
+def mongod_db():
+    """
+    :return: database on a real MongoDB server at MONGODB_PORT (27017 by default) - the test is skipped if no server
+             is running or it is older than 5.2 (which $topN needs)
+    """
+    pymongo = pytest.importorskip('pymongo')
+    client = pymongo.MongoClient(port=int(os.environ.get('MONGODB_PORT', 27017)), serverSelectionTimeoutMS=500)
+    try:
+        version = client.server_info()['version']
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip('no MongoDB server is running')
+    if tuple(int(part) for part in version.split('.')[:2]) < (5, 2):
+        client.close()
+        pytest.skip('the per tag views need MongoDB 5.2+')
+    client.drop_database(MONGOD_TEST_DB)
+    yield client[MONGOD_TEST_DB]
+    client.drop_database(MONGOD_TEST_DB)
+    client.close()
+
+
+def test_refresh_tags_on_mongod(mongod_db, monkeypatch):
+    monkeypatch.setattr(views, 'TOP_N', 2)
+    tags = ['<python><mongodb>', '<python>', '<mongodb>']
+    questions = [dict(question, Tags=question_tags) for question, question_tags in zip(QUESTIONS, tags)]
+    questions.append(dict(QUESTIONS[0], Id='5', Score=0, ViewCount=0, Tags='<python>',
+                          LastActivityDate='2020-01-02T12:00:00.000'))
+    mongod_db['Posts'].insert_many(questions)
+    mongod_db['Posts'].insert_one({'Id': '4', 'PostTypeId': '2', 'ParentId': '1', 'Score': 100, 'Tags': '<python>'})
+    hot_views = HotQuestionViews(mongod_db)
+    hot_views.create_indexes()
+    assert hot_views.refresh() is None
+
+    def ids(kind, tag):
+        return [question['Id'] for question in hot_views.get_view(kind, tag)]
+
+    # only the top TOP_N questions of each tag are kept
+    assert ids('score', 'python') == ['2', '1']
+    assert ids('views', 'mongodb') == ['3', '1']
+    assert ids('activity', 'python') == ['1', '5']
+    assert set(hot_views.get_view('score', 'mongodb')[0]) == set(views.SUMMARY_FIELDS) | {'_id'}
+    # activity on question 3 refreshes the views of its tag (and question 1 is kept from the view it is already in)
+    mongod_db['Posts'].update_one({'Id': '3'}, {'$set': {'Score': 20, 'LastActivityDate': views._get_now()}})
+    assert hot_views.refresh() == ['mongodb']
+    assert ids('score', 'mongodb') == ['3', '1']
+    assert ids('activity', 'mongodb') == ['3', '1']
+    assert ids('score', 'python') == ['2', '1']
@@ -0,0 +1,101 @@
+import pytest
+import vote_buckets
+from vote_buckets import VoteBucketStore, pack_buckets, get_vote_layout, BUCKETED_LAYOUT
+
+VOTES = [
+    {'Id': str(i), 'PostId': post_id, 'VoteTypeId': '2', 'UserId': user_id, 'CreationDate': '2020-01-01'}
+    for i, (post_id, user_id) in enumerate([('1', 'a'), ('1', 'b'), ('2', 'a'), ('1', 'c'), ('3', 'a'), ('1', 'd'),
+                                            ('1', 'e')], 1)
+]
+
+
+@pytest.fixture
+def db(mongo_client, monkeypatch):
+    monkeypatch.setattr(vote_buckets, 'BUCKET_SIZE', 2)
+    db = mongo_client[vote_buckets.DB_NAME]
+    db['Votes'].insert_many([dict(vote) for vote in VOTES])
+    return db
+
+
+def _get_layout(buckets):
+    return sorted((bucket['PostId'], bucket['seq'], bucket['n']) for bucket in buckets)
+
+
+def test_pack_buckets(db):
+    buckets = pack_buckets(VOTES)
+    assert _get_layout(buckets) == [('1', 0, 2), ('1', 1, 2), ('1', 2, 1), ('2', 0, 1), ('3', 0, 1)]
+    assert buckets[0]['votes'][0] == {'Id': '1', 'VoteTypeId': '2', 'UserId': 'a', 'CreationDate': '2020-01-01'}
+
+
+def test_migrate(db, monkeypatch):
+    monkeypatch.setattr(vote_buckets, 'MIGRATION_BATCH_SIZE', 1)
+    store = VoteBucketStore(db)
+    assert store.migrate(db['Votes'], drop_flat=True) == len(VOTES)
+    assert get_vote_layout(db) == BUCKETED_LAYOUT
+    assert 'Votes' not in db.list_collection_names()
+    assert _get_layout(store.buckets.find()) == [('1', 0, 2), ('1', 1, 2), ('1', 2, 1), ('2', 0, 1), ('3', 0, 1)]
+    assert {res['_id']: res['Count'] for res in store.post_vote_counts.find()} == {'1': 5, '2': 1, '3': 1}
+    # (mongomock does not implement $mergeObjects so FLAT_VOTES_PIPELINE is not used here)
+    flat = [dict(vote, PostId=bucket['PostId']) for bucket in store.buckets.find() for vote in bucket['votes']]
+    assert sorted(flat, key=lambda vote: int(vote['Id'])) == VOTES
+    assert store.get_num_votes('a') == 3
+    assert store.get_num_votes('z') == 0
+    assert store.has_voted('1', 'c')
+    assert not store.has_voted('2', 'c')
+    assert store.get_new_id() == str(len(VOTES) + 1)
+
+
+def test_allocate_bucket(db):
+    store = VoteBucketStore(db)
+    assert [store.allocate_bucket('9') for _ in range(5)] == [0, 0, 1, 1, 2]
+    assert store.allocate_bucket('8') == 0
+
+
+def test_insert_votes(db):
+    store = VoteBucketStore(db)
+    store.insert_votes([vote for vote in VOTES if vote['PostId'] == '1'])
+    assert _get_layout(store.buckets.find()) == [('1', 0, 2), ('1', 1, 2), ('1', 2, 1)]
+    # the next vote on the post goes in the bucket that is filling up
+    assert store.allocate_bucket('1') == 2
+    store.insert_votes([])
+
+
+def test_manager_adds_votes_to_buckets(db, manager_factory):
+    VoteBucketStore(db).migrate(db['Votes'])
+    manager = manager_factory()
+    db['Posts'].insert_one({'Id': '3', 'PostTypeId': '1', 'Score': 1})
+    post = manager.get_post_by_id('3')
+    assert not manager.check_vote_eligibility(post, 'a')
+    assert manager.check_vote_eligibility(post, 'b')
+    manager.add_vote(post, 'b').result()
+    manager.add_vote(post, None).result()
+    assert not manager.check_vote_eligibility(post, 'b')
+    assert _get_layout(db[vote_buckets.BUCKETS_COLLECTION].find({'PostId': '3'})) == [('3', 0, 2), ('3', 1, 1)]
+    assert manager.get_num_votes('b') == 2
+    assert manager.get_post_by_id('3')['Score'] == 3
+    vote_ids = [vote['Id'] for bucket in db[vote_buckets.BUCKETS_COLLECTION].find() for vote in bucket['votes']]
+    assert len(set(vote_ids)) == len(VOTES) + 2
+
+
+def test_migrate_seeds_the_sequence_from_every_tier(db):
+    store = VoteBucketStore(db)
+    db[vote_buckets.ARCHIVED_VOTES_COLLECTION].insert_one({'Id': '20', 'PostId': '9', 'VoteTypeId': '2'})
+    store.migrate(db['Votes'])
+    assert store.get_new_id() == '21'
+    # a vote added in the bucketed layout (with an Id beyond the archive) is not in the flat collection
+    store.buckets.update_one({'PostId': '2'}, {'$push': {'votes': {'Id': '30', 'VoteTypeId': '2'}}})
+    store.metadata.delete_many({})
+    store.migrate(db['Votes'])
+    assert store.get_new_id() == '31'
+
+
+def test_new_ids_stay_ahead_of_the_archive(db, manager_factory):
+    store = VoteBucketStore(db)
+    store.migrate(db['Votes'])
+    assert store.get_new_id(min_id=40) == '41'
+    assert store.get_new_id() == '42'
+    # votes archived after the migration (with Ids beyond the sequence)
+    db['ArchivedPosts'].insert_one({'Id': '9', 'PostTypeId': '1'})
+    db[vote_buckets.ARCHIVED_VOTES_COLLECTION].insert_one({'Id': '50', 'PostId': '9', 'VoteTypeId': '2'})
+    manager = manager_factory()
+    assert manager._get_new_id('vote') == '51'
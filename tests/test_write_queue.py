@@ -0,0 +1,122 @@
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def collection(mongo_client):
+    return mongo_client['291db']['Votes']
+
+
+def test_group_commit(collection):
+    write_queue = WriteQueue(flush_interval=60, batch_size=3)
+    futures = [write_queue.submit(collection, InsertOne({'Id': str(i)})) for i in range(3)]
+    # the batch is full so it is committed without waiting for the flush interval
+    assert [future.result(timeout=5).inserted_count for future in futures] == [3, 3, 3]
+    future = write_queue.submit(collection, UpdateOne({'Id': '0'}, {'$set': {'x': 1}}))
+    assert not future.done()
+    write_queue.flush()
+    assert future.done()
+    write_queue.close()
+    assert (write_queue.num_batches, write_queue.num_writes) == (2, 4)
+    assert collection.count_documents({'x': 1}) == 1
+
+
+def test_close_commits_pending_writes_and_rejects_new_ones(collection):
+    write_queue = WriteQueue(flush_interval=60)
+    future = write_queue.submit(collection, InsertOne({'Id': '1'}))
+    write_queue.close()
+    assert future.result(timeout=0) is not None
+    with pytest.raises(RuntimeError):
+        write_queue.submit(collection, InsertOne({'Id': '2'}))
+    # flushing or closing a closed queue returns immediately
+    write_queue.flush()
+    write_queue.close()
+    assert collection.count_documents({}) == 1
+
+
+def test_partial_failure(collection):
+    collection.create_index('Id', unique=True)
+    write_queue = WriteQueue(flush_interval=60)
+    futures = [write_queue.submit(collection, InsertOne({'Id': doc_id})) for doc_id in ['1', '1', '2']]
+    write_queue.close()
+    assert futures[0].exception() is None
+    # the duplicate fails and, since the bulk write is ordered, so does the write after it
+    assert isinstance(futures[1].exception(), BulkWriteError)
+    assert isinstance(futures[2].exception(), BulkWriteError)
+
+
+def test_queued_votes_are_not_eligible(manager_factory):
+    manager = manager_factory(use_write_queue=True, flush_interval=60)
+    manager.posts.insert_one({'Id': '1', 'PostTypeId': '1', 'Score': 0})
+    post = manager.get_post_by_id('1')
+    assert manager.check_vote_eligibility(post, '5')
+    future = manager.add_vote(post, '5')
+    assert not future.done()
+    assert not manager.check_vote_eligibility(post, '5')
+    assert manager.check_vote_eligibility(post, '6')
+    manager.write_queue.flush()
+    assert future.done()
+    assert manager._queued_votes == set()
+    assert not manager.check_vote_eligibility(post, '5')
+    assert manager.posts.find_one({'Id': '1'})['Score'] == 1
+
+
+class BrokenCollection:
+    """
+    Stands in for a pymongo collection that fails before a bulk write can be sent.
+    """
+
+    @property
+    def full_name(self):
+        raise ValueError('no collection')
+
+
+class WriteConcernFailingCollection:
+    """
+    Stands in for a pymongo collection whose writes are applied but do not satisfy the write concern.
+    """
+
+    full_name = '291db.Votes'
+
+    def bulk_write(self, requests, ordered=True):
+        raise BulkWriteError({'writeErrors': [], 'nInserted': len(requests),
+                              'writeConcernErrors': [{'code': 64, 'errmsg': 'waiting for replication timed out'}]})
+
+
+def test_commit_error_fails_the_batch_and_keeps_the_queue_running(collection):
+    write_queue = WriteQueue(flush_interval=60)
+    futures = [write_queue.submit(BrokenCollection(), InsertOne({'Id': '1'})),
+               write_queue.submit(collection, InsertOne({'Id': '2'}))]
+    write_queue.flush()
+    assert all(isinstance(future.exception(timeout=0), ValueError) for future in futures)
+    future = write_queue.submit(collection, InsertOne({'Id': '3'}))
+    write_queue.close()
+    assert future.result(timeout=0).inserted_count == 1
+    assert collection.count_documents({}) == 1
+
+
+def test_write_concern_errors_fail_every_write():
+    write_queue = WriteQueue(flush_interval=60)
+    futures = [write_queue.submit(WriteConcernFailingCollection(), InsertOne({'Id': str(i)})) for i in range(2)]
+    write_queue.close()
+    assert all(isinstance(future.exception(timeout=0), BulkWriteError) for future in futures)
+
+
+def test_question_tags_and_grams_are_queued(manager_factory):
+    manager = manager_factory()
+    manager.posts.insert_one({'Id': '1', 'PostTypeId': '1', 'Title': 'old', 'Body': '', 'Tags': '<python>'})
+    manager.tags.insert_one({'Id': '1', 'TagName': 'python', 'Count': 1})
+    manager.search_engine.build()
+    manager.close()
+    manager = manager_factory(use_write_queue=True, flush_interval=60)
+    assert manager.use_ngram_search
+    futures = [manager.add_question('haskell monads', '<p>body</p>', ['haskell', 'python'], '2') for _ in range(2)]
+    assert manager.tags.count_documents({}) == 1
+    assert manager.search_engine.grams.count_documents({'g': 'has'}) == 0
+    manager.write_queue.flush()
+    assert all(future.done() and future.exception() is None for future in futures)
+    # the second question increments the tag that the first one inserted (while it was still queued)
+    assert sorted((tag['TagName'], tag['Count']) for tag in manager.tags.find()) == [('haskell', 2), ('python', 3)]
+    assert len(manager.search_engine.search('haskell')) == 2
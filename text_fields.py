@@ -0,0 +1,141 @@
+import html
+import re
+import sys
+from data_io import iter_batches
+
+DB_NAME = '291db'
+# number of characters of the plain text body kept in the preview (as many as the answer listings show)
+PREVIEW_LENGTH = 80
+BODY_TEXT_FIELD = 'BodyText'
+BODY_PREVIEW_FIELD = 'BodyPreview'
+# projection that leaves out the full body fields of posts that are only listed (the preview is kept)
+LISTING_PROJECTION = {'Body': 0, BODY_TEXT_FIELD: 0}
+# fields of a question that are searched (the plain text body rather than the html body)
+SEARCH_FIELDS = ['Title', BODY_TEXT_FIELD, 'Tags']
+BACKFILL_BATCH_SIZE = 1000
+# $text index of the questions on the plain text body and the one on the html body that it replaces
+TEXT_INDEX = 'question_text_index'
+OLD_TEXT_INDEX = 'question_search_index'
+TAG_PATTERN = re.compile(r'<[^>]*>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def strip_html(body):
+    """
+    Converts the html of a post body to plain text - tags are replaced by spaces, character references are unescaped,
+    and runs of whitespace are collapsed into single spaces.
+    :param body: html string
+    :return: plain text string
+    """
+    return WHITESPACE_PATTERN.sub(' ', html.unescape(TAG_PATTERN.sub(' ', body))).strip()
+
+
+def add_text_fields(post_data):
+    """
+    Adds the derived plain text fields of a post: BodyText (the body stripped of html) and BodyPreview (the first
+    PREVIEW_LENGTH characters of BodyText). Posts without a body are left as they are.
+    :param post_data: dict corresponding to the document of the post (modified in place)
+    :return: the same dict
+    """
+    if post_data.get('Body') is not None:
+        body_text = strip_html(post_data['Body'])
+        post_data[BODY_TEXT_FIELD] = body_text
+        post_data[BODY_PREVIEW_FIELD] = body_text[:PREVIEW_LENGTH]
+    return post_data
+
+
+def get_search_text(post_data):
+    """
+    Gets the text that is searched for a question - the lower case title, plain text body, and tags of the question
+    separated by newlines (missing fields are skipped). If the question has no plain text body yet it is derived from
+    its html body.
+    :param post_data: dict corresponding to the document of the question
+    :return: string containing the searchable text of the question
+    """
+    if post_data.get(BODY_TEXT_FIELD) is None and post_data.get('Body') is not None:
+        post_data = dict(post_data, **{BODY_TEXT_FIELD: strip_html(post_data['Body'])})
+    return '\n'.join(post_data[field] for field in SEARCH_FIELDS if post_data.get(field)).lower()
+
+
+def backfill_text_fields(posts):
+    """
+    Adds the derived plain text fields to every post that does not have them yet (e.g. posts loaded before the fields
+    existed) with batched bulk writes.
+    :param posts: pymongo collection containing the posts
+    :return: int corresponding to the number of posts that were updated
+    """
+    # imported here (like the MongoDB only modules in phase1) since the plain text helpers are also used by the SQLite
+    # backend, which works without pymongo installed
+    from pymongo import UpdateOne
+    query = {'Body': {'$exists': True}, BODY_TEXT_FIELD: {'$exists': False}}
+    num_updated = 0
+    for batch in iter_batches(posts.find(query, {'Body': 1}), BACKFILL_BATCH_SIZE):
+        requests = []
+        for post in batch:
+            add_text_fields(post)
+            requests.append(UpdateOne({'_id': post['_id']}, {'$set': {
+                BODY_TEXT_FIELD: post[BODY_TEXT_FIELD],
+                BODY_PREVIEW_FIELD: post[BODY_PREVIEW_FIELD]
+            }}))
+        posts.bulk_write(requests, ordered=False)
+        num_updated += len(requests)
+    return num_updated
+
+
+def create_text_index(posts):
+    """
+    Creates the $text index of the questions on their title, tags, and plain text body.
+    :param posts: pymongo collection containing the posts
+    """
+    from pymongo import TEXT
+    posts.create_index(
+        [('Tags', TEXT), ('Title', TEXT), (BODY_TEXT_FIELD, TEXT)],
+        default_language='none',
+        name=TEXT_INDEX
+    )
+
+
+def needs_migration(posts):
+    """
+    Checks whether a Posts collection loaded before the plain text fields existed still has to be migrated (see
+    migrate). Only meant to be called when the collection does not have the new $text index yet.
+    :param posts: pymongo collection containing the posts
+    :return: True if the collection still has the $text index on the html body or posts without the plain text fields
+    """
+    if OLD_TEXT_INDEX in [index['name'] for index in posts.list_indexes()]:
+        return True
+    query = {'Body': {'$exists': True}, BODY_TEXT_FIELD: {'$exists': False}}
+    return posts.find_one(query, {'_id': 1}) is not None
+
+
+def migrate(posts):
+    """
+    Migrates a Posts collection loaded before the plain text fields existed - backfills the fields (see
+    backfill_text_fields) and then replaces the $text index on the html body with the one on the plain text body.
+    The backfill comes first, otherwise the new index would silently miss the words in the bodies of the posts that
+    do not have the fields yet.
+    :param posts: pymongo collection containing the posts
+    :return: int corresponding to the number of posts that were backfilled
+    """
+    num_backfilled = backfill_text_fields(posts)
+    # a collection can only have one text index so the one on the html body has to be dropped first
+    if OLD_TEXT_INDEX in [index['name'] for index in posts.list_indexes()]:
+        posts.drop_index(OLD_TEXT_INDEX)
+    create_text_index(posts)
+    return num_backfilled
+
+
+if __name__ == '__main__':
+    assert (len(sys.argv) == 2), 'please enter the correct number of arguments - this program should be run using ' \
+                                 '"python3 text_fields.py PORT_NUMBER"'
+    try:
+        port_no = int(sys.argv[1])
+    except ValueError:
+        assert False, 'ValueError - please ensure that the port number specified is an integer'
+    from pymongo import MongoClient
+    client = MongoClient(port=port_no)
+    print('Backfilled {} posts'.format(migrate(client[DB_NAME]['Posts'])))
+    # the archive collection is named here rather than imported since archive.py depends on this module (its $text
+    # index has always been on the plain text body, so it only needs the backfill)
+    print('Backfilled {} archived posts'.format(backfill_text_fields(client[DB_NAME]['ArchivedPosts'])))
+    client.close()
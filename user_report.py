@@ -0,0 +1,139 @@
+import argparse
+import csv
+import json
+from pymongo import MongoClient
+from archive import ARCHIVED_POSTS_COLLECTION, ARCHIVED_VOTES_COLLECTION
+from data_io import open_file
+from vote_buckets import get_vote_layout, BUCKETED_LAYOUT, USER_VOTE_COUNTS_COLLECTION
+
+DB_NAME = '291db'
+QUESTION_TYPE_ID = '1'
+ANSWER_TYPE_ID = '2'
+REPORT_FIELDS = ['UserId', 'NumQuestions', 'AvgQuestionScore', 'NumAnswers', 'AvgAnswerScore', 'NumVotes']
+CURSOR_BATCH_SIZE = 1000
+
+
+def _is_type(post_type_id):
+    return {'$eq': ['$PostTypeId', post_type_id]}
+
+
+class UserReport:
+    """
+    Class that computes the MainMenu user report (number of questions and answers owned, their average scores, and
+    number of votes) for every user at once with a single aggregation. The hot and archived posts and the votes (or
+    the per-user rollup with the bucketed vote layout) are combined with $unionWith into one stream of per-user
+    contributions that a single $group (spilling to disk if needed) sums up, so users are matched by the server with
+    their raw UserId values and memory use in python does not grow with the number of users.
+    """
+
+    def __init__(self, db):
+        """
+        Initializes an instance of this class.
+        :param db: pymongo database
+        """
+        self.db = db
+        self.posts = db['Posts']
+
+    def _get_post_pipeline(self):
+        """
+        :return: list of the aggregation stages that turn each question or answer into the contribution of its owner
+        """
+        return [
+            {'$match': {
+                'OwnerUserId': {'$exists': True},
+                'PostTypeId': {'$in': [QUESTION_TYPE_ID, ANSWER_TYPE_ID]}
+            }},
+            {'$project': {
+                '_id': 0,
+                'UserId': '$OwnerUserId',
+                'NumQuestions': {'$cond': [_is_type(QUESTION_TYPE_ID), 1, 0]},
+                'QuestionScore': {'$cond': [_is_type(QUESTION_TYPE_ID), '$Score', 0]},
+                'NumAnswers': {'$cond': [_is_type(ANSWER_TYPE_ID), 1, 0]},
+                'AnswerScore': {'$cond': [_is_type(ANSWER_TYPE_ID), '$Score', 0]}
+            }}
+        ]
+
+    def _get_vote_sources(self):
+        """
+        :return: list of $unionWith stages that add the contribution of every vote to the stream (the rollup already
+                 counts every vote - archived votes included - with the bucketed vote layout)
+        """
+        if get_vote_layout(self.db) == BUCKETED_LAYOUT:
+            rollup = [{'$project': {'_id': 0, 'UserId': '$_id', 'NumVotes': '$Count'}}]
+            return [{'$unionWith': {'coll': USER_VOTE_COUNTS_COLLECTION, 'pipeline': rollup}}]
+        votes = [
+            {'$match': {'UserId': {'$exists': True}}},
+            {'$project': {'_id': 0, 'UserId': 1, 'NumVotes': {'$literal': 1}}}
+        ]
+        return [
+            {'$unionWith': {'coll': 'Votes', 'pipeline': votes}},
+            {'$unionWith': {'coll': ARCHIVED_VOTES_COLLECTION, 'pipeline': votes}}
+        ]
+
+    def _iter_user_stats(self):
+        """
+        :return: cursor over dicts of the form {'_id': UserId, 'NumQuestions': ..., 'QuestionScore': ...,
+                 'NumAnswers': ..., 'AnswerScore': ..., 'NumVotes': ...} sorted by UserId (the scores are sums)
+        """
+        post_pipeline = self._get_post_pipeline()
+        pipeline = post_pipeline + [
+            {'$unionWith': {'coll': ARCHIVED_POSTS_COLLECTION, 'pipeline': post_pipeline}}
+        ] + self._get_vote_sources() + [
+            {'$group': {
+                '_id': '$UserId',
+                'NumQuestions': {'$sum': '$NumQuestions'},
+                'QuestionScore': {'$sum': '$QuestionScore'},
+                'NumAnswers': {'$sum': '$NumAnswers'},
+                'AnswerScore': {'$sum': '$AnswerScore'},
+                'NumVotes': {'$sum': '$NumVotes'}
+            }},
+            {'$sort': {'_id': 1}}
+        ]
+        return self.posts.aggregate(pipeline, allowDiskUse=True, batchSize=CURSOR_BATCH_SIZE)
+
+    def iter_rows(self):
+        """
+        Turns the per-user sums into report rows (a user with no posts or no votes gets zeros for them).
+        :return: generator of dicts with the REPORT_FIELDS keys, one per user in user id order
+        """
+        for stats in self._iter_user_stats():
+            yield {
+                'UserId': str(stats['_id']),
+                'NumQuestions': stats['NumQuestions'],
+                'AvgQuestionScore': stats['QuestionScore'] / stats['NumQuestions'] if stats['NumQuestions'] > 0 else 0,
+                'NumAnswers': stats['NumAnswers'],
+                'AvgAnswerScore': stats['AnswerScore'] / stats['NumAnswers'] if stats['NumAnswers'] > 0 else 0,
+                'NumVotes': stats['NumVotes']
+            }
+
+    def write(self, output_path, file_format='csv'):
+        """
+        Streams the report to a file (compressed if output_path ends with .gz, .bz2, or .xz).
+        :param output_path: path of the file to write the report to
+        :param file_format: 'csv' (with a header row) or 'jsonl' (one json object per line)
+        :return: int corresponding to the number of users in the report
+        """
+        num_rows = 0
+        with open_file(output_path, 'wt') as f:
+            if file_format == 'csv':
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                for row in self.iter_rows():
+                    writer.writerow(row)
+                    num_rows += 1
+            else:
+                for row in self.iter_rows():
+                    f.write(json.dumps(row) + '\n')
+                    num_rows += 1
+        return num_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes the user report of every user to a CSV or JSON Lines file')
+    parser.add_argument('port', type=int, help='port of the MongoDB server')
+    parser.add_argument('output_file', help='file to write the report to (.gz, .bz2, or .xz to compress it)')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    args = parser.parse_args()
+    client = MongoClient(port=args.port)
+    print('Wrote the report of {} users'.format(UserReport(client[DB_NAME]).write(args.output_file, args.format)))
+    client.close()
@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import Future
+
+
+def completed_future(result):
+    """
+    :param result: result of the future
+    :return: a concurrent.futures.Future that has already been resolved with result
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def gather_futures(futures):
+    """
+    Combines futures into a single future that resolves once all of them have resolved. If any of them fail the
+    combined future fails with the first exception.
+    :param futures: list of concurrent.futures.Future
+    :return: concurrent.futures.Future that resolves with the list of results
+    """
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        for future in futures:
+            if future.exception() is not None:
+                combined.set_exception(future.exception())
+                return
+        combined.set_result([future.result() for future in futures])
+
+    if len(futures) == 0:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    :param sorted_values: list of values sorted in ascending order
+    :param percentile: percentile to get (0-100)
+    :return: the nearest-rank percentile of the values (0 if there are no values)
+    """
+    if len(sorted_values) == 0:
+        return 0
+    rank = max(1, int(round(percentile / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
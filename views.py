@@ -0,0 +1,217 @@
+import argparse
+import time
+from datetime import datetime
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from vote_buckets import METADATA_COLLECTION
+
+DB_NAME = '291db'
+QUESTION_TYPE_ID = '1'
+VIEWS_COLLECTION = 'HotQuestions'
+# the kinds of views and the field that the questions of each kind are ranked by
+VIEW_KINDS = {'score': 'Score', 'views': 'ViewCount', 'activity': 'LastActivityDate'}
+# tag value of the views over all questions
+ALL_TAGS = '*'
+TOP_N = 50
+SUMMARY_FIELDS = ['Id', 'Title', 'Score', 'ViewCount', 'AnswerCount', 'CreationDate', 'LastActivityDate']
+REFRESHED_AT_KEY = 'views_refreshed_at'
+DEFAULT_REFRESH_INTERVAL = 60
+DEFAULT_FULL_REFRESH_EVERY = 10
+# expression splitting a tag string such as '<python><mongodb>' into ['python', 'mongodb']
+TAG_LIST_EXPRESSION = {'$cond': [
+    {'$gt': [{'$strLenCP': {'$ifNull': ['$Tags', '']}}, 2]},
+    {'$split': [{'$substrCP': ['$Tags', 1, {'$subtract': [{'$strLenCP': '$Tags'}, 2]}]}, '><']},
+    []
+]}
+
+
+def get_view_id(kind, tag=None):
+    """
+    :param kind: one of the keys of VIEW_KINDS
+    :param tag: tag name (None for the view over all questions)
+    :return: _id of the view document
+    """
+    return {'kind': kind, 'tag': ALL_TAGS if tag is None else tag}
+
+
+def _get_now():
+    return datetime.now().strftime('%Y-%m-%dT%H:%M:%S.') + datetime.now().strftime('%f')[:3]
+
+
+class HotQuestionViews:
+    """
+    Class that maintains materialized views of the top TOP_N questions by score, view count, and recent activity -
+    both over all questions and per tag. Each view is a single document in the HotQuestions collection of the form
+    {'_id': {'kind': ..., 'tag': ...}, 'questions': [question summaries in rank order], 'refreshed': ...} so that a
+    listing is read with a single query. The views are built with aggregations that $merge into the collection.
+    """
+
+    def __init__(self, db):
+        """
+        Initializes an instance of this class.
+        :param db: pymongo database
+        """
+        self.db = db
+        self.posts = db['Posts']
+        self.views = db[VIEWS_COLLECTION]
+        self.metadata = db[METADATA_COLLECTION]
+
+    def create_indexes(self):
+        """
+        Creates the indexes that make the views over all questions an index walk of TOP_N entries (the activity index
+        also finds the questions that an incremental refresh has to read).
+        """
+        for kind, field in VIEW_KINDS.items():
+            self.posts.create_index(
+                [('PostTypeId', ASCENDING), (field, DESCENDING)],
+                name='post_hot_{}_index'.format(kind)
+            )
+
+    def _refresh_overall(self, refreshed):
+        """
+        Refreshes the views over all questions. Each one is a sort on an index followed by a limit, so they are cheap
+        enough to be refreshed in full every time.
+        :param refreshed: timestamp to record in the view documents
+        """
+        for kind, field in VIEW_KINDS.items():
+            pipeline = [
+                {'$match': {'PostTypeId': QUESTION_TYPE_ID}},
+                {'$sort': {field: -1}},
+                {'$limit': TOP_N},
+                {'$group': {'_id': get_view_id(kind), 'questions': {'$push': self._get_summary()}}},
+                {'$set': {'refreshed': {'$literal': refreshed}}},
+                {'$merge': {'into': VIEWS_COLLECTION, 'on': '_id', 'whenMatched': 'replace'}}
+            ]
+            self.posts.aggregate(pipeline)
+
+    def _get_view_question_ids(self, kind, tags):
+        """
+        :param kind: one of the keys of VIEW_KINDS
+        :param tags: list of tag names
+        :return: set of the _id values of the questions currently in the views of the tags
+        """
+        query = {'_id': {'$in': [get_view_id(kind, tag) for tag in tags]}}
+        return {question['_id'] for view in self.views.find(query) for question in view['questions']}
+
+    def _refresh_tags(self, refreshed, tags=None, question_ids=None):
+        """
+        Refreshes the per tag views in a single pass over the questions per kind. Each question is unwound by its tags
+        and the TOP_N questions of every tag are kept with $topN (MongoDB 5.2+). An incremental refresh only reads the
+        questions that have had activity since the last refresh and the questions already in the views of their tags
+        (by _id) - a question that has had no activity has not moved, so the new top questions of a tag are among
+        those.
+        :param refreshed: timestamp to record in the view documents
+        :param tags: list of tags to refresh the views of (None for every tag)
+        :param question_ids: list of the _id values of the questions that have had activity (only used with tags)
+        """
+        for kind, field in VIEW_KINDS.items():
+            match = {'PostTypeId': QUESTION_TYPE_ID}
+            if tags is not None:
+                match['_id'] = {'$in': list(set(question_ids) | self._get_view_question_ids(kind, tags))}
+            pipeline = [
+                {'$match': match},
+                {'$project': dict({name: 1 for name in SUMMARY_FIELDS}, tag_list=TAG_LIST_EXPRESSION)},
+                {'$unwind': '$tag_list'}
+            ]
+            if tags is not None:
+                pipeline.append({'$match': {'tag_list': {'$in': tags}}})
+            pipeline += [
+                {'$group': {
+                    '_id': '$tag_list',
+                    'questions': {'$topN': {'n': TOP_N, 'sortBy': {field: -1}, 'output': self._get_summary()}}
+                }},
+                {'$project': {
+                    '_id': {'kind': kind, 'tag': '$_id'},
+                    'questions': 1,
+                    'refreshed': {'$literal': refreshed}
+                }},
+                {'$merge': {'into': VIEWS_COLLECTION, 'on': '_id', 'whenMatched': 'replace'}}
+            ]
+            self.posts.aggregate(pipeline, allowDiskUse=True)
+
+    @staticmethod
+    def _get_summary():
+        summary = {field: '$' + field for field in SUMMARY_FIELDS}
+        summary['_id'] = '$_id'
+        return summary
+
+    def _get_touched_questions(self, since):
+        """
+        Gets the questions whose LastActivityDate is at or after since (a range scan of the activity index).
+        :param since: timestamp of the last refresh
+        :return: tuple of list, list corresponding to the _id values of the questions and their tags
+        """
+        pipeline = [
+            {'$match': {'PostTypeId': QUESTION_TYPE_ID, 'LastActivityDate': {'$gte': since}}},
+            {'$project': {'tag_list': TAG_LIST_EXPRESSION}},
+            {'$unwind': '$tag_list'},
+            {'$group': {'_id': '$tag_list', 'question_ids': {'$addToSet': '$_id'}}}
+        ]
+        question_ids, tags = set(), []
+        for res in self.posts.aggregate(pipeline):
+            tags.append(res['_id'])
+            question_ids.update(res['question_ids'])
+        return list(question_ids), tags
+
+    def get_last_refresh(self):
+        """
+        :return: timestamp of the start of the last refresh (or None if the views have never been refreshed)
+        """
+        res = self.metadata.find_one({'_id': REFRESHED_AT_KEY})
+        return None if res is None else res['value']
+
+    def refresh(self, full=False):
+        """
+        Refreshes the views. The views over all questions are always refreshed. A full refresh rebuilds the view of
+        every tag, otherwise only the views of the tags of questions that have had activity (new answers or votes)
+        since the last refresh are rebuilt - view counts alone do not count as activity, so the per tag views by view
+        count only pick those up on a full refresh.
+        :param full: True to rebuild every view (always the case if the views have never been refreshed)
+        :return: list of the tags that were refreshed (None if every tag was refreshed)
+        """
+        since = self.get_last_refresh()
+        refreshed = _get_now()
+        self._refresh_overall(refreshed)
+        if full or since is None:
+            tags = None
+            self._refresh_tags(refreshed)
+        else:
+            question_ids, tags = self._get_touched_questions(since)
+            if tags:
+                self._refresh_tags(refreshed, tags, question_ids)
+        self.metadata.update_one({'_id': REFRESHED_AT_KEY}, {'$set': {'value': refreshed}}, upsert=True)
+        return tags
+
+    def get_view(self, kind, tag=None):
+        """
+        :param kind: one of the keys of VIEW_KINDS
+        :param tag: tag name (None for the view over all questions)
+        :return: list of dicts corresponding to the summaries of the top questions of the view (empty if the view
+                 does not exist)
+        """
+        res = self.views.find_one({'_id': get_view_id(kind, tag)})
+        return [] if res is None else res['questions']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refreshes the hot question views on a schedule')
+    parser.add_argument('port', type=int, help='port of the MongoDB server')
+    parser.add_argument('--interval', type=float, default=DEFAULT_REFRESH_INTERVAL,
+                        help='seconds between incremental refreshes')
+    parser.add_argument('--full-every', type=int, default=DEFAULT_FULL_REFRESH_EVERY,
+                        help='number of refreshes between full refreshes')
+    parser.add_argument('--once', action='store_true', help='do a single full refresh and exit')
+    args = parser.parse_args()
+    client = MongoClient(port=args.port)
+    hot_views = HotQuestionViews(client[DB_NAME])
+    hot_views.create_indexes()
+    num_refreshes = 0
+    try:
+        while True:
+            hot_views.refresh(full=args.once or num_refreshes % args.full_every == 0)
+            num_refreshes += 1
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    client.close()
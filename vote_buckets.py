@@ -0,0 +1,271 @@
+import argparse
+from pymongo import MongoClient, ReturnDocument, UpdateOne, collation, ASCENDING, DESCENDING
+
+DB_NAME = '291db'
+BUCKETS_COLLECTION = 'VoteBuckets'
+USER_VOTE_COUNTS_COLLECTION = 'UserVoteCounts'
+POST_VOTE_COUNTS_COLLECTION = 'PostVoteCounts'
+METADATA_COLLECTION = 'Metadata'
+# collection that archive.py moves the votes of inactive threads to (their Ids stay taken)
+ARCHIVED_VOTES_COLLECTION = 'ArchivedVotes'
+VOTE_LAYOUT_KEY = 'vote_layout'
+VOTE_SEQ_KEY = 'vote_seq'
+FLAT_LAYOUT = 'flat'
+BUCKETED_LAYOUT = 'bucketed'
+# max number of votes stored in a single bucket document
+BUCKET_SIZE = 200
+MIGRATION_BATCH_SIZE = 100
+# aggregation stages that turn bucket documents back into flat vote documents (as stored in the Votes collection)
+FLAT_VOTES_PIPELINE = [
+    {'$unwind': '$votes'},
+    {'$replaceRoot': {'newRoot': {'$mergeObjects': [{'PostId': '$PostId'}, '$votes']}}}
+]
+# collation of the Id indexes (queries on Id must specify it in order to use them)
+ID_COLLATION = collation.Collation('en_US', numericOrdering=True)
+
+
+def get_vote_layout(db):
+    """
+    :param db: pymongo database
+    :return: the layout that the votes of the database are stored in - FLAT_LAYOUT (one document per vote in the Votes
+             collection) unless they have been migrated to BUCKETED_LAYOUT with VoteBucketStore.migrate
+    """
+    res = db[METADATA_COLLECTION].find_one({'_id': VOTE_LAYOUT_KEY})
+    return FLAT_LAYOUT if res is None else res['value']
+
+
+def pack_buckets(votes):
+    """
+    Packs votes into full bucket documents (see VoteBucketStore). The buckets of each post are numbered from 0.
+    :param votes: list of dicts corresponding to the votes (in the same form as the documents of the Votes collection)
+    :return: list of dicts corresponding to the bucket documents holding the votes
+    """
+    buckets = []
+    open_buckets = {}
+    for vote in votes:
+        bucket = open_buckets.get(vote['PostId'])
+        if bucket is None or bucket['n'] == BUCKET_SIZE:
+            seq = 0 if bucket is None else bucket['seq'] + 1
+            bucket = {'PostId': vote['PostId'], 'seq': seq, 'n': 0, 'votes': []}
+            open_buckets[vote['PostId']] = bucket
+            buckets.append(bucket)
+        bucket['votes'].append({key: value for key, value in vote.items() if key not in ['PostId', '_id']})
+        bucket['n'] += 1
+    return buckets
+
+
+class VoteBucketStore:
+    """
+    Class that stores votes in bucket documents instead of one document per vote. The votes on a post are grouped into
+    documents of the form {'PostId': ..., 'seq': bucket number, 'n': number of votes in the bucket, 'votes': [votes
+    without their PostId]} holding at most BUCKET_SIZE votes each. The number of votes on each post is kept in a counter
+    collection ({'_id': PostId, 'Count': ...}) and a new vote atomically increments it to get its position, which
+    determines the bucket it goes in (position // BUCKET_SIZE) - so concurrent writers always agree on the bucket and
+    a post never has more than one bucket that is filling up. The number of votes registered by each user is kept in a
+    rollup collection ({'_id': UserId, 'Count': ...}) so it can be read with a single lookup. New vote Ids come from an
+    atomically incremented sequence in the Metadata collection.
+    """
+
+    def __init__(self, db):
+        """
+        Initializes an instance of this class.
+        :param db: pymongo database
+        """
+        self.db = db
+        self.buckets = db[BUCKETS_COLLECTION]
+        self.user_vote_counts = db[USER_VOTE_COUNTS_COLLECTION]
+        self.post_vote_counts = db[POST_VOTE_COUNTS_COLLECTION]
+        self.metadata = db[METADATA_COLLECTION]
+        self.bucket_postid_seq_index = 'bucket_postid_seq_index'
+        self.bucket_postid_userid_index = 'bucket_postid_userid_index'
+
+    def create_indexes(self):
+        """
+        Creates the indexes used to find a bucket of a post and to check whether a user has voted on a post. The
+        (PostId, seq) index is unique, so when two writers upsert the same new bucket at once only one of them inserts
+        it and the server retries the other one as an update.
+        """
+        self.buckets.create_index(
+            [('PostId', ASCENDING), ('seq', ASCENDING)],
+            unique=True,
+            name=self.bucket_postid_seq_index
+        )
+        self.buckets.create_index(
+            [('PostId', ASCENDING), ('votes.UserId', ASCENDING)],
+            name=self.bucket_postid_userid_index
+        )
+
+    def _increment_seq(self):
+        res = self.metadata.find_one_and_update(
+            {'_id': VOTE_SEQ_KEY},
+            {'$inc': {'seq': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return res['seq']
+
+    def get_new_id(self, min_id=0):
+        """
+        Gets a new vote Id from the sequence. If the sequence is behind min_id it is first moved up to min_id (with
+        $max, so concurrent callers never move it back) and incremented again.
+        :param min_id: int that the new Id must be greater than (e.g. the max archived vote Id)
+        :return: a new unique vote Id value (as a string)
+        """
+        seq = self._increment_seq()
+        if seq <= min_id:
+            self.metadata.update_one({'_id': VOTE_SEQ_KEY}, {'$max': {'seq': min_id}})
+            seq = self._increment_seq()
+        return str(seq)
+
+    def _get_max_bucketed_id(self):
+        """
+        :return: int corresponding to the max Id of the votes in the buckets (0 if there are none)
+        """
+        pipeline = [
+            {'$unwind': '$votes'},
+            {'$group': {'_id': None, 'max_id': {'$max': {'$toLong': '$votes.Id'}}}}
+        ]
+        res = list(self.buckets.aggregate(pipeline, allowDiskUse=True))
+        return 0 if len(res) == 0 or res[0]['max_id'] is None else int(res[0]['max_id'])
+
+    def _get_max_archived_id(self):
+        """
+        :return: int corresponding to the max Id of the archived votes (0 if there are none)
+        """
+        res = self.db[ARCHIVED_VOTES_COLLECTION].find_one(sort=[('Id', DESCENDING)], collation=ID_COLLATION)
+        return 0 if res is None else int(res['Id'])
+
+    def allocate_bucket(self, post_id):
+        """
+        Increments the vote counter of a post to get the position of a new vote on it.
+        :param post_id: PostId of the vote
+        :return: int corresponding to the seq of the bucket that the vote goes in
+        """
+        res = self.post_vote_counts.find_one_and_update(
+            {'_id': post_id},
+            {'$inc': {'Count': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return (res['Count'] - 1) // BUCKET_SIZE
+
+    def get_bucket_update(self, vote, seq):
+        """
+        Gets the filter and update that add a vote to a bucket of its post (creating the bucket if it does not exist
+        yet).
+        :param vote: dict corresponding to the vote (in the same form as a document of the Votes collection)
+        :param seq: seq of the bucket (see allocate_bucket)
+        :return: tuple of dict, dict corresponding to the filter and update (to be sent with upsert=True)
+        """
+        entry = {key: value for key, value in vote.items() if key != 'PostId'}
+        return {'PostId': vote['PostId'], 'seq': seq}, {'$push': {'votes': entry}, '$inc': {'n': 1}}
+
+    def get_user_count_update(self, user_id):
+        """
+        :param user_id: UserId of the vote
+        :return: tuple of dict, dict corresponding to the filter and update (to be sent with upsert=True) that
+                 increment the number of votes registered by the user
+        """
+        return {'_id': str(user_id)}, {'$inc': {'Count': 1}}
+
+    def has_voted(self, post_id, user_id):
+        """
+        :param post_id: Id of the post
+        :param user_id: user id
+        :return: True if the user has voted on the post, False otherwise
+        """
+        return self.buckets.find_one({'PostId': post_id, 'votes.UserId': str(user_id)}, {'_id': 1}) is not None
+
+    def get_num_votes(self, user_id):
+        """
+        :param user_id: user id
+        :return: int corresponding to the number of votes registered by the user
+        """
+        res = self.user_vote_counts.find_one({'_id': str(user_id)})
+        return 0 if res is None else res['Count']
+
+    def insert_votes(self, votes):
+        """
+        Inserts the votes on posts that have no buckets (e.g. the votes of a thread restored from the archive) as full
+        buckets and sets the vote counters of the posts.
+        :param votes: list of dicts corresponding to the votes (in the same form as the documents of the Votes
+                      collection)
+        """
+        buckets = pack_buckets(votes)
+        if not buckets:
+            return
+        self.buckets.insert_many(buckets, ordered=False)
+        post_counts = {}
+        for bucket in buckets:
+            post_counts[bucket['PostId']] = post_counts.get(bucket['PostId'], 0) + bucket['n']
+        self.post_vote_counts.bulk_write(
+            [UpdateOne({'_id': post_id}, {'$set': {'Count': count}}, upsert=True)
+             for post_id, count in post_counts.items()],
+            ordered=False
+        )
+
+    def migrate(self, votes, drop_flat=False):
+        """
+        Migrates the votes in the (flat) Votes collection to the bucketed layout. The votes are streamed in PostId
+        order and packed into full buckets (counting the votes on each post as they go), the per-user rollup is computed
+        with a single $group that is $merge'd into its collection, the vote Id sequence is moved up to the max Id of the
+        flat, archived, and previously bucketed votes (so no Id that was ever handed out is reused), and the layout is
+        recorded in the Metadata collection (which is what makes DBManager use the bucketed layout). Any existing
+        buckets are replaced so the migration can be rerun.
+        :param votes: pymongo collection containing the flat votes
+        :param drop_flat: True to drop the flat Votes collection once the migration is complete
+        :return: int corresponding to the number of votes migrated
+        """
+        max_id = max(self._get_max_bucketed_id(), self._get_max_archived_id())
+        self.buckets.drop()
+        self.user_vote_counts.drop()
+        self.post_vote_counts.drop()
+        num_votes = 0
+        batch = []
+        post_counts = []
+        bucket = None
+        for vote in votes.find({}, {'_id': 0}).sort([('PostId', ASCENDING)]):
+            num_votes += 1
+            max_id = max(max_id, int(vote['Id']))
+            if bucket is None or bucket['PostId'] != vote['PostId']:
+                bucket = {'PostId': vote['PostId'], 'seq': 0, 'n': 0, 'votes': []}
+                batch.append(bucket)
+                post_counts.append({'_id': vote['PostId'], 'Count': 0})
+            elif bucket['n'] == BUCKET_SIZE:
+                bucket = {'PostId': vote['PostId'], 'seq': bucket['seq'] + 1, 'n': 0, 'votes': []}
+                batch.append(bucket)
+            bucket['votes'].append({key: value for key, value in vote.items() if key != 'PostId'})
+            bucket['n'] += 1
+            post_counts[-1]['Count'] += 1
+            if len(batch) > MIGRATION_BATCH_SIZE:
+                # the last bucket (and the count of its post) may still be filling up so it is held back
+                self.buckets.insert_many(batch[:-1], ordered=False)
+                if len(post_counts) > 1:
+                    self.post_vote_counts.insert_many(post_counts[:-1], ordered=False)
+                batch, post_counts = batch[-1:], post_counts[-1:]
+        if batch:
+            self.buckets.insert_many(batch, ordered=False)
+            self.post_vote_counts.insert_many(post_counts, ordered=False)
+        user_counts_pipeline = [
+            {'$match': {'UserId': {'$exists': True}}},
+            {'$group': {'_id': '$UserId', 'Count': {'$sum': 1}}},
+            {'$merge': {'into': USER_VOTE_COUNTS_COLLECTION, 'whenMatched': 'replace'}}
+        ]
+        votes.aggregate(user_counts_pipeline, allowDiskUse=True)
+        self.create_indexes()
+        self.metadata.update_one({'_id': VOTE_SEQ_KEY}, {'$max': {'seq': max_id}}, upsert=True)
+        self.metadata.update_one({'_id': VOTE_LAYOUT_KEY}, {'$set': {'value': BUCKETED_LAYOUT}}, upsert=True)
+        if drop_flat:
+            votes.drop()
+        return num_votes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrates the flat Votes collection to the bucketed vote layout')
+    parser.add_argument('port', type=int, help='port of the MongoDB server')
+    parser.add_argument('--drop-flat', action='store_true', help='drop the flat Votes collection after migrating')
+    args = parser.parse_args()
+    client = MongoClient(port=args.port)
+    db = client[DB_NAME]
+    VoteBucketStore(db).migrate(db['Votes'], drop_flat=args.drop_flat)
+    client.close()
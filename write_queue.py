@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pymongo.errors import BulkWriteError
+
+FLUSH_INTERVAL = 0.01
+WRITE_BATCH_SIZE = 500
+# markers that can be put on the queue in place of a write
+_FLUSH = 'flush'
+_CLOSE = 'close'
+
+
+class WriteQueue:
+    """
+    Class that group-commits writes. Writes submitted by any number of threads are gathered by a background thread
+    into batches (flushed once batch_size writes are pending or flush_interval seconds after the first pending write)
+    and each batch is sent as one bulk_write per collection (preserving the order the writes were submitted in). Every
+    submitted write gets a concurrent.futures.Future that resolves with the BulkWriteResult of its batch once the batch
+    is acknowledged (or fails with the error of that write).
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, batch_size=WRITE_BATCH_SIZE, ordered=True, write_concern=None):
+        """
+        Initializes an instance of this class and starts the background thread.
+        :param flush_interval: max number of seconds that a write waits for its batch to fill up
+        :param batch_size: max number of writes per batch
+        :param ordered: True to send ordered bulk writes (the writes of a collection stop at the first error), False to
+                        send unordered bulk writes (the server may apply them in any order and continues past errors)
+        :param write_concern: pymongo.write_concern.WriteConcern to send the batches with (None uses the collection's
+                              write concern)
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.write_concern = write_concern
+        self.num_batches = 0
+        self.num_writes = 0
+        self._pending = queue.Queue()
+        self._closed = False
+        # makes checking whether the queue is closed and queueing a write (or the close marker) a single step
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, collection, request):
+        """
+        Queues a write. Raises a RuntimeError if the queue has been closed.
+        :param collection: pymongo collection to write to
+        :param request: pymongo write operation (InsertOne, UpdateOne, etc.)
+        :return: concurrent.futures.Future that resolves once the write's batch has been acknowledged
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError('cannot submit a write to a closed write queue')
+            self._pending.put((collection, request, future))
+        return future
+
+    def flush(self):
+        """
+        Blocks until every write submitted before the call has been acknowledged.
+        """
+        future = Future()
+        with self._close_lock:
+            closed = self._closed
+            if not closed:
+                self._pending.put((_FLUSH, None, future))
+        if closed:
+            # the background thread commits every queued write before it exits
+            self._thread.join()
+        else:
+            future.result()
+
+    def close(self):
+        """
+        Flushes every pending write and stops the background thread. Writes submitted after close has been called are
+        rejected, so every write that was queued before the close marker is committed.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending.put((_CLOSE, None, None))
+        self._thread.join()
+
+    def _run(self):
+        """
+        Gathers writes into batches and commits them until the queue is closed.
+        """
+        while True:
+            batch = []
+            markers = []
+            item = self._pending.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item[0] in [_FLUSH, _CLOSE]:
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._pending.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # an error outside of the bulk writes themselves must not kill the background thread (which would leave
+                # every later write waiting forever), so it fails the writes of the batch that are still unresolved
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            for marker, _, future in markers:
+                if marker == _CLOSE:
+                    return
+                future.set_result(None)
+
+    def _commit(self, batch):
+        """
+        Sends a batch as one bulk_write per collection and resolves the futures of the writes in it.
+        :param batch: list of (collection, request, future) tuples in the order they were submitted
+        """
+        if len(batch) == 0:
+            return
+        by_collection = {}
+        for collection, request, future in batch:
+            by_collection.setdefault(collection.full_name, (collection, []))[1].append((request, future))
+        for collection, writes in by_collection.values():
+            try:
+                if self.write_concern is not None:
+                    collection = collection.with_options(write_concern=self.write_concern)
+                result = collection.bulk_write([request for request, _ in writes], ordered=self.ordered)
+            except BulkWriteError as e:
+                self._resolve_partial(writes, e)
+            except Exception as e:
+                for _, future in writes:
+                    future.set_exception(e)
+            else:
+                for _, future in writes:
+                    future.set_result(result)
+        self.num_batches += 1
+        self.num_writes += len(batch)
+
+    def _resolve_partial(self, writes, error):
+        """
+        Resolves the futures of a bulk write that partially failed. The writes that errored (and, for ordered bulk
+        writes, the writes after the first error since they were never attempted) fail with the error and the rest
+        succeed with the (partial) result. If the write concern was not satisfied every write fails, since none of them
+        is known to be durable.
+        :param writes: list of (request, future) tuples of the bulk write
+        :param error: pymongo.errors.BulkWriteError raised by the bulk write
+        """
+        if error.details.get('writeConcernErrors'):
+            for _, future in writes:
+                future.set_exception(error)
+            return
+        failed = {write_error['index'] for write_error in error.details.get('writeErrors', [])}
+        first_failed = min(failed) if failed else len(writes)
+        for i, (_, future) in enumerate(writes):
+            if i in failed or (self.ordered and i > first_failed):
+                future.set_exception(error)
+            else:
+                future.set_result(error.details)